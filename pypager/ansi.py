@@ -0,0 +1,580 @@
+"""
+Tokenizer for terminal output: ANSI (SGR) escape sequences and man page style
+backspace overstrikes.
+"""
+import re
+import sys
+from array import array
+from bisect import bisect_right
+from itertools import groupby
+from operator import itemgetter
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from prompt_toolkit.formatted_text import StyleAndTextTuples
+from prompt_toolkit.output.vt100 import BG_ANSI_COLORS, FG_ANSI_COLORS
+from prompt_toolkit.output.vt100 import _256_colors as _256_colors_table
+from prompt_toolkit.styles import DEFAULT_ATTRS, Attrs
+from prompt_toolkit.utils import get_cwidth
+
+__all__ = [
+    "AnsiTokenizer",
+    "StyleTable",
+    "StyledLine",
+    "default_style_table",
+    "select_graphic_rendition",
+    "get_attrs_style",
+    "get_width",
+    "get_plain_text",
+]
+
+
+# Any sequence that needs special handling: CSI sequences (only SGR sequences,
+# ending in 'm' are interpreted, all others are dropped), two-character
+# escape sequences, stray escape characters and backspaces.
+_SEQUENCE_RE = re.compile(
+    r"(?:\x1b\[|\x9b)(?P<params>[\x30-\x3f]*)[\x20-\x2f]*(?P<final>[\x40-\x7e])"
+    r"|\x1b[^\[]"
+    r"|\x1b\[?|\x9b"
+    r"|(?P<backspaces>\x08+)"
+)
+
+# The first characters of the sequences of `_SEQUENCE_RE`. (Searching for
+# these is much faster than searching for the sequences.)
+_SEQUENCE_START_RE = re.compile(r"[\x1b\x9b\x08]")
+
+# An escape sequence that is cut off at the end of a chunk.
+_INCOMPLETE_RE = re.compile(r"(?:\x1b\[|\x9b)[\x20-\x3f]*|\x1b")
+
+# Don't keep incomplete sequences that are longer than this. (It's garbage.)
+_MAX_INCOMPLETE_LENGTH = 256
+
+_SGR_PARAMS_RE = re.compile(r"[0-9;]*")
+
+# The sequences of `_SEQUENCE_RE` other than backspaces, for removing them
+# from many lines at once. (An escape character doesn't take a newline.)
+_STRIP_RE = re.compile(
+    r"\x1b(?:\[[\x30-\x3f]*[\x20-\x2f]*[\x40-\x7e]|[^\[\n]|\[?)"
+    r"|\x9b(?:[\x30-\x3f]*[\x20-\x2f]*[\x40-\x7e])?"
+)
+
+# Control characters, other than tabs. (Displayed like ^X.)
+_CONTROL_RE = re.compile(r"[\x00-\x08\x0a-\x1f\x7f]")
+
+if sys.version_info >= (3, 7):
+    _is_ascii = str.isascii
+else:
+
+    def _is_ascii(text: str) -> bool:
+        "(Fallback for Python 3.6. Encoding ASCII text is a plain copy.)"
+        return len(text.encode("utf-8", "surrogatepass")) == len(text)
+
+
+def get_width(text: str, tabstop: int = 4) -> int:
+    """
+    Return the number of columns that this text takes on the screen, with tabs
+    expanded and control characters displayed like ^X.
+    """
+    if "\t" in text:
+        text = text.expandtabs(tabstop)
+
+    controls = len(_CONTROL_RE.findall(text))
+    if _is_ascii(text):
+        return len(text) + controls
+
+    # (Not `get_cwidth(text)`, which would keep long strings in its cache.)
+    return sum(map(get_cwidth, text)) + 2 * controls
+
+
+def get_plain_text(data: str) -> str:
+    """
+    Return the text that is displayed for these lines of terminal output,
+    without the styles. (The text of the fragments that the tokenizer returns
+    for each line.)
+    """
+    if "\b" in data:
+        tokenizer = AnsiTokenizer()
+        return "\n".join(
+            "".join(fragment[1] for fragment in tokenizer.feed(line, final=True))
+            for line in data.split("\n")
+        )
+
+    if "\x1b" in data or "\x9b" in data:
+        return _STRIP_RE.sub("", data)
+    return data
+
+
+class StyleTable:
+    """
+    Interning table for the style strings that we create for `Attrs`.
+
+    Colored output usually uses only a few dozen distinct attribute
+    combinations. Every combination gets an ID and one shared style string, so
+    that fragments share string objects instead of creating new ones.
+
+    `hits` and `misses` count the lookups that were answered from the table
+    and the ones that created a new entry.
+    """
+
+    # Don't cache more SGR transitions than this. (E.g. true color gradients.)
+    max_transitions = 4096
+
+    def __init__(self) -> None:
+        #: Mapping from style ID to style string.
+        self.styles: List[str] = []
+
+        self._ids: Dict[Tuple[Attrs, str], int] = {}
+        self._style_ids: Dict[str, int] = {}
+        self._transitions: Dict[Tuple[Attrs, str], Attrs] = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.styles)
+
+    def __repr__(self) -> str:
+        return "StyleTable(styles=%i, hits=%i, misses=%i)" % (
+            len(self.styles),
+            self.hits,
+            self.misses,
+        )
+
+    def get_id(self, attrs: Attrs, backspace_style: str = "") -> int:
+        """
+        Return the style ID for these `Attrs` and backspace style.
+        """
+        key = (attrs, backspace_style)
+        try:
+            style_id = self._ids[key]
+        except KeyError:
+            self.misses += 1
+            style = get_attrs_style(attrs) + " " + backspace_style
+            style_id = self.get_style_id(style)
+            self._ids[key] = style_id
+        else:
+            self.hits += 1
+        return style_id
+
+    def get_style_id(self, style: str) -> int:
+        """
+        Return the style ID for this style string. (Any style string can be
+        interned, not only the ones that are created for `Attrs`.)
+        """
+        try:
+            return self._style_ids[style]
+        except KeyError:
+            style_id = len(self.styles)
+            self.styles.append(style)
+            self._style_ids[style] = style_id
+            return style_id
+
+    def get_style(self, attrs: Attrs, backspace_style: str = "") -> str:
+        """
+        Return the (shared) style string for these `Attrs` and backspace style.
+        """
+        return self.styles[self.get_id(attrs, backspace_style)]
+
+    def apply_sgr(self, attrs: Attrs, params: str) -> Attrs:
+        """
+        Apply the parameters of an SGR escape sequence (like "1;31") to
+        `attrs`. The result is cached, because the same sequences are used
+        over and over again.
+        """
+        key = (attrs, params)
+        try:
+            return self._transitions[key]
+        except KeyError:
+            result = select_graphic_rendition(
+                attrs, [min(int(p or 0), 9999) for p in params.split(";")]
+            )
+            if len(self._transitions) >= self.max_transitions:
+                self._transitions.clear()
+            self._transitions[key] = result
+            return result
+
+
+#: Style table that is shared by all tokenizers, unless another one is given.
+default_style_table = StyleTable()
+
+
+class StyledLine:
+    """
+    Compact representation of a line of styled text: the text as one string,
+    and for each run of text with the same style, the offset where it ends and
+    its style ID in the :class:`.StyleTable`.
+
+    This takes a fraction of the memory of a list of fragments. The fragments
+    are only created again when the line is displayed. (Only the visible part
+    of a long line, see :meth:`get_fragments`.)
+
+    The width of the line on the screen is calculated when it's created.
+    """
+
+    __slots__ = ("text", "run_ends", "run_styles", "width")
+
+    def __init__(
+        self, text: str, run_ends: "array[int]", run_styles: "array[int]"
+    ) -> None:
+        self.text = text
+        self.run_ends = run_ends
+        self.run_styles = run_styles
+        self.width = get_width(text)
+
+    @property
+    def simple(self) -> bool:
+        "True when each character takes one column. (Column = index.)"
+        return _is_ascii(self.text) and self.width == len(self.text)
+
+    def get_column(self, index: int) -> int:
+        "Return the column where the character at this index is displayed."
+        if self.simple:
+            return index
+        return get_width(self.text[:index])
+
+    def get_index(self, column: int) -> int:
+        "Return the index of the character that is displayed at this column."
+        if self.simple:
+            return min(column, len(self.text))
+
+        # (Binary search. The width of the text before it grows with the index.)
+        low, high = 0, len(self.text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if get_width(self.text[:middle]) > column:
+                high = middle - 1
+            else:
+                low = middle
+        return low
+
+    def __repr__(self) -> str:
+        return "StyledLine(%r, runs=%i)" % (self.text, len(self.run_ends))
+
+    @classmethod
+    def from_fragments(
+        cls, fragments: StyleAndTextTuples, style_table: Optional[StyleTable] = None
+    ) -> "StyledLine":
+        """
+        Create a :class:`.StyledLine` from a list of fragments. (Adjacent
+        fragments with the same style are merged. Mouse handlers are dropped.)
+        """
+        if style_table is None:
+            style_table = default_style_table
+
+        run_ends = array("I")
+        run_styles = array("I")
+        parts = []
+        length = 0
+
+        for fragment in fragments:
+            text = fragment[1]
+            if text:
+                length += len(text)
+                style_id = style_table.get_style_id(fragment[0])
+
+                if run_styles and run_styles[-1] == style_id:
+                    run_ends[-1] = length
+                else:
+                    run_ends.append(length)
+                    run_styles.append(style_id)
+                parts.append(text)
+
+        return cls("".join(parts), run_ends, run_styles)
+
+    def get_fragments(
+        self,
+        style_table: Optional[StyleTable] = None,
+        start: int = 0,
+        end: Optional[int] = None,
+    ) -> StyleAndTextTuples:
+        """
+        Turn this line, or the characters from `start` to `end`, into a list of
+        fragments.
+        """
+        if style_table is None:
+            style_table = default_style_table
+
+        styles = style_table.styles
+        text = self.text
+        run_ends = self.run_ends
+        if end is None or end > len(text):
+            end = len(text)
+
+        result: StyleAndTextTuples = []
+        i = bisect_right(run_ends, start)
+
+        while start < end and i < len(run_ends):
+            run_end = min(run_ends[i], end)
+            result.append((styles[self.run_styles[i]], text[start:run_end]))
+            start = run_end
+            i += 1
+
+        return result
+
+
+class AnsiTokenizer:
+    """
+    Turn terminal output into style/text fragments.
+
+    The input is processed a block at a time: plain text in between escape
+    sequences is emitted as one fragment, so there is one tuple per styled span
+    instead of one per character.
+
+    A \\b with any character before makes the next character standout.
+    A \\b with an underscore before makes the next character emphasized.
+
+    :param style_table: :class:`.StyleTable` for interning the style strings.
+    :param attrs: The `Attrs` that are active at the start of the input.
+    """
+
+    def __init__(
+        self, style_table: Optional[StyleTable] = None, attrs: Attrs = DEFAULT_ATTRS
+    ) -> None:
+        if style_table is None:
+            style_table = default_style_table
+
+        self.style_table = style_table
+        self.attrs = attrs
+        self._style = self.style_table.get_style(attrs)
+
+        # Style created by backspace characters. Applies to the next character.
+        self._backspace_style = ""
+
+        # Escape sequence that was incomplete at the end of the previous chunk.
+        self._pending = ""
+
+        # The last character of the previous chunk. We don't return it yet,
+        # because the next chunk could start with a \b.
+        self._held: Optional[Tuple[str, str]] = None
+
+    def feed(self, data: str, final: bool = False) -> StyleAndTextTuples:
+        """
+        Tokenize the next block of input. Return a list of fragments.
+
+        :param final: True when this is the last block of the input. (Flush
+            everything that we were holding back.)
+        """
+        text = self._pending + data
+        self._pending = ""
+
+        if not final:
+            index = max(text.rfind("\x1b"), text.rfind("\x9b"))
+            if index >= 0 and len(text) - index < _MAX_INCOMPLETE_LENGTH:
+                if _INCOMPLETE_RE.fullmatch(text, index):
+                    self._pending = text[index:]
+                    text = text[:index]
+
+        fragments: List[Tuple[str, str]] = []
+        if self._held:
+            fragments.append(self._held)
+            self._held = None
+
+        pos = 0
+        search_start = _SEQUENCE_START_RE.search
+        match_sequence = _SEQUENCE_RE.match
+        start_match = search_start(text)
+
+        if start_match is None:
+            # Fast path: no escape sequences or backspaces, all text is in the
+            # current style.
+            if text:
+                self._add_text(fragments, text)
+            pos = len(text)
+
+        while start_match is not None:
+            start = start_match.start()
+            m = match_sequence(text, start)
+            assert m is not None  # (Any of these characters starts a match.)
+
+            if start > pos:
+                self._add_text(fragments, text[pos:start])
+            pos = m.end()
+
+            backspaces = m.group("backspaces")
+            if backspaces:
+                for _ in backspaces:
+                    self._backspace(fragments)
+            elif m.group("final") == "m":
+                params = m.group("params")
+                if _SGR_PARAMS_RE.fullmatch(params):
+                    self._set_attrs(self.style_table.apply_sgr(self.attrs, params))
+
+            start_match = search_start(text, pos)
+
+        if pos < len(text):
+            self._add_text(fragments, text[pos:])
+
+        # Hold back the last character.
+        if not final and fragments:
+            style, last = fragments[-1]
+            if len(last) == 1:
+                fragments.pop()
+            else:
+                fragments[-1] = (style, last[:-1])
+            self._held = (style, last[-1])
+
+        # Merge adjacent fragments that have the same style.
+        return [
+            (style, "".join(map(itemgetter(1), group)))
+            for style, group in groupby(fragments, key=itemgetter(0))
+        ]
+
+    def _add_text(self, fragments: List[Tuple[str, str]], text: str) -> None:
+        if self._backspace_style:
+            style = self.style_table.get_style(self.attrs, self._backspace_style)
+            fragments.append((style, text[0]))
+            self._backspace_style = ""
+            text = text[1:]
+
+        if text:
+            fragments.append((self._style, text))
+
+    def _backspace(self, fragments: List[Tuple[str, str]]) -> None:
+        """
+        Handle \\b escape codes from man pages: remove the previous character
+        and set the style for the next one.
+        """
+        if fragments:
+            style, text = fragments[-1]
+            if len(text) == 1:
+                fragments.pop()
+            else:
+                fragments[-1] = (style, text[:-1])
+
+            if text[-1] == "_":
+                self._backspace_style = "class:standout2"
+            else:
+                self._backspace_style = "class:standout"
+
+    def _set_attrs(self, attrs: Attrs) -> None:
+        if attrs != self.attrs:
+            self.attrs = attrs
+            self._style = self.style_table.get_style(attrs)
+
+
+def select_graphic_rendition(attrs: Attrs, params: Sequence[int]) -> Attrs:
+    """
+    Taken a list of graphics attributes and apply changes to `Attrs`. Return
+    the new `Attrs`.
+    """
+    # NOTE: This function is almost literally taken from Pymux.
+    #       if something is wrong, please report there as well!
+    #       https://github.com/jonathanslenders/pymux
+    replace: Dict[str, Union[bool, str, None]] = {}
+
+    if not params:
+        params = [0]
+    else:
+        params = list(params[::-1])
+
+    while params:
+        attr = params.pop()
+
+        if attr in _fg_colors:
+            replace["color"] = _fg_colors[attr]
+        elif attr in _bg_colors:
+            replace["bgcolor"] = _bg_colors[attr]
+        elif attr == 1:
+            replace["bold"] = True
+        elif attr == 3:
+            replace["italic"] = True
+        elif attr == 4:
+            replace["underline"] = True
+        elif attr == 5:
+            replace["blink"] = True
+        elif attr == 6:
+            replace["blink"] = True  # Fast blink.
+        elif attr == 7:
+            replace["reverse"] = True
+        elif attr == 22:
+            replace["bold"] = False
+        elif attr == 23:
+            replace["italic"] = False
+        elif attr == 24:
+            replace["underline"] = False
+        elif attr == 25:
+            replace["blink"] = False
+        elif attr == 27:
+            replace["reverse"] = False
+        elif not attr:
+            replace = {}
+            attrs = DEFAULT_ATTRS
+
+        elif attr in (38, 48) and params:
+            n = params.pop()
+
+            # 256 colors.
+            if n == 5 and params:
+                m = params.pop()
+                if attr == 38:
+                    replace["color"] = _256_colors.get(1024 + m)
+                elif attr == 48:
+                    replace["bgcolor"] = _256_colors.get(1024 + m)
+
+            # True colors.
+            if n == 2:
+                try:
+                    color_str = "%02x%02x%02x" % (
+                        params.pop(),
+                        params.pop(),
+                        params.pop(),
+                    )
+                except IndexError:
+                    pass
+                else:
+                    if attr == 38:
+                        replace["color"] = color_str
+                    elif attr == 48:
+                        replace["bgcolor"] = color_str
+
+    return attrs._replace(**replace)  # type: ignore
+
+
+def get_attrs_style(attrs: Attrs) -> str:
+    """
+    Turn `Attrs` into a style string.
+    """
+    result = []
+
+    if attrs.color:
+        result.append(" fg:{} ".format(_format_color(attrs.color)))
+    if attrs.bgcolor:
+        result.append(" bg:{} ".format(_format_color(attrs.bgcolor)))
+    if attrs.bold:
+        result.append(" bold ")
+    if attrs.italic:
+        result.append(" italic ")
+    if attrs.underline:
+        result.append(" underline ")
+    if attrs.blink:
+        result.append(" blink ")
+    if attrs.reverse:
+        result.append(" reverse ")
+
+    # Recent versions of Groff (used for man pages) use bold and underline
+    # escape sequences rather then backslash-style escape sequences. Apply
+    # the standout/standout2 styles anyway so that we get colored output.
+    # This way, people don't have to set GROFF_NO_SGR=1.
+    if attrs.bold and not attrs.color:
+        result.append(" class:standout ")
+    if attrs.underline and not attrs.color:
+        result.append(" class:standout2 ")
+
+    return "".join(result)
+
+
+def _format_color(color: str) -> str:
+    "ANSI color names are used as-is, 256 and true colors are hex values."
+    if color.startswith("ansi"):
+        return color
+    return "#" + color
+
+
+# Mapping of the ANSI color codes to their names.
+_fg_colors = {v: k for k, v in FG_ANSI_COLORS.items()}
+_bg_colors = {v: k for k, v in BG_ANSI_COLORS.items()}
+
+# Mapping of the escape codes for 256colors to their 'ffffff' value.
+_256_colors = {}
+
+for i, (r, g, b) in enumerate(_256_colors_table.colors):
+    _256_colors[1024 + i] = "%02x%02x%02x" % (r, g, b)
@@ -9,44 +9,146 @@ import sys
 from prompt_toolkit.lexers import PygmentsLexer
 
 from pypager.pager import Pager
-from pypager.source import FileSource
+from pypager.source import create_file_source
 
 __all__ = [
     "run",
 ]
 
 
+def _size(value: str) -> int:
+    """
+    Parse a size in bytes, like "4096", "64K" or "1M".
+    """
+    multipliers = {"K": 1024, "M": 1024**2, "G": 1024**3}
+    value = value.strip().upper().rstrip("B")
+
+    try:
+        if value and value[-1] in multipliers:
+            result = int(value[:-1]) * multipliers[value[-1]]
+        else:
+            result = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("Invalid size: %r" % value)
+
+    if result <= 0:
+        raise argparse.ArgumentTypeError("Size should be positive: %r" % value)
+    return result
+
+
 def run() -> None:
-    if not sys.stdin.isatty():
-        pager = Pager.from_pipe()
-        pager.run()
-    else:
-        parser = argparse.ArgumentParser(description="Browse through a text file.")
-        parser.add_argument(
-            "filename", metavar="filename", nargs="+", help="The file to be displayed."
-        )
-        parser.add_argument("--vi", help="Prefer Vi key bindings.", action="store_true")
-        parser.add_argument(
-            "--emacs", help="Prefer Emacs key bindings.", action="store_true"
-        )
+    parser = argparse.ArgumentParser(description="Browse through a text file.")
+    parser.add_argument(
+        "filename", metavar="filename", nargs="*", help="The file to be displayed."
+    )
+    parser.add_argument("--vi", help="Prefer Vi key bindings.", action="store_true")
+    parser.add_argument(
+        "--emacs", help="Prefer Emacs key bindings.", action="store_true"
+    )
+    parser.add_argument(
+        "--read-size",
+        help="Initial number of bytes per read (e.g. 4K). Grows when needed.",
+        type=_size,
+        default=4096,
+    )
+    parser.add_argument(
+        "--max-read-size",
+        help="Maximum number of bytes per read (e.g. 1M).",
+        type=_size,
+        default=1024 * 1024,
+    )
+    parser.add_argument(
+        "--max-memory",
+        help="Memory budget for piped input (e.g. 512M). Older input is moved "
+        "to a temporary file.",
+        type=_size,
+        default=None,
+    )
+    parser.add_argument(
+        "--max-buffer-memory",
+        help="Memory budget for the buffers of all files together (e.g. 64M). "
+        "Files that were not displayed recently are read again when needed.",
+        type=_size,
+        default=64 * 1024 * 1024,
+    )
+    parser.add_argument(
+        "--max-fps",
+        help="Maximum number of times per second that new piped input is displayed.",
+        type=float,
+        default=30,
+    )
+    parser.add_argument(
+        "--search-processes",
+        help="Number of processes for searching big files (default: one per CPU).",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "-F",
+        "--follow",
+        help="Follow the end of the file, also when it is rotated (like 'tail -F').",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--follow-interval",
+        help="Seconds between checks for changes of a followed file, when "
+        "inotify is not available.",
+        type=float,
+        default=1.0,
+    )
 
-        args = parser.parse_args()
+    args = parser.parse_args()
 
-        # Determine input mode.
-        vi_mode = "vi" in os.environ.get("EDITOR", "").lower()
-        if args.vi:
-            vi_mode = True
-        if args.emacs:
-            vi_mode = False
+    # Determine input mode.
+    vi_mode = "vi" in os.environ.get("EDITOR", "").lower()
+    if args.vi:
+        vi_mode = True
+    if args.emacs:
+        vi_mode = False
 
-        pager = Pager(vi_mode=vi_mode)
+    if not args.filename:
+        if sys.stdin.isatty():
+            parser.error("the following arguments are required: filename")
+
+        pager = Pager.from_pipe(
+            read_size=args.read_size,
+            max_read_size=args.max_read_size,
+            max_memory=args.max_memory,
+            vi_mode=vi_mode,
+            max_fps=args.max_fps,
+            max_buffer_memory=args.max_buffer_memory,
+            search_processes=args.search_processes,
+            follow_interval=args.follow_interval,
+        )
+        pager.forward_forever = args.follow
+        pager.run()
+    else:
+        pager = Pager(
+            vi_mode=vi_mode,
+            max_memory=args.max_memory,
+            max_fps=args.max_fps,
+            max_buffer_memory=args.max_buffer_memory,
+            search_processes=args.search_processes,
+            follow_interval=args.follow_interval,
+        )
 
         # Open files.
         for filename in args.filename:
             # When a filename is given, take a lexer from that filename.
             lexer = PygmentsLexer.from_filename(filename, sync_from_start=False)
 
-            pager.add_source(FileSource(filename, lexer=lexer))
+            pager.add_source(
+                create_file_source(
+                    filename,
+                    lexer=lexer,
+                    read_size=args.read_size,
+                    max_read_size=args.max_read_size,
+                )
+            )
+
+        if args.follow:
+            pager.forward_forever = True
+            pager.current_source_info.go_to_end()
 
         # Run UI.
         pager.run()
@@ -0,0 +1,164 @@
+"""
+Watching files for changes, for following growing files (like 'tail -F').
+"""
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import struct
+import sys
+from functools import lru_cache
+from typing import Callable, Optional
+
+__all__ = [
+    "FileWatcher",
+]
+
+# inotify events. (See <sys/inotify.h>.)
+_IN_MODIFY = 0x2
+_IN_ATTRIB = 0x4
+_IN_CLOSE_WRITE = 0x8
+_IN_DELETE_SELF = 0x400
+_IN_MOVE_SELF = 0x800
+_IN_IGNORED = 0x8000
+
+_IN_EVENT = struct.Struct("iIII")
+
+
+class FileWatcher:
+    """
+    Call `callback` (in the event loop) when a file could have been changed:
+    appended to, truncated, or replaced by another file.
+
+    On Linux, inotify is used (through ctypes), so that changes are seen right
+    away, without polling. We still check every `interval` seconds: when
+    inotify is not available, and for log rotation, where the new file appears
+    after the old one was moved away. (A `stat` call per second costs nothing
+    when the file is idle.)
+
+    :param interval: Seconds between two checks, without inotify.
+    """
+
+    def __init__(
+        self, filename: str, callback: Callable[[], None], interval: float = 1.0
+    ) -> None:
+        self.filename = filename
+        self.callback = callback
+        self.interval = interval
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._poll_handle: Optional[asyncio.TimerHandle] = None
+        self._inotify_fd: Optional[int] = None
+
+    def __repr__(self) -> str:
+        return "FileWatcher(%r, inotify=%r)" % (
+            self.filename,
+            self._inotify_fd is not None,
+        )
+
+    def start(self) -> None:
+        self._loop = asyncio.get_event_loop()
+        self._watch()
+        self._schedule_poll()
+
+    def stop(self) -> None:
+        if self._poll_handle is not None:
+            self._poll_handle.cancel()
+            self._poll_handle = None
+        self._unwatch()
+
+    def _schedule_poll(self) -> None:
+        assert self._loop is not None
+        self._poll_handle = self._loop.call_later(self.interval, self._poll)
+
+    def _poll(self) -> None:
+        if self._inotify_fd is None:
+            self._watch()  # The file could exist again.
+
+        self.callback()
+        self._schedule_poll()
+
+    def _watch(self) -> None:
+        "Start watching the file with inotify, if possible."
+        fd = _inotify_watch(self.filename)
+        if fd is not None:
+            assert self._loop is not None
+            try:
+                self._loop.add_reader(fd, self._read_events)
+            except (NotImplementedError, OSError):
+                os.close(fd)
+            else:
+                self._inotify_fd = fd
+
+    def _unwatch(self) -> None:
+        if self._inotify_fd is not None:
+            assert self._loop is not None
+            self._loop.remove_reader(self._inotify_fd)
+            os.close(self._inotify_fd)
+            self._inotify_fd = None
+
+    def _read_events(self) -> None:
+        assert self._inotify_fd is not None
+        mask = 0
+
+        try:
+            while True:
+                data = os.read(self._inotify_fd, 4096)
+                if not data:
+                    break
+
+                offset = 0
+                while offset + _IN_EVENT.size <= len(data):
+                    _, event_mask, _, name_length = _IN_EVENT.unpack_from(data, offset)
+                    mask |= event_mask
+                    offset += _IN_EVENT.size + name_length
+        except BlockingIOError:
+            pass
+
+        # The file was moved away or removed. Watch the new file, when there
+        # is one. (Otherwise, polling will do that.)
+        if mask & (_IN_DELETE_SELF | _IN_MOVE_SELF | _IN_IGNORED):
+            self._unwatch()
+            self._watch()
+
+        self.callback()
+
+
+@lru_cache(maxsize=None)
+def _get_libc() -> Optional[ctypes.CDLL]:
+    """
+    Return the C library, or `None` when it can't be loaded. (It's looked up
+    only once, because `find_library` runs other programs, like 'ldconfig'.)
+    """
+    try:
+        return ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    except OSError:
+        return None
+
+
+def _inotify_watch(filename: str) -> Optional[int]:
+    """
+    Return a (non-blocking) inotify file descriptor that watches this file, or
+    `None` when inotify is not available.
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+
+    libc = _get_libc()
+    if libc is None:
+        return None
+
+    try:
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except AttributeError:
+        return None
+
+    if fd < 0:
+        return None
+
+    mask = _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_DELETE_SELF | _IN_MOVE_SELF
+    if libc.inotify_add_watch(fd, os.fsencode(filename), mask) < 0:
+        os.close(fd)
+        return None
+
+    return fd
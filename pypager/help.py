@@ -39,6 +39,9 @@ HELP = (
  <keys>?pattern          </keys> Search backward.
  <keys>n                 </keys> Repeat previous search.
  <keys>N                 </keys> Repeat previous search in reverse direction.
+ <keys>^C                </keys> Cancel a search that is in progress.
+ <keys>&amp;pattern          </keys> Display only the lines that match the pattern.
+ <keys>&amp;                 </keys> Display all lines again.
  <keys>ESC-u             </keys> Undo (toggle) search highlighting.
 
   <subtitle> JUMPING </subtitle>
@@ -0,0 +1,717 @@
+"""
+Syntax highlighting with Pygments in a background thread, and the time budget
+for highlighting while rendering.
+"""
+import asyncio
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
+
+from prompt_toolkit.document import Document
+from prompt_toolkit.formatted_text import StyleAndTextTuples, split_lines
+from prompt_toolkit.lexers import Lexer, PygmentsLexer, SyncFromStart, SyntaxSync
+from prompt_toolkit.styles.pygments import pygments_token_to_classname
+from pygments.lexer import RegexLexer
+from pygments.token import Error, Whitespace, _TokenType
+
+from .source import MmapFileSource, SeekableSource
+from .store import LineStore
+
+if TYPE_CHECKING:
+    from .pager import SourceInfo
+
+__all__ = [
+    "BackgroundLexer",
+    "LexerCheckpoints",
+    "RenderBudget",
+]
+
+# Longer lines (like minified code) are not highlighted. Lexing them takes
+# long, and so does going through the fragments when they are displayed.
+_MAX_LINE_LENGTH = 100000
+
+#: State stack of a `RegexLexer`.
+LexerState = Tuple[str, ...]
+
+
+def _supports_checkpoints(lexer: Any) -> bool:
+    """
+    True when `_get_tokens_unprocessed` can do the same as this lexer: a plain
+    `RegexLexer`, with its processed token definitions.
+    """
+    return (
+        isinstance(lexer, RegexLexer)
+        and type(lexer).get_tokens_unprocessed is RegexLexer.get_tokens_unprocessed
+        and isinstance(getattr(lexer, "_tokens", None), dict)
+    )
+
+
+def _get_tokens_unprocessed(
+    lexer: Any,
+    text: str,
+    stack: Sequence[str] = ("root",),
+    line_start: Optional[Callable[[int, List[str]], None]] = None,
+) -> Iterator[Tuple[int, Any, str]]:
+    """
+    The same as `RegexLexer.get_tokens_unprocessed`, but this calls
+    `line_start` with the position and the state stack, each time that lexing
+    continues at the start of a line. (Lexing can be resumed there, by
+    passing that stack.)
+
+    For other lexers, (or when the internals of `RegexLexer` are not what we
+    expect) this uses their own `get_tokens_unprocessed`, and `line_start` is
+    not called.
+    """
+    if not _supports_checkpoints(lexer):
+        if tuple(stack) == ("root",):
+            yield from lexer.get_tokens_unprocessed(text)
+        else:
+            yield from lexer.get_tokens_unprocessed(text, stack)
+        return
+
+    pos = 0
+    tokendefs = lexer._tokens
+    statestack = list(stack)
+    statetokens = tokendefs[statestack[-1]]
+
+    while True:
+        if line_start is not None and pos and text[pos - 1] == "\n":
+            line_start(pos, statestack)
+
+        for rexmatch, action, new_state in statetokens:
+            m = rexmatch(text, pos)
+            if m:
+                if action is not None:
+                    if type(action) is _TokenType:
+                        yield pos, action, m.group()
+                    else:
+                        yield from action(lexer, m)
+                pos = m.end()
+
+                if new_state is not None:
+                    # State transition.
+                    if isinstance(new_state, tuple):
+                        for state in new_state:
+                            if state == "#pop":
+                                if len(statestack) > 1:
+                                    statestack.pop()
+                            elif state == "#push":
+                                statestack.append(statestack[-1])
+                            else:
+                                statestack.append(state)
+                    elif isinstance(new_state, int):
+                        # Pop, but keep at least one state on the stack.
+                        if abs(new_state) >= len(statestack):
+                            del statestack[1:]
+                        else:
+                            del statestack[new_state:]
+                    elif new_state == "#push":
+                        statestack.append(statestack[-1])
+                    statetokens = tokendefs[statestack[-1]]
+                break
+        else:
+            # No match.
+            if pos >= len(text):
+                break
+
+            if text[pos] == "\n":
+                # At the end of a line, reset the state to "root".
+                statestack = ["root"]
+                statetokens = tokendefs["root"]
+                yield pos, Whitespace, "\n"
+            else:
+                yield pos, Error, text[pos]
+            pos += 1
+
+
+def _read_lines(
+    content: Union[SeekableSource, LineStore], position: int, end: int
+) -> Tuple[List[int], List[str]]:
+    "Return the positions and the text of the lines from `position` to `end`."
+    positions: List[int] = []
+    lines: List[str] = []
+
+    while position < end:
+        line_range = content.read_lines(position, 500)
+        if not line_range.positions:
+            break
+
+        positions.extend(line_range.positions)
+        lines.extend(line.text for line in line_range.lines)
+        position = line_range.end
+
+    count = bisect_left(positions, end)
+    return positions[:count], lines[:count]
+
+
+class _Checkpoint(NamedTuple):
+    position: int
+    state: LexerState
+
+    #: Position of the next checkpoint. (Lexing from this checkpoint reaches
+    #: the start of that line in the same state.) `None` for the last one.
+    next_position: Optional[int]
+
+
+class LexerCheckpoints:
+    """
+    The state of a Pygments `RegexLexer` at the start of every `interval`-th
+    line of the input, found by lexing all of the input in a background
+    thread. Lexing can be resumed at a checkpoint, so that any line can be
+    highlighted correctly (also inside a multiline string or comment) by
+    lexing at most about `interval` lines.
+
+    The input is lexed in chunks of `chunk_lines` lines, continuing from the
+    last checkpoint of the previous chunk. (No checkpoints are taken in the
+    last `interval` lines of a chunk, where the lexer doesn't see what
+    follows.)
+
+    :param complete: For a :class:`.LineStore`: True when it contains all of
+        the input.
+    :param wakeup: Called (in the lexing thread) when checkpoints were added.
+    """
+
+    #: Number of lines between two checkpoints.
+    interval = 500
+
+    #: Number of lines that are lexed at once.
+    chunk_lines = 10000
+
+    #: Stop when a chunk without checkpoints grows beyond this many lines.
+    max_chunk_lines = 1000000
+
+    def __init__(
+        self,
+        content: Union[SeekableSource, LineStore],
+        lexer: RegexLexer,
+        complete: bool = True,
+        wakeup: Optional[Callable[[], None]] = None,
+    ) -> None:
+        self.content = content
+        self.lexer = lexer
+        self.complete = complete
+        self._wakeup = wakeup
+
+        # The checkpoints. (The first one is the start of the input.)
+        self.positions = array("Q", [0])
+        self.states: List[LexerState] = [("root",)]
+
+        #: True when the checkpoints cover all of the input. (Positions
+        #: after the last checkpoint were lexed from it.)
+        self.reached_end = False
+
+        #: Size of the input, when the lexing started.
+        self.size = 0
+
+        self._interned_states: Dict[LexerState, LexerState] = {}
+        self._stopped = False
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._more = False  # More input, since the thread started lexing.
+
+    def __repr__(self) -> str:
+        return "LexerCheckpoints(%r, count=%i, reached_end=%r)" % (
+            self.lexer,
+            len(self.positions),
+            self.reached_end,
+        )
+
+    @property
+    def done(self) -> bool:
+        return (
+            self.complete and self.reached_end and self.size == self.content.get_size()
+        )
+
+    @property
+    def busy(self) -> bool:
+        return self._thread is not None
+
+    def start(self) -> None:
+        """
+        Start lexing in a background thread. This is called again when the
+        input grows, to continue from the last checkpoint.
+        """
+        with self._lock:
+            self._more = True
+
+            if self._thread is None and not self._stopped:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped = True
+
+    def get_checkpoint(self, position: int) -> Optional[_Checkpoint]:
+        """
+        Return the last checkpoint at or before `position`, or `None` if the
+        lexing didn't get that far yet.
+        """
+        count = len(self.positions)
+        i = bisect_right(self.positions, position, 0, count) - 1
+
+        if i == count - 1 and not self.reached_end:
+            return None  # (Everything between here and `position` is unknown.)
+
+        next_position = self.positions[i + 1] if i + 1 < count else None
+        return _Checkpoint(self.positions[i], self.states[i], next_position)
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                if not self._more or self._stopped:
+                    self._thread = None
+                    return
+                self._more = False
+
+            try:
+                self._lex_input()
+            except ValueError:
+                pass  # The file was closed or replaced.
+
+    def _lex_input(self) -> None:
+        chunk_lines = self.chunk_lines
+        self.reached_end = False
+        self.size = self.content.get_size()
+
+        while not self._stopped:
+            position = self.positions[-1]
+            line_range = self.content.read_lines(position, chunk_lines)
+            at_end = line_range.end > self.content.get_size()
+            if not line_range.positions:
+                break
+
+            texts = [
+                "" if len(line.text) > _MAX_LINE_LENGTH else line.text
+                for line in line_range.lines
+            ]
+            checkpoints = self._lex_chunk(
+                texts, len(texts) if at_end else len(texts) - self.interval
+            )
+
+            # (Append the state first: `get_checkpoint` can be called from
+            # another thread.)
+            for line_index, state in checkpoints:
+                self.states.append(state)
+                self.positions.append(line_range.positions[line_index])
+
+            if checkpoints and self._wakeup is not None:
+                self._wakeup()
+
+            if at_end:
+                break
+
+            if checkpoints:
+                chunk_lines = self.chunk_lines
+            elif chunk_lines < self.max_chunk_lines:
+                # Nowhere to take a checkpoint. (A very long multiline
+                # string?) Try with more lines.
+                chunk_lines *= 2
+            else:
+                return
+
+        self.reached_end = True
+
+    def _lex_chunk(self, lines: List[str], limit: int) -> List[Tuple[int, LexerState]]:
+        """
+        Lex these lines, starting at the last checkpoint. Return the (line
+        index, state) checkpoints in the first `limit` lines.
+        """
+        offsets = []
+        offset = 0
+        for line in lines:
+            offsets.append(offset)
+            offset += len(line) + 1
+
+        checkpoints: List[Tuple[int, LexerState]] = []
+        next_line = self.interval
+
+        def line_start(pos: int, statestack: List[str]) -> None:
+            nonlocal next_line
+            line_index = bisect_left(offsets, pos)
+
+            if next_line <= line_index < limit:
+                state = tuple(statestack)
+                state = self._interned_states.setdefault(state, state)
+                checkpoints.append((line_index, state))
+                next_line = line_index + self.interval
+
+        end = offsets[limit] if 0 < limit < len(offsets) else offset
+        tokens = _get_tokens_unprocessed(
+            self.lexer, "\n".join(lines), self.states[-1], line_start
+        )
+        for pos, _, _ in tokens:
+            if pos >= end or self._stopped:
+                break
+
+        return checkpoints
+
+
+class _Job(NamedTuple):
+    """
+    A region of the input to lex: from a checkpoint (with its `state`) to the
+    line at `end`, (excluded) or these `rows` of the buffer, (positions and
+    text) from a sync point. `pending` are the positions of the rows that
+    wait for it.
+    """
+
+    start: int
+    end: int
+    state: Optional[LexerState]
+    rows: Optional[Tuple[List[int], List[str]]]
+    pending: Sequence[int] = ()
+
+
+class BackgroundLexer(Lexer):
+    """
+    Prompt_toolkit lexer that highlights the lines of a source with the
+    Pygments lexer of a :class:`~prompt_toolkit.lexers.PygmentsLexer`, in a
+    background thread.
+
+    Rendering never waits for Pygments: lines that are not highlighted yet are
+    displayed as plain text, and replaced by the highlighted lines when they
+    are ready. The lines that are displayed are lexed in regions, to `margin`
+    lines beyond the last one. So a jump only lexes the lines around the new
+    location, never everything from the start of the input.
+
+    For a `RegexLexer`, :class:`.LexerCheckpoints` are taken in the
+    background, and the regions start at the last checkpoint before them, so
+    that they are highlighted correctly. Until the checkpoints get there, they
+    start at a sync point of the lexer (like in the `PygmentsLexer`), and are
+    lexed again when the checkpoints are known.
+
+    Highlighted lines are cached by their position in the input.
+    """
+
+    #: Number of lines that are lexed beyond the lines that are displayed.
+    margin = 100
+
+    #: Maximum number of highlighted lines in the cache.
+    max_cache_lines = 10000
+
+    def __init__(self, source_info: "SourceInfo", lexer: PygmentsLexer) -> None:
+        self.source_info = source_info
+        self.lexer = lexer
+
+        self.checkpoints: Optional[LexerCheckpoints] = None
+        self._file_id: Optional[Tuple[int, int]] = None
+
+        # Highlighted lines: position -> (text, fragments, exact). (The text
+        # is compared with the line in the buffer, in case the input changed.)
+        self._cache: "OrderedDict[int, Tuple[str, StyleAndTextTuples, bool]]" = (
+            OrderedDict()
+        )
+
+        # Rows of the buffer that need to be highlighted (again), and
+        # positions of the lines that are being lexed.
+        self._missing: Set[int] = set()
+        self._pending: Set[int] = set()
+
+        self._token_styles: Dict[Tuple[str, ...], str] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._next_job: Optional[_Job] = None
+
+    def __repr__(self) -> str:
+        return "BackgroundLexer(%r, cached=%i)" % (
+            self.lexer.pygments_lexer,
+            len(self._cache),
+        )
+
+    def lex_document(self, document: Document) -> Callable[[int], StyleAndTextTuples]:
+        lines = document.lines
+
+        def get_line(lineno: int) -> StyleAndTextTuples:
+            text = lines[lineno]
+            try:
+                position = self.source_info.line_positions[lineno]
+            except IndexError:
+                return [("", text)]
+
+            fragments: StyleAndTextTuples = [("", text)]
+            cached = self._cache.get(position)
+
+            if cached is not None and cached[0] == text:
+                self._cache.move_to_end(position)
+                fragments = cached[1]
+
+                # Lex again from a checkpoint, when there is one now.
+                checkpoints = self.checkpoints
+                if (
+                    cached[2]
+                    or checkpoints is None
+                    or checkpoints.get_checkpoint(position) is None
+                ):
+                    return fragments
+
+            if position not in self._pending:
+                if not self._missing:
+                    # Lex after rendering, all missing lines at once.
+                    asyncio.get_event_loop().call_soon(self._submit, document)
+                self._missing.add(lineno)
+
+            return fragments
+
+        return get_line
+
+    def _get_checkpoints(self) -> Optional[LexerCheckpoints]:
+        """
+        Return the checkpoints, and start or continue taking them. (From the
+        start, when the file was replaced.)
+        """
+        content = self.source_info.content
+        pygments_lexer = self.lexer.pygments_lexer
+        if not _supports_checkpoints(pygments_lexer):
+            return None
+
+        checkpoints = self.checkpoints
+        if checkpoints is not None and (
+            checkpoints.content is not content
+            or checkpoints.size > content.get_size()
+            or isinstance(content, MmapFileSource)
+            and content.file_id != self._file_id
+        ):
+            # The input was replaced.
+            checkpoints.stop()
+            self.checkpoints = None
+            self._cache.clear()
+
+        if isinstance(content, MmapFileSource):
+            self._file_id = content.file_id
+
+        if self.checkpoints is None:
+            loop = asyncio.get_event_loop()
+
+            def wakeup() -> None:
+                loop.call_soon_threadsafe(self._checkpoints_added)
+
+            self.checkpoints = LexerCheckpoints(content, pygments_lexer, wakeup=wakeup)
+
+        checkpoints = self.checkpoints
+        checkpoints.complete = self.source_info.complete
+        if not checkpoints.done and not checkpoints.busy:
+            checkpoints.start()
+        return checkpoints
+
+    def _checkpoints_added(self) -> None:
+        "Render again, to lex the lines from a checkpoint when possible."
+        if any(not exact for _, _, exact in self._cache.values()):
+            self.source_info.pager.application.invalidate()
+
+    def _submit(self, document: Document) -> None:
+        "Lex the region that contains the missing rows in the background."
+        missing = self._missing
+        self._missing = set()
+
+        source_info = self.source_info
+        positions = source_info.line_positions
+        if document.text != source_info.buffer.text:
+            return  # The buffer changed. The lines are requested again.
+
+        first = min(missing)
+        last = min(len(positions), max(missing) + self.margin + 1) - 1
+        checkpoints = self._get_checkpoints()
+        checkpoint = None
+        if checkpoints is not None:
+            checkpoint = checkpoints.get_checkpoint(positions[first])
+
+        job: _Job
+        if checkpoint is not None:
+            assert checkpoints is not None
+
+            # Lex to a checkpoint, not halfway a multiline token. (For a
+            # filter, the rows are far apart: only to the next checkpoint.)
+            if source_info.filter is None:
+                checkpoint_after = checkpoints.get_checkpoint(positions[last])
+                if checkpoint_after is not None:
+                    checkpoint = checkpoint._replace(
+                        next_position=checkpoint_after.next_position
+                    )
+                elif checkpoints.positions[-1] > checkpoint.position:
+                    checkpoint = checkpoint._replace(
+                        next_position=checkpoints.positions[-1]
+                    )
+
+            end = checkpoint.next_position
+            if end is None:
+                end = source_info.content.get_size() + 1
+            job = _Job(checkpoint.position, end, checkpoint.state, None)
+            last = bisect_left(positions, end, first) - 1
+        else:
+            sync: SyntaxSync
+            if self.lexer.sync_from_start():
+                sync = SyncFromStart()
+            else:
+                sync = self.lexer.syntax_sync
+
+            # Lex the lines of the buffer. (The rows of a filter view are not
+            # consecutive lines, so they are lexed one by one.)
+            if source_info.filter is None:
+                first, _ = sync.get_sync_start_position(document, first)
+            rows = (positions[first : last + 1], document.lines[first : last + 1])
+            job = _Job(positions[first], positions[last], None, rows)
+
+        pending = positions[first : last + 1]
+        self._pending = set(pending)
+        job = job._replace(pending=pending)
+
+        with self._lock:
+            # (A job that was not started yet is replaced. It's for lines that
+            # are probably not displayed anymore.)
+            self._next_job = job
+
+            if self._thread is None:
+                loop = asyncio.get_event_loop()
+                self._thread = threading.Thread(target=self._run, args=(loop,))
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _run(self, loop: asyncio.AbstractEventLoop) -> None:
+        while True:
+            with self._lock:
+                job = self._next_job
+                self._next_job = None
+
+                if job is None:
+                    self._thread = None
+                    return
+
+            result: List[Tuple[int, str, StyleAndTextTuples, bool]] = []
+            try:
+                if job.rows is not None:
+                    positions, lines = job.rows
+                else:
+                    positions, lines = _read_lines(
+                        self.source_info.content, job.start, job.end
+                    )
+
+                exact = job.state is not None
+                result = [
+                    (position, text, fragments, exact)
+                    for position, text, fragments in zip(
+                        positions, lines, self._lex(lines, job.state)
+                    )
+                ]
+            except ValueError:
+                pass  # The file was closed or replaced.
+            finally:
+                # (Also when it failed: the rows are not pending anymore, and
+                # are submitted again when they are rendered.)
+                loop.call_soon_threadsafe(self._add, result, job.pending)
+
+    def _lex(
+        self, lines: Sequence[str], state: Optional[LexerState]
+    ) -> List[StyleAndTextTuples]:
+        "Highlight these lines. (In the background thread.)"
+        token_styles = self._token_styles
+        pygments_lexer = self.lexer.pygments_lexer
+        text = "\n".join("" if len(line) > _MAX_LINE_LENGTH else line for line in lines)
+
+        def get_style(token: Tuple[str, ...]) -> str:
+            style = token_styles.get(token)
+            if style is None:
+                style = "class:" + pygments_token_to_classname(token)
+                token_styles[token] = style
+            return style
+
+        if state is not None:
+            tokens = _get_tokens_unprocessed(pygments_lexer, text, state)
+        else:
+            tokens = pygments_lexer.get_tokens_unprocessed(text)
+
+        result = list(
+            split_lines((get_style(token), value) for _, token, value in tokens)
+        )
+        for i, line in enumerate(lines):
+            if len(line) > _MAX_LINE_LENGTH and i < len(result):
+                result[i] = [("", line)]
+        return result
+
+    def _add(
+        self,
+        result: List[Tuple[int, str, StyleAndTextTuples, bool]],
+        pending: Sequence[int],
+    ) -> None:
+        """
+        Add highlighted lines to the cache, when the job for the `pending` rows
+        is done. (In the event loop.)
+        """
+        cache = self._cache
+        self._pending.difference_update(pending)
+
+        for position, text, fragments, exact in result:
+            cache[position] = (text, fragments, exact)
+            cache.move_to_end(position)
+            self._pending.discard(position)
+
+        while len(cache) > self.max_cache_lines:
+            cache.popitem(last=False)
+
+        if result:
+            self.source_info.pager.application.invalidate()
+
+
+class RenderBudget:
+    """
+    Time that highlighting may take while the buffer of a source is rendered.
+    (Lexing, interpreting escape sequences and highlighting search matches.)
+
+    When a frame goes over budget, the remaining lines are drawn plain, and
+    highlighted in the next frames. When that happens in `max_overruns`
+    frames in a row, the input is too slow to highlight, and highlighting is
+    turned off for the source.
+    """
+
+    #: Seconds that highlighting may take in one frame.
+    frame_time = 0.05
+
+    #: Number of frames in a row that go over budget, before giving up.
+    max_overruns = 10
+
+    def __init__(self) -> None:
+        #: Time spent in the current frame.
+        self.spent = 0.0
+
+        #: True when lines were drawn plain in the current frame.
+        self.deferred = False
+
+        #: Number of frames in a row in which lines were drawn plain.
+        self.overruns = 0
+
+    def __repr__(self) -> str:
+        return "RenderBudget(spent=%.3f, overruns=%i)" % (self.spent, self.overruns)
+
+    @property
+    def exceeded(self) -> bool:
+        return self.spent >= self.frame_time
+
+    @property
+    def exhausted(self) -> bool:
+        return self.overruns >= self.max_overruns
+
+    def start_frame(self) -> None:
+        self.spent = 0.0
+        self.deferred = False
+
+    def end_frame(self) -> bool:
+        "Return True when lines were drawn plain, and have to be finished."
+        if self.deferred:
+            self.overruns += 1
+        else:
+            self.overruns = 0
+        return self.deferred
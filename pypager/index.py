@@ -0,0 +1,283 @@
+"""
+Line index for seekable input.
+
+Jumping into the middle of a big file requires two things: the position where
+a line starts and the SGR attributes that are active at that position. The
+index records sparse checkpoints with this information, in a background
+thread, while the rest of the file is still being indexed.
+"""
+import re
+import threading
+from array import array
+from bisect import bisect_right
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
+
+from prompt_toolkit.styles import DEFAULT_ATTRS, Attrs
+
+from .ansi import StyleTable, default_style_table
+
+if TYPE_CHECKING:
+    from .source import FileData
+
+__all__ = [
+    "LineIndex",
+]
+
+# SGR sequences in (UTF-8 encoded) input. Other CSI sequences are matched too,
+# because they are skipped as a whole by the tokenizer.
+_CSI_RE = re.compile(rb"(?:\x1b\[|\xc2\x9b)([\x30-\x3f]*)[\x20-\x2f]*([\x40-\x7e])")
+_SGR_PARAMS_RE = re.compile(rb"[0-9;]*")
+
+
+class LineIndex:
+    """
+    Index of the line positions in `data` (a :class:`.FileData` or bytes).
+
+    A checkpoint is recorded at the first line that starts after every
+    `interval` bytes. It contains the position, the line number and the
+    `Attrs` at that point. (Spacing by bytes rather than by lines bounds the
+    amount of data to scan for a lookup, whatever the length of the lines.)
+
+    The checkpoints are stored in arrays, so the index stays compact, even for
+    huge files.
+
+    :param interval: Number of bytes between two checkpoints.
+    """
+
+    def __init__(
+        self,
+        data: Union["FileData", bytes],
+        size: int,
+        interval: int = 64 * 1024,
+        style_table: Optional[StyleTable] = None,
+    ) -> None:
+        self.data = data
+        self.size = size
+        self.interval = interval
+        self.style_table = default_style_table if style_table is None else style_table
+
+        # Checkpoints.
+        self._positions = array("Q", [0])
+        self._line_numbers = array("Q", [0])
+        self._attrs_ids = array("I", [0])
+
+        # Distinct `Attrs` that appear in the checkpoints.
+        self._attrs_list: List[Attrs] = [DEFAULT_ATTRS]
+        self._attrs_to_id: Dict[Attrs, int] = {DEFAULT_ATTRS: 0}
+
+        #: Number of bytes indexed so far, and the number of lines before that
+        #: point.
+        self.indexed_size = 0
+        self.indexed_lines = 0
+
+        self._done = size == 0
+        self._started = False
+        self._stopped = False
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+        # Where the indexer continues: (position, line number, attrs).
+        self._resume: Tuple[int, int, Attrs] = (0, 0, DEFAULT_ATTRS)
+
+    def __repr__(self) -> str:
+        return "LineIndex(checkpoints=%i, progress=%.2f)" % (
+            len(self._positions),
+            self.progress,
+        )
+
+    @property
+    def done(self) -> bool:
+        "True when the whole input has been indexed."
+        return self._done
+
+    @property
+    def progress(self) -> float:
+        "Fraction of the input that has been indexed."
+        if self._done:
+            return 1.0
+        return self.indexed_size / self.size
+
+    @property
+    def line_count(self) -> Optional[int]:
+        "The total number of lines, when known."
+        if self._done:
+            return self.indexed_lines
+        return None
+
+    def start(self) -> None:
+        "Start indexing in a background thread."
+        self._started = True
+
+        if self._thread is None and not self._done:
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self) -> None:
+        "Stop indexing. (Call this before closing the data.)"
+        self._stopped = True
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def grow(self, data: Union["FileData", bytes], size: int) -> None:
+        """
+        The input was appended to. Continue indexing with the new data (a new
+        :class:`.FileData`). The old data is not used anymore when this returns.
+        """
+        self.stop()
+
+        with self._lock:
+            self.data = data
+            self.size = size
+            self._stopped = False
+
+            if size > self._resume[0]:
+                self._done = False
+
+        if self._started:
+            self.start()
+
+    def _run(self) -> None:
+        data = self.data
+        size = self.size
+        position, line_number, attrs = self._resume
+
+        try:
+            while not self._stopped:
+                # The next checkpoint is the first line that starts after
+                # `interval` bytes.
+                newline = data.find(b"\n", position + self.interval - 1)
+                end = size if newline == -1 else newline + 1
+
+                chunk = data[position:end]
+                line_number += chunk.count(b"\n")
+                attrs = self._apply_sgr(attrs, chunk)
+                position = end
+
+                with self._lock:
+                    self.indexed_size = position
+                    self._resume = (position, line_number, attrs)
+
+                    if position < size:
+                        self._positions.append(position)
+                        self._line_numbers.append(line_number)
+                        self._attrs_ids.append(self._get_attrs_id(attrs))
+                        self.indexed_lines = line_number
+                    else:
+                        # The line after the last newline counts too.
+                        self.indexed_lines = line_number + 1
+                        self._done = True
+                        break
+        except ValueError:
+            # The data was closed.
+            pass
+
+    def _apply_sgr(self, attrs: Attrs, chunk: bytes) -> Attrs:
+        "Apply all SGR sequences in this chunk to `attrs`."
+        # Everything before the last reset doesn't matter.
+        reset = max(chunk.rfind(b"\x1b[0m"), chunk.rfind(b"\x1b[m"))
+        if reset != -1:
+            attrs = DEFAULT_ATTRS
+            chunk = chunk[reset:]
+
+        if b"\x1b" in chunk or b"\x9b" in chunk:
+            for m in _CSI_RE.finditer(chunk):
+                params = m.group(1)
+                if m.group(2) == b"m" and _SGR_PARAMS_RE.fullmatch(params):
+                    attrs = self.style_table.apply_sgr(attrs, params.decode())
+        return attrs
+
+    def _get_attrs_id(self, attrs: Attrs) -> int:
+        try:
+            return self._attrs_to_id[attrs]
+        except KeyError:
+            result = len(self._attrs_list)
+            self._attrs_list.append(attrs)
+            self._attrs_to_id[attrs] = result
+            return result
+
+    def _get_checkpoint(self, index: int) -> Tuple[int, int, Attrs]:
+        return (
+            self._positions[index],
+            self._line_numbers[index],
+            self._attrs_list[self._attrs_ids[index]],
+        )
+
+    def lookup_position(self, position: int) -> Optional[Tuple[int, int, Attrs]]:
+        """
+        Return the last checkpoint at or before `position` as a (position,
+        line number, attrs) tuple, or `None` when this part of the input has
+        not been indexed yet.
+        """
+        with self._lock:
+            if position > self.indexed_size and not self._done:
+                return None
+            index = bisect_right(self._positions, position) - 1
+            return self._get_checkpoint(index)
+
+    def lookup_line(self, line_number: int) -> Optional[Tuple[int, int, Attrs]]:
+        """
+        Return the last checkpoint at or before this line number as a
+        (position, line number, attrs) tuple, or `None` when this part of the
+        input has not been indexed yet.
+        """
+        with self._lock:
+            if line_number > self.indexed_lines and not self._done:
+                return None
+            index = bisect_right(self._line_numbers, line_number) - 1
+            return self._get_checkpoint(index)
+
+    def get_line_number(self, position: int) -> Optional[int]:
+        "Return the line number of the line that starts at `position`."
+        checkpoint = self.lookup_position(position)
+        if checkpoint is None:
+            return None
+
+        start, line_number, _ = checkpoint
+        return line_number + self.data[start:position].count(b"\n")
+
+    def get_position(self, line_number: int) -> Optional[int]:
+        """
+        Return the position of the line with this line number. (The last line
+        if the line number is too big.)
+        """
+        checkpoint = self.lookup_line(line_number)
+        if checkpoint is None:
+            return None
+
+        position, current, _ = checkpoint
+        line_start = position
+        data = self.data
+        size = len(data)
+
+        # Read the data after the checkpoint in blocks, (the next checkpoint is
+        # usually in the first one) and count the newlines in each block.
+        while current < line_number and position < size:
+            block = data[position : position + self.interval]
+            if not block:
+                break  # (Truncated.)
+
+            count = block.count(b"\n")
+            if current + count >= line_number:
+                # The line starts in this block, after the n-th newline.
+                rest = block.split(b"\n", line_number - current)[-1]
+                return position + len(block) - len(rest)
+
+            if count:
+                line_start = position + block.rfind(b"\n") + 1
+            position += len(block)
+            current += count
+
+        # The last line.
+        return line_start
+
+    def get_attrs(self, position: int) -> Optional[Attrs]:
+        "Return the `Attrs` that are active at `position`."
+        checkpoint = self.lookup_position(position)
+        if checkpoint is None:
+            return None
+
+        start, _, attrs = checkpoint
+        return self._apply_sgr(attrs, self.data[start:position])
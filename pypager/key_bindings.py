@@ -1,4 +1,4 @@
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, List, Optional
 
 from prompt_toolkit.application import get_app
 from prompt_toolkit.filters import Condition, has_focus
@@ -44,10 +44,26 @@ def create_key_bindings(pager: "Pager") -> KeyBindings:
     def displaying_help() -> bool:
         return pager.displaying_help
 
-    for c in "01234556789":
+    # The digits of the number that is typed before a command. (We keep them
+    # ourselves, because `event.arg` turns numbers of a million or more into 1.)
+    count_digits: List[str] = []
+
+    def get_count(event: E) -> Optional[int]:
+        """
+        Return the number that was typed before the command, if any. (A lone
+        "-" is not a number.)
+        """
+        if event.arg_present and event.arg >= 0 and count_digits:
+            return int("".join(count_digits))
+        return None
+
+    for c in "0123456789":
 
         @handle(c, filter=default_focus)
         def _handle_arg(event: E, c: str = c) -> None:
+            if not event.arg_present:
+                del count_digits[:]  # (A new number.)
+            count_digits.append(c)
             event.append_to_arg_count(c)
 
     @handle("q", filter=default_focus, eager=True)
@@ -138,26 +154,35 @@ def create_key_bindings(pager: "Pager") -> KeyBindings:
     @handle("<", filter=default_focus)
     @handle("escape", "<", filter=default_focus)
     def _firstline(event: E) -> None:
-        "Go to the first line of the file."
-        event.current_buffer.cursor_position = 0
+        "Go to the first line of the file, or to line N."
+        count = get_count(event)
+        if count is None:
+            pager.current_source_info.go_to_location((0, 0, 0, 0))
+        else:
+            pager.current_source_info.go_to_line(max(0, count - 1))
 
     @handle("G", filter=default_focus)
     @handle(">", filter=default_focus)
     @handle("escape", ">", filter=default_focus)
     def _lastline(event: E) -> None:
-        "Go to the last line of the file."
-        b = event.current_buffer
-        b.cursor_position = len(b.text)
+        "Go to the last line of the file, or to line N."
+        count = get_count(event)
+        if count is None:
+            pager.current_source_info.go_to_end()
+        else:
+            pager.current_source_info.go_to_line(max(0, count - 1))
+
+    @handle("%", filter=default_focus)
+    @handle("p", filter=default_focus)
+    def _percentage(event: E) -> None:
+        "Go to a line N percent into the file."
+        pager.current_source_info.go_to_percentage(get_count(event) or 0)
 
     @handle("m", Keys.Any, filter=default_focus)
     def _mark(event: E) -> None:
         "Mark current position."
         source_info = pager.current_source_info
-
-        source_info.marks[event.data] = (
-            event.current_buffer.cursor_position,
-            source_info.window.vertical_scroll,
-        )
+        source_info.marks[event.data] = source_info.get_location()
 
     @handle("'", Keys.Any, filter=default_focus)
     def _goto_mark(event: E) -> None:
@@ -170,31 +195,59 @@ def create_key_bindings(pager: "Pager") -> KeyBindings:
         go_to_mark(event, ".")
 
     def go_to_mark(event: E, mark: str) -> None:
-        b = event.current_buffer
         source_info = pager.current_source_info
         try:
             if mark == "^":  # Start of file.
-                cursor_pos, vertical_scroll = 0, 0
+                source_info.go_to_location((0, 0, 0, 0))
             elif mark == "$":  # End of file - mark.
-                cursor_pos, vertical_scroll = len(b.text), 0
+                source_info.go_to_end()
             else:  # Custom mark.
-                cursor_pos, vertical_scroll = source_info.marks[mark]
+                source_info.go_to_location(source_info.marks[mark])
         except KeyError:
             pass  # TODO: show warning.
-        else:
-            b.cursor_position = cursor_pos
-            source_info.window.vertical_scroll = vertical_scroll
 
     @handle("F", filter=default_focus)
     def _follow(event: E) -> None:
         "Forward forever, like 'tail -f'."
         pager.forward_forever = True
+        pager.current_source_info.go_to_end()
 
     @handle("r", filter=default_focus)
     @handle("R", filter=default_focus)
     def _repaint(event: E) -> None:
         event.app.renderer.clear()
 
+    @handle("enter", filter=has_focus(pager.search_buffer))
+    def _accept_search(event: E) -> None:
+        "Search in all of the input, not only in the buffer."
+        target = event.app.layout.search_target_buffer_control
+        if target is not None and pager.search_buffer.text:
+            target.search_state.text = pager.search_buffer.text
+
+        pager.search_buffer.append_to_history()
+        stop_search()
+        pager.search()
+
+    @handle("n", filter=default_focus & ~has_colon)
+    def _search_next(event: E) -> None:
+        "Repeat previous search."
+        pager.search()
+
+    @handle("N", filter=default_focus & ~has_colon)
+    def _search_previous(event: E) -> None:
+        "Repeat previous search in reverse direction."
+        pager.search(reverse=True)
+
+    @Condition
+    def searching() -> bool:
+        return pager.current_source_info.current_search is not None
+
+    @handle("c-c", filter=default_focus & searching)
+    def _cancel_background_search(event: E) -> None:
+        "Cancel the search that is in progress."
+        pager.current_source_info.cancel_search()
+        pager.message = "Search cancelled"
+
     @Condition
     def search_buffer_is_empty() -> bool:
         "Returns True when the search buffer is empty."
@@ -218,19 +271,19 @@ def create_key_bindings(pager: "Pager") -> KeyBindings:
         "Scroll half page to the left."
         w = event.app.layout.current_window
         b = event.app.current_buffer
+        source_info = pager.current_source_info
 
         if w and w.render_info:
             info = w.render_info
             amount = info.window_width // 2
 
             # Move cursor horizontally.
-            value = b.cursor_position - min(
-                amount, len(b.document.current_line_before_cursor)
-            )
-            b.cursor_position = value
+            b.cursor_position -= min(amount, b.document.cursor_position_col)
 
             # Scroll.
-            w.horizontal_scroll = max(0, w.horizontal_scroll - amount)
+            source_info.horizontal_scroll = max(
+                0, source_info.horizontal_scroll - amount
+            )
 
     @handle("right", filter=default_focus & ~line_wrapping_enable)
     @handle("escape", ")", filter=default_focus & ~line_wrapping_enable)
@@ -238,25 +291,28 @@ def create_key_bindings(pager: "Pager") -> KeyBindings:
         "Scroll half page to the right."
         w = event.app.layout.current_window
         b = event.app.current_buffer
+        source_info = pager.current_source_info
 
         if w and w.render_info:
             info = w.render_info
             amount = info.window_width // 2
 
             # Move the cursor first to a visible line that is long enough to
-            # have the cursor visible after scrolling. (Otherwise, the Window
-            # will scroll back.)
-            xpos = w.horizontal_scroll + amount
-
-            for line in info.displayed_lines:
-                if len(b.document.lines[line]) >= xpos:
+            # have the cursor visible after scrolling. (Otherwise, we will
+            # scroll back.) The width of the lines is known, there's no need to
+            # look at their text.
+            column = source_info.horizontal_scroll + amount
+
+            for row in info.displayed_lines:
+                line = source_info.line_tokens[row]
+                if line.width >= column:
                     b.cursor_position = b.document.translate_row_col_to_index(
-                        line, xpos
+                        row, line.get_index(column)
                     )
                     break
 
             # Scroll.
-            w.horizontal_scroll = max(0, w.horizontal_scroll + amount)
+            source_info.horizontal_scroll = column
 
     @handle(":", filter=default_focus & ~displaying_help)
     def _colon(event: E) -> None:
@@ -298,6 +354,18 @@ def create_key_bindings(pager: "Pager") -> KeyBindings:
         "Cancel 'Examine' input."
         event.app.layout.focus(pager.current_source_info.window)
 
+    @handle("&", filter=default_focus & ~has_colon)
+    def _filter(event: E) -> None:
+        "Display only the lines that match a pattern."
+        event.app.layout.focus(pager.layout.filter_control)
+
+    @handle("c-c", filter=has_focus("FILTER"))
+    @handle("c-g", filter=has_focus("FILTER"))
+    def _cancel_filter(event: E) -> None:
+        "Cancel the filter input."
+        pager.filter_buffer.reset()
+        event.app.layout.focus(pager.current_source_info.window)
+
     @handle("c-z", filter=Condition(lambda: suspend_to_background_supported()))
     def _suspend(event: E) -> None:
         "Suspend to background."
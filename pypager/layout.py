@@ -1,7 +1,10 @@
+import time
 import weakref
-from typing import TYPE_CHECKING, Optional
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Callable, Hashable, Optional, Tuple
 
 from prompt_toolkit.application import get_app
+from prompt_toolkit.document import Document
 from prompt_toolkit.enums import SYSTEM_BUFFER
 from prompt_toolkit.filters import Condition, HasArg, HasSearch, has_focus
 from prompt_toolkit.formatted_text import HTML, AnyFormattedText, StyleAndTextTuples
@@ -29,8 +32,10 @@ from prompt_toolkit.layout.processors import (
     TabsProcessor,
     Transformation,
     TransformationInput,
+    merge_processors,
 )
-from prompt_toolkit.lexers import SimpleLexer
+from prompt_toolkit.layout.screen import Char
+from prompt_toolkit.lexers import Lexer, PygmentsLexer, SimpleLexer
 from prompt_toolkit.widgets.toolbars import (
     FormattedTextToolbar,
     SearchToolbar,
@@ -38,6 +43,7 @@ from prompt_toolkit.widgets.toolbars import (
 )
 
 from .filters import HasColon
+from .highlight import BackgroundLexer, RenderBudget
 
 if TYPE_CHECKING:
     from .pager import Pager, SourceInfo
@@ -47,17 +53,302 @@ __all__ = [
 ]
 
 
+#: Number of characters beyond the visible part of a long line that are
+#: processed. (For search matches and tabs at the edges. A multiple of the tab
+#: stop.)
+_LINE_MARGIN = 64
+
+
+def _get_visible_range(
+    source_info: "SourceInfo", lineno: int, width: int
+) -> Tuple[int, int]:
+    """
+    Return the range of characters of this line that have to be processed to
+    display it: the visible columns, with a margin on both sides. (So that
+    scrolling along a long line only processes a window width of it.)
+
+    This is the whole line when it's wrapped, or when it has characters that
+    don't take one column. (Then we don't know which characters are visible,
+    without looking at all of them.)
+    """
+    line = source_info.line_tokens[lineno]
+    length = len(line.text)
+
+    if source_info.wrap_lines or not line.simple:
+        return 0, length
+
+    scroll = source_info.horizontal_scroll
+    start = max(0, scroll - _LINE_MARGIN)
+    start -= start % 4  # (Keep the tab stops.)
+    return start, min(length, scroll + width + _LINE_MARGIN)
+
+
+def _slice_fragments(
+    fragments: StyleAndTextTuples, start: int, end: int
+) -> StyleAndTextTuples:
+    "Return the fragments for the characters from `start` to `end`."
+    result: StyleAndTextTuples = []
+    offset = 0
+
+    for fragment in fragments:
+        text = fragment[1]
+        fragment_end = offset + len(text)
+
+        if fragment_end > start:
+            result.append((fragment[0], text[max(0, start - offset) : end - offset]))
+        if fragment_end >= end:
+            break
+        offset = fragment_end
+
+    return result
+
+
+def _create_slice_transformation(
+    fragments: StyleAndTextTuples, start: int, end: int
+) -> Transformation:
+    "Transformation for the fragments of the characters from `start` to `end`."
+    length = end - start
+
+    return Transformation(
+        fragments,
+        source_to_display=lambda i: max(0, min(i - start, length)),
+        display_to_source=lambda i: i + start,
+    )
+
+
+class _SliceProcessor(Processor):
+    """
+    Keep only the characters of a line that have to be processed to display
+    it. (See `_get_visible_range`.)
+    """
+
+    def __init__(self, source_info: "SourceInfo") -> None:
+        self.source_info = source_info
+
+    def apply_transformation(self, ti: TransformationInput) -> Transformation:
+        start, end = _get_visible_range(self.source_info, ti.lineno, ti.width)
+
+        if start == 0 and end == len(ti.document.lines[ti.lineno]):
+            return Transformation(ti.fragments)
+
+        return _create_slice_transformation(
+            _slice_fragments(ti.fragments, start, end), start, end
+        )
+
+
+class _ScrollProcessor(Processor):
+    """
+    Scroll horizontally: remove the columns before `horizontal_scroll` of the
+    source. (The window itself doesn't scroll horizontally, because it would
+    go through all of the line, for every line.)
+    """
+
+    def __init__(self, source_info: "SourceInfo") -> None:
+        self.source_info = source_info
+
+    def apply_transformation(self, ti: TransformationInput) -> Transformation:
+        source_info = self.source_info
+        scroll = source_info.horizontal_scroll
+        if not scroll:
+            return Transformation(ti.fragments)
+
+        # The number of columns and characters to remove.
+        start, _ = _get_visible_range(source_info, ti.lineno, ti.width)
+        columns = scroll - start
+        count = 0
+        result: StyleAndTextTuples = []
+
+        simple = source_info.line_tokens[ti.lineno].simple
+
+        for i, fragment in enumerate(ti.fragments):
+            text = fragment[1]
+
+            if simple:
+                skip = min(len(text), columns)
+                columns -= skip
+            else:
+                skip = 0
+                while skip < len(text) and columns > 0:
+                    columns -= Char(text[skip]).width
+                    skip += 1
+
+            count += skip
+            if skip < len(text):
+                # (Half of a double width character is a space.)
+                if columns < 0:
+                    result.append((fragment[0], " " * -columns))
+                    count += columns
+                    columns = 0
+
+                result.append((fragment[0], text[skip:]))
+                result.extend(ti.fragments[i + 1 :])
+                break
+
+        # (Keep the cursor on the screen, it is in the visible part.)
+        last = max(0, ti.width - 1)
+        return Transformation(
+            result,
+            source_to_display=lambda i: max(0, min(i - count, last)),
+            display_to_source=lambda i: i + count,
+        )
+
+
+class _TabsProcessor(TabsProcessor):
+    """
+    Expand tabs. (Lines without tabs are passed on as they are, instead of
+    being processed character by character.)
+    """
+
+    def apply_transformation(self, ti: TransformationInput) -> Transformation:
+        if not any("\t" in fragment[1] for fragment in ti.fragments):
+            return Transformation(ti.fragments)
+        return super().apply_transformation(ti)
+
+
 class _EscapeProcessor(Processor):
     """
-    Interpret escape sequences like less/more/most do.
+    Interpret escape sequences like less/more/most do, and expand tabs.
+
+    Only the characters that are needed to display a line are processed. (See
+    `_get_visible_range`.)
+
+    The transformation of each line is cached across renders, so that
+    scrolling only processes the lines that become visible. The cache is
+    keyed by the position of the line (which doesn't change when lines are
+    added to or removed from the buffer), and cleared when the generation of
+    the buffer changes. (When lines are read again.)
     """
 
+    #: Maximum number of lines in the cache.
+    max_cache_lines = 1000
+
     def __init__(self, source_info: "SourceInfo") -> None:
         self.source_info = source_info
+        self._tabs_processor = TabsProcessor()
+        self._cache: "OrderedDict[Tuple[int, int, int], Transformation]" = OrderedDict()
+        self._generation = source_info.generation
 
     def apply_transformation(self, ti: TransformationInput) -> Transformation:
-        tokens = self.source_info.line_tokens[ti.lineno]
-        return Transformation(tokens[:])
+        cache = self._cache
+
+        if self._generation != self.source_info.generation:
+            self._generation = self.source_info.generation
+            cache.clear()
+
+        start, end = _get_visible_range(self.source_info, ti.lineno, ti.width)
+        key = (self.source_info.line_positions[ti.lineno], start, end)
+        try:
+            transformation = cache[key]
+        except KeyError:
+            pass
+        else:
+            cache.move_to_end(key)
+            return transformation
+
+        # (The processors that follow don't modify these fragments, so they
+        # can be used again.)
+        line = self.source_info.line_tokens[ti.lineno]
+        transformation = _create_slice_transformation(
+            line.get_fragments(start=start, end=end), start, end
+        )
+
+        if "\t" in line.text:
+            tabs = self._tabs_processor.apply_transformation(
+                TransformationInput(
+                    ti.buffer_control,
+                    ti.document,
+                    ti.lineno,
+                    ti.source_to_display,
+                    transformation.fragments,
+                    ti.width,
+                    ti.height,
+                )
+            )
+            source_to_display = transformation.source_to_display
+            display_to_source = transformation.display_to_source
+            transformation = Transformation(
+                tabs.fragments,
+                source_to_display=lambda i: tabs.source_to_display(
+                    source_to_display(i)
+                ),
+                display_to_source=lambda i: display_to_source(
+                    tabs.display_to_source(i)
+                ),
+            )
+
+        cache[key] = transformation
+        if len(cache) > self.max_cache_lines:
+            cache.popitem(last=False)
+
+        return transformation
+
+
+class _LimitedLexer(Lexer):
+    """
+    Lexer that draws lines plain when the :class:`.RenderBudget` of the source
+    is exceeded, or when highlighting is turned off.
+    """
+
+    def __init__(self, source_info: "SourceInfo", lexer: Lexer) -> None:
+        self.source_info = source_info
+        self.lexer = lexer
+
+    def lex_document(self, document: Document) -> Callable[[int], StyleAndTextTuples]:
+        source_info = self.source_info
+        budget = source_info.render_budget
+        lines = document.lines
+        get_highlighted_line = self.lexer.lex_document(document)
+
+        def get_line(lineno: int) -> StyleAndTextTuples:
+            if not source_info.highlighting:
+                return [("", lines[lineno])]
+
+            if budget.exceeded:
+                budget.deferred = True
+                return [("", lines[lineno])]
+
+            start = time.perf_counter()
+            try:
+                return get_highlighted_line(lineno)
+            finally:
+                budget.spent += time.perf_counter() - start
+
+        return get_line
+
+    def invalidation_hash(self) -> Hashable:
+        return self.lexer.invalidation_hash()
+
+
+class _LimitedProcessor(Processor):
+    """
+    Apply `processor` within the :class:`.RenderBudget` of the source. Over
+    budget, the line is passed to `fallback` instead, or left as it is.
+    """
+
+    def __init__(
+        self,
+        source_info: "SourceInfo",
+        processor: Processor,
+        fallback: Optional[Processor] = None,
+    ) -> None:
+        self.source_info = source_info
+        self.processor = processor
+        self.fallback = fallback
+
+    def apply_transformation(self, ti: TransformationInput) -> Transformation:
+        budget = self.source_info.render_budget
+
+        if budget.exceeded:
+            budget.deferred = True
+            if self.fallback is not None:
+                return self.fallback.apply_transformation(ti)
+            return Transformation(ti.fragments)
+
+        start = time.perf_counter()
+        try:
+            return self.processor.apply_transformation(ti)
+        finally:
+            budget.spent += time.perf_counter() - start
 
 
 class _Arg(ConditionalContainer):
@@ -148,6 +439,12 @@ class PagerLayout:
             input_processors=[BeforeInput(lambda: [("class:examine", " Examine: ")])],
         )
 
+        self.filter_control: BufferControl = BufferControl(
+            buffer=pager.filter_buffer,
+            lexer=SimpleLexer(style="class:examine,examine-text"),
+            input_processors=[BeforeInput(lambda: [("class:examine", " &")])],
+        )
+
         self.search_toolbar = SearchToolbar(
             vi_mode=True, search_buffer=pager.search_buffer
         )
@@ -185,7 +482,8 @@ class PagerLayout:
                         filter=~HasSearch()
                         & ~has_focus(SYSTEM_BUFFER)
                         & ~has_colon
-                        & ~has_focus("EXAMINE"),
+                        & ~has_focus("EXAMINE")
+                        & ~has_focus("FILTER"),
                     ),
                     ConditionalContainer(
                         content=Window(
@@ -199,6 +497,12 @@ class PagerLayout:
                         ),
                         filter=has_focus(pager.examine_buffer),
                     ),
+                    ConditionalContainer(
+                        content=Window(
+                            self.filter_control, height=1, style="class:examine"
+                        ),
+                        filter=has_focus(pager.filter_buffer),
+                    ),
                 ]
             ),
             floats=[
@@ -246,22 +550,61 @@ class PagerLayout:
         source_info = self.pager.source_info[self.pager.current_source]
         buffer = source_info.buffer
         document = buffer.document
-        row = document.cursor_position_row + 1
+        cursor_row = document.cursor_position_row
+        line_number = source_info.get_line_number(cursor_row)
+        row = "?" if line_number is None else str(line_number + 1)
         col = str(document.cursor_position_col + 1)
 
         if source_info.wrap_lines:
             col = "WRAP"
 
-        if self.pager.current_source.eof():
-            percentage = int(100 * row / document.line_count)
-            return [
+        percentage = source_info.get_percentage(cursor_row)
+
+        result: StyleAndTextTuples = []
+
+        index = source_info.get_index()
+        if index is not None and not index.done:
+            result.append(
+                (
+                    "class:statusbar,indexing",
+                    " Indexing %i%% " % (100 * index.progress),
+                )
+            )
+
+        view = source_info.filter
+        if view is not None:
+            # "..." while the input is being filtered.
+            result.append(
+                (
+                    "class:statusbar,filter",
+                    " &%s%s " % (view.pattern.pattern, "" if view.done else "..."),
+                )
+            )
+
+        match_index = source_info.match_index
+        if match_index is not None:
+            # "+" when there could be more matches.
+            count = "%i%s" % (match_index.count, "" if match_index.done else "+")
+            match_number = source_info.get_match_number(cursor_row)
+
+            if match_number is not None:
+                text = " match %i of %s " % (match_number, count)
+            elif count == "1":
+                text = " 1 match "
+            else:
+                text = " %s matches " % count
+            result.append(("class:statusbar,matches", text))
+
+        if percentage is not None:
+            result.append(
                 (
                     "class:statusbar,cursor-position",
                     " (%s,%s) %s%% " % (row, col, percentage),
                 )
-            ]
+            )
         else:
-            return [("class:statusbar,cursor-position", " (%s,%s) " % (row, col))]
+            result.append(("class:statusbar,cursor-position", " (%s,%s) " % (row, col)))
+        return result
 
 
 def create_buffer_window(source_info: "SourceInfo") -> Window:
@@ -270,34 +613,72 @@ def create_buffer_window(source_info: "SourceInfo") -> Window:
     """
     pager = source_info.pager
 
+    # Highlight with Pygments in the background. (And only within the render
+    # budget of the source.)
+    lexer: Optional[Lexer] = source_info.source.lexer
+    if isinstance(lexer, PygmentsLexer):
+        lexer = BackgroundLexer(source_info, lexer)
+    if lexer is not None:
+        lexer = _LimitedLexer(source_info, lexer)
+
+    @Condition
+    def has_lexer() -> bool:
+        return bool(source_info.source.lexer)
+
+    @Condition
+    def highlighting() -> bool:
+        return source_info.highlighting
+
+    @Condition
+    def highlight_search() -> bool:
+        return pager.highlight_search
+
+    @Condition
+    def wrap_lines() -> bool:
+        return source_info.wrap_lines
+
+    # (The escape processor slices the lines and expands tabs itself.)
+    slice_and_expand_tabs = merge_processors(
+        [_SliceProcessor(source_info), _TabsProcessor()]
+    )
+
     input_processors = [
         ConditionalProcessor(
-            processor=_EscapeProcessor(source_info),
-            filter=Condition(lambda: not bool(source_info.source.lexer)),
+            processor=_LimitedProcessor(
+                source_info,
+                _EscapeProcessor(source_info),
+                fallback=slice_and_expand_tabs,
+            ),
+            filter=~has_lexer & highlighting,
         ),
-        TabsProcessor(),
         ConditionalProcessor(
-            processor=HighlightSearchProcessor(),
-            filter=Condition(lambda: pager.highlight_search),
+            processor=slice_and_expand_tabs, filter=has_lexer | ~highlighting
         ),
         ConditionalProcessor(
-            processor=HighlightIncrementalSearchProcessor(),
-            filter=Condition(lambda: pager.highlight_search),
+            processor=_LimitedProcessor(source_info, HighlightSearchProcessor()),
+            filter=highlight_search & highlighting,
+        ),
+        ConditionalProcessor(
+            processor=_LimitedProcessor(
+                source_info, HighlightIncrementalSearchProcessor()
+            ),
+            filter=highlight_search & highlighting,
         ),
         HighlightSelectionProcessor(),
         HighlightMatchingBracketProcessor(),
+        ConditionalProcessor(
+            processor=_ScrollProcessor(source_info), filter=~wrap_lines
+        ),
     ]
 
-    @Condition
-    def wrap_lines() -> bool:
-        return source_info.wrap_lines
-
     return Window(
         always_hide_cursor=True,
         wrap_lines=wrap_lines,
+        # (Scrolling horizontally is done by `_ScrollProcessor`.)
+        get_horizontal_scroll=lambda window: 0,
         content=BufferControl(
             buffer=source_info.buffer,
-            lexer=source_info.source.lexer,
+            lexer=lexer,
             input_processors=input_processors,
             include_default_input_processors=False,
             preview_search=True,
@@ -2,10 +2,15 @@
 Pager implementation in Python.
 """
 import asyncio
+import multiprocessing
+import os
+import re
 import sys
-import threading
 import weakref
-from typing import Any, Dict, List, Optional, Sequence, Tuple
+from array import array
+from bisect import bisect_left, bisect_right
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Pattern, Tuple, Union, cast
 
 from prompt_toolkit.application import Application
 from prompt_toolkit.buffer import Buffer
@@ -15,51 +20,1018 @@ from prompt_toolkit.enums import EditingMode
 from prompt_toolkit.formatted_text import AnyFormattedText, StyleAndTextTuples
 from prompt_toolkit.input import Input
 from prompt_toolkit.input.defaults import create_input
+from prompt_toolkit.layout.containers import WindowRenderInfo
+from prompt_toolkit.layout.controls import BufferControl
 from prompt_toolkit.layout.layout import Layout
 from prompt_toolkit.lexers import Lexer, PygmentsLexer
 from prompt_toolkit.output import Output
+from prompt_toolkit.search import SearchDirection, SearchState
 from prompt_toolkit.styles import Style
 
+from .ansi import StyledLine
+from .follow import FileWatcher
 from .help import HELP
+from .highlight import RenderBudget
+from .index import LineIndex
 from .key_bindings import create_key_bindings
 from .layout import PagerLayout, create_buffer_window
-from .source import DummySource, FileSource, FormattedTextSource, PipeSource, Source
+from .prefetch import PrefetchPolicy
+from .reader import SourceReader, create_source_reader
+from .search import (
+    FilterView,
+    MatchIndex,
+    Search,
+    compile_filter_pattern,
+    compile_search_pattern,
+)
+from .source import (
+    DummySource,
+    FormattedTextSource,
+    LineRange,
+    MmapFileSource,
+    PipeSource,
+    SeekableSource,
+    Source,
+    create_file_source,
+)
+from .store import LineStore
 from .style import ui_style
 
 __all__ = [
     "Pager",
     "SourceInfo",
+    "Location",
 ]
 
 
+#: A location in a source: (position of the line, line number or `None` when
+#: it's unknown, column, distance between the top of the window and the
+#: cursor).
+Location = Tuple[int, Optional[int], int, int]
+
+
 class SourceInfo:
     """
     For each opened source, we keep this list of pager data.
+
+    The buffer only contains a window of the input around the visible part.
+    This window is extended when the user scrolls, and trimmed when it grows
+    beyond `max_window_lines`. For a :class:`.SeekableSource`, the lines are
+    read from the source itself. Everything that is read from other sources is
+    kept in a :class:`.LineStore`. When a filter is set, the lines are read
+    from the :class:`.FilterView` instead. (Positions are always positions in
+    the input, so locations and marks stay valid when the filter changes.)
     """
 
     _buffer_counter = 0  # Counter to generate unique buffer names.
 
+    #: Maximum number of lines in the buffer.
+    max_window_lines = 5000
+
     def __init__(self, pager: "Pager", source: Source) -> None:
         self.pager = pager
         self.source = source
 
         self.buffer = Buffer(read_only=True)
 
-        # List of lines. (Each line is a list of (token, text) tuples itself.)
-        self.line_tokens: List[StyleAndTextTuples] = [[]]
+        # Storage for the input of sources that can't be read again, and
+        # whether it contains all of the input.
+        self.store: Optional[LineStore] = None
+        self.complete = True
+        if not isinstance(source, SeekableSource):
+            self.store = LineStore(max_memory=pager.max_memory)
+            self.complete = source.eof()
+
+        # The text and styles of each line in the buffer.
+        self.line_tokens: List[StyledLine] = []
+
+        # The position of each line in the buffer, the position that follows
+        # the last line and the line number of the first line. (`None` if we
+        # don't know.)
+        self.line_positions: List[int] = [0]
+        self.window_end = 0
+        self.first_line_number: Optional[int] = 0
+
+        # Incremented when lines are read again, because the line at a
+        # position could have been changed. (For caches that are keyed by the
+        # position of a line.)
+        self.generation = 0
+
+        # Marks. (Mapping from mark name to `Location`.)
+        self.marks: Dict[str, Location] = {}
+
+        # Thread that reads the source when it's not seekable. (Created by
+        # `Pager` when input is needed.)
+        self.reader: Optional[SourceReader] = None
+
+        # The read time of `reader` that was charged to the prefetch budget.
+        self.charged_read_time = 0.0
+
+        # Jump that has to wait until enough of the input is read or indexed.
+        # ("line", line_number), ("percentage", percentage) or ("position",
+        # position), for a position that the filter didn't reach yet.
+        self.pending_jump: Optional[Tuple[str, int]] = None
+
+        # The lines that match the filter, and the size of the view that the
+        # window knows about. (See `set_filter`.)
+        self.filter: Optional[FilterView] = None
+        self._filter_size = 0
 
-        # Marks. (Mapping from mark name to (cursor position, scroll_offset).)
-        self.marks: Dict[str, Tuple[int, int]] = {}
+        # Search that runs in the background, and whether it waits for more
+        # input.
+        self.current_search: Optional[Search] = None
+        self._search_waiting = False
 
-        # `Pager` sets this flag when he starts reading the generator of this
-        # source in a coroutine.
-        self.waiting_for_input_stream = False
+        # The matches of the search pattern. (See `update_match_index`.)
+        self.match_index: Optional[MatchIndex] = None
 
         # Enable/disable line wrapping.
         self.wrap_lines = False
 
+        # First visible column, when lines are not wrapped. (The window itself
+        # doesn't scroll horizontally, see `scroll_to_cursor`.)
+        self.horizontal_scroll = 0
+
+        # Highlighting (lexing, escape sequences and search matches), and the
+        # time it may take while rendering. It's turned off when the input is
+        # too slow to highlight.
+        self.highlighting = True
+        self.render_budget = RenderBudget()
+
+        # When the buffer was evicted: the `Location` of the cursor. (See
+        # `evict`.)
+        self.evicted_location: Optional[Location] = None
+
+        # For choosing which buffer to evict. (Set by `Pager`.)
+        self.last_focused = 0
+
+        self._page_height = 40
         self.window = create_buffer_window(self)
 
+        self.load_window(0, line_number=0)
+
+    @property
+    def content(self) -> Union[SeekableSource, LineStore]:
+        "Where the lines in the buffer are read from."
+        if self.store is not None:
+            return self.store
+        return cast(SeekableSource, self.source)
+
+    @property
+    def view(self) -> Union[SeekableSource, LineStore, FilterView]:
+        "The lines that are displayed: the filter view, or all of the content."
+        if self.filter is not None:
+            return self.filter
+        return self.content
+
+    @property
+    def waiting_for_input_stream(self) -> bool:
+        "True while lines are requested that were not read yet."
+        return self.reader is not None and self.reader.busy
+
+    def close(self) -> None:
+        """
+        Stop reading and remove the temporary storage. (The source itself is
+        not closed.)
+        """
+        self.cancel_search()
+        self.update_match_index(None)
+
+        if self.filter is not None:
+            self.filter.stop()
+
+        if self.reader is not None:
+            self.reader.stop()
+            self.reader = None
+
+        if self.store is not None:
+            self.store.close()
+
+    def get_memory(self) -> int:
+        "Rough estimate of the memory (in bytes) that the buffer takes."
+        getsizeof = sys.getsizeof
+        return getsizeof(self.buffer.text) + sum(
+            getsizeof(line.text) + getsizeof(line.run_ends) + getsizeof(line.run_styles)
+            for line in self.line_tokens
+        )
+
+    def evict(self) -> None:
+        """
+        Release the lines in the buffer while the source is not displayed. The
+        `Location` of the cursor is remembered, and `restore` reads the lines
+        again: from the source (the file on disk) or from the store. Marks are
+        locations too, so they stay valid.
+        """
+        if self.evicted_location is not None:
+            return
+
+        location = self.get_location()
+        self._page_height = self._get_page_height()
+
+        # Keep the position of the cursor line, for reading ahead in the
+        # background. (`window_end = 0` keeps `add_input` from extending the
+        # window.)
+        self.line_positions = [location[0]]
+        self.line_tokens = [StyledLine("", array("I"), array("I"))]
+        self.window_end = 0
+        self.first_line_number = location[1]
+        self.generation += 1
+        self._set_text("", 0)
+        self.evicted_location = location
+
+        # The window and its control cache what was rendered. (Nothing is
+        # rendered while the source is not displayed, so these would stay.)
+        window = self.window
+        control = cast(BufferControl, window.content)
+        control._fragment_cache.clear()
+        control._last_get_processed_line = None
+        window._ui_content_cache.clear()
+        window.render_info = None
+
+    def restore(self) -> None:
+        "Read the lines of an evicted buffer again. (See `evict`.)"
+        if self.evicted_location is not None:
+            location = self.evicted_location
+            self.evicted_location = None
+            self.go_to_location(location, reload=True)
+
+    def get_line_position(self, row: int) -> int:
+        "Return the position of the line at this row of the buffer."
+        return self.line_positions[row]
+
+    def get_line_number(self, row: int) -> Optional[int]:
+        "Return the line number for this row of the buffer, if known."
+        if self.filter is not None:
+            # (The rows are not consecutive lines.)
+            return self._get_line_number_at(self.line_positions[row])
+
+        if self.first_line_number is None:
+            # Ask the index. (It could be that the index reached this point
+            # by now.)
+            index = self.get_index()
+            if index is not None:
+                position = self.line_positions[0]
+                self.first_line_number = index.get_line_number(position)
+
+        if self.first_line_number is None:
+            return None
+        return self.first_line_number + row
+
+    def _get_line_number_at(self, position: int) -> Optional[int]:
+        "Return the line number of the line at this position, if known."
+        if self.store is not None:
+            return self.store.get_line_number(position)
+
+        index = self.get_index()
+        if index is not None:
+            return index.get_line_number(position)
+        return None
+
+    def get_index(self) -> Optional[LineIndex]:
+        "Return the :class:`.LineIndex` of a seekable source."
+        if isinstance(self.source, SeekableSource):
+            return self.source.get_index()
+        return None
+
+    def scroll_to_cursor(self, width: int) -> None:
+        """
+        Scroll horizontally, if needed to make the cursor visible in a window of
+        this width. (Like the window would do.)
+        """
+        document = self.buffer.document
+        try:
+            line = self.line_tokens[document.cursor_position_row]
+        except IndexError:
+            return
+
+        column = line.get_column(document.cursor_position_col)
+        if column < self.horizontal_scroll:
+            self.horizontal_scroll = column
+        elif column >= self.horizontal_scroll + width:
+            self.horizontal_scroll = column - width + 1
+
+    def get_percentage(self, row: int) -> Optional[int]:
+        """
+        Return how far we are in the input, (measured at the end of the given
+        row). `None` if we don't know the size of the input yet.
+        """
+        if not self.complete:
+            return None
+
+        size = self.content.get_size()
+        if row + 1 < len(self.line_positions):
+            end = self.line_positions[row + 1]
+        else:
+            end = self.window_end
+
+        if size == 0:
+            return 100
+        return min(100, int(100 * end / size))
+
+    def get_location(self) -> Location:
+        "Return the `Location` of the cursor."
+        if self.evicted_location is not None:
+            return self.evicted_location
+
+        document = self.buffer.document
+        row = document.cursor_position_row
+        return (
+            self.get_line_position(row),
+            self.get_line_number(row),
+            document.cursor_position_col,
+            row - self.window.vertical_scroll,
+        )
+
+    def go_to_location(self, location: Location, reload: bool = False) -> None:
+        """
+        Move the cursor to this `Location`. (When the filter hides that line,
+        to the line of the view before it.)
+
+        :param reload: Read the lines again, even when the line is in the
+            buffer.
+        """
+        position, line_number, column, scroll_offset = location
+
+        row = bisect_left(self.line_positions, position)
+        if (
+            reload
+            or row == len(self.line_positions)
+            or self.line_positions[row] != position
+        ):
+            self.load_window(
+                position, line_number=line_number, lines_before=scroll_offset
+            )
+            row = max(0, bisect_right(self.line_positions, position) - 1)
+
+        document = self.buffer.document
+        row = max(0, min(row, document.line_count - 1))
+        self.buffer.cursor_position = document.translate_row_col_to_index(row, column)
+        self.window.vertical_scroll = max(0, row - scroll_offset)
+
+    def go_to_line(self, line_number: int) -> None:
+        """
+        Move the cursor to this line number, and put it at the top of the
+        window. For seekable sources, the position is looked up in the index.
+        Otherwise, we read input until we reach this line.
+        """
+        self.pending_jump = ("line", line_number)
+        self.resolve_pending_jump()
+
+    def go_to_percentage(self, percentage: int) -> None:
+        """
+        Move the cursor to the line that is this percentage into the input.
+        For seekable sources, that's a byte offset, so we don't need to know
+        the number of lines. Otherwise, we read the input until the end.
+        """
+        self.pending_jump = ("percentage", max(0, min(100, percentage)))
+        self.resolve_pending_jump()
+
+    def resolve_pending_jump(self) -> bool:
+        """
+        Try to execute the pending jump. Return True when there is no jump
+        pending anymore.
+        """
+        if self.pending_jump is None:
+            return True
+
+        kind, value = self.pending_jump
+        content = self.content
+
+        if kind == "percentage":
+            if not self.complete:
+                return False
+
+            position = content.get_size() * value // 100
+            self.go_to_location((content.get_line_start(position), None, 0, 0))
+        elif kind == "position":
+            view = self.filter
+            if view is not None and not view.done and view.get_size() <= value:
+                return False
+
+            self.go_to_location((value, None, 0, 0))
+        else:
+            # Inside the window?
+            if self.first_line_number is not None:
+                row = value - self.first_line_number
+                if 0 <= row < len(self.line_positions):
+                    self._go_to_row(row)
+                    self.pending_jump = None
+                    return True
+
+            if self.store is not None:
+                if value >= self.store.line_count and not self.complete:
+                    return False
+
+                value = min(value, self.store.line_count - 1)
+                line_position: Optional[int] = self.store.get_position(value)
+            else:
+                index = self.get_index()
+                if index is None:
+                    return False
+
+                line_count = index.line_count
+                if line_count is not None:
+                    value = min(value, line_count - 1)
+
+                line_position = index.get_position(value)
+
+            if line_position is None:
+                return False  # Not indexed yet.
+
+            self.go_to_location((line_position, value, 0, 0))
+
+        self.pending_jump = None
+        return True
+
+    def get_pending_jump_message(self) -> str:
+        "Progress message, while a jump is pending."
+        index = self.get_index()
+
+        if self.pending_jump is not None and self.pending_jump[0] == "position":
+            progress = self.view.get_size() / max(1, self.pending_jump[1])
+            return "Filtering... %i%%" % (100 * min(1.0, progress))
+        elif index is not None:
+            return "Indexing... %i%%" % (100 * index.progress)
+        elif self.store is not None:
+            return "Reading input... %i lines" % self.store.line_count
+        else:
+            return ""
+
+    def start_search(
+        self,
+        pattern: Pattern[str],
+        backwards: bool = False,
+        executor: Optional[Executor] = None,
+        max_pending: int = 8,
+    ) -> bool:
+        """
+        Search in the background for the first match of `pattern` after the
+        cursor line (or the last one before it), in all of the input. The
+        cursor goes to the match when it is found. Return False when the
+        content of this source can't be searched that way.
+
+        :param executor: For searching a file in parallel. (See
+            :class:`.Search`.)
+        """
+        content = self.content
+        if not isinstance(content, (MmapFileSource, LineStore)):
+            return False
+
+        self.cancel_search()
+
+        row = self.buffer.document.cursor_position_row
+        if backwards:
+            start = self.line_positions[row]
+        elif row + 1 < len(self.line_positions):
+            start = self.line_positions[row + 1]
+        else:
+            start = self.window_end
+
+        # Look in the match index first. (Backwards, only when it got to
+        # `start`. Otherwise, there could be matches after the last one that
+        # it found.)
+        match_index = self.match_index
+        if match_index is not None and _same_pattern(match_index.pattern, pattern):
+            if not backwards:
+                match = match_index.find_next(start)
+                finished = match_index.done
+            elif match_index.position >= start:
+                match = match_index.find_previous(start)
+                finished = True
+            else:
+                match = None
+                finished = False
+
+            if match is not None:
+                self._go_to_match(pattern, match)
+                return True
+
+            if finished:
+                self.pager.message = "Pattern not found"
+                return True
+
+            # (There are no matches before `match_index.position`.)
+            if not backwards:
+                start = max(start, match_index.position)
+
+        loop = asyncio.get_event_loop()
+
+        def done(search: Search) -> None:
+            "(In the search thread.)"
+            loop.call_soon_threadsafe(self._search_done, search)
+
+        self.current_search = Search(
+            content,
+            pattern,
+            start,
+            done,
+            backwards=backwards,
+            complete=self.complete,
+            executor=executor,
+            max_pending=max_pending,
+            filter_pattern=self.get_filter_pattern(),
+            match_index=self.match_index,
+        )
+        self.current_search.start()
+        return True
+
+    def update_match_index(
+        self,
+        pattern: Optional[Pattern[str]],
+        executor: Optional[Executor] = None,
+        max_pending: int = 8,
+    ) -> None:
+        """
+        Make sure that the match index contains the matches of this pattern,
+        in the lines of the filter view. (Or remove it when `pattern` is
+        `None`.)
+
+        :param executor: For searching a file in parallel. (See
+            :class:`.MatchIndex`.)
+        """
+        match_index = self.match_index
+        filter_pattern = self.get_filter_pattern()
+        if match_index is not None:
+            if (
+                pattern is not None
+                and _same_pattern(match_index.pattern, pattern)
+                and _same_pattern(match_index.filter_pattern, filter_pattern)
+            ):
+                return
+
+            match_index.stop()
+            self.match_index = None
+
+        content = self.content
+        if pattern is not None and isinstance(content, (MmapFileSource, LineStore)):
+            self.match_index = MatchIndex(
+                content,
+                pattern,
+                complete=self.complete,
+                filter_pattern=filter_pattern,
+                executor=executor,
+                max_pending=max_pending,
+            )
+            self.match_index.start()
+
+    def get_match_number(self, row: int) -> Optional[int]:
+        """
+        Return the number of the first match on this row of the buffer,
+        according to the match index, or `None` if there's no match.
+        """
+        if self.match_index is None:
+            return None
+
+        if row + 1 < len(self.line_positions):
+            end = self.line_positions[row + 1]
+        else:
+            end = self.window_end
+
+        return self.match_index.get_match_number(self.line_positions[row], end)
+
+    def cancel_search(self) -> None:
+        "Stop the search that is running in the background."
+        if self.current_search is not None:
+            self.current_search.cancel()
+            self.current_search = None
+            self._search_waiting = False
+
+    @property
+    def search_needs_input(self) -> bool:
+        "True when the search can only continue when more input is read."
+        return self._search_waiting
+
+    def get_search_message(self) -> str:
+        "Progress message, while searching."
+        search = self.current_search
+        if search is None:
+            return ""
+        elif self._search_waiting:
+            progress = "%i lines read" % cast(LineStore, self.store).line_count
+        else:
+            progress = "%i%%" % (100 * search.progress)
+
+        return "Searching... %s (press Ctrl-C to cancel)" % progress
+
+    def _search_done(self, search: Search) -> None:
+        "Called in the event loop when the search thread is done."
+        if search is not self.current_search:
+            return  # Cancelled.
+
+        if search.match is not None:
+            self.current_search = None
+            self.pager.message = None
+            self._go_to_match(search.pattern, search.match)
+        elif not search.backwards and not self.complete:
+            # Continue when more input was read. (See `add_input`.)
+            self._search_waiting = True
+        else:
+            self.current_search = None
+            self.pager.message = "Pattern not found"
+
+        self.pager.application.invalidate()
+
+    def _go_to_match(self, pattern: Pattern[str], match: int) -> None:
+        "Move the cursor to the match of `pattern` at this position."
+        position = self.content.get_line_start(match)
+        self.go_to_location((position, self._get_line_number_at(position), 0, 0))
+
+        # Put the cursor on the match.
+        row = self.buffer.document.cursor_position_row
+        m = pattern.search(self.line_tokens[row].text)
+        if m:
+            self.buffer.cursor_position += m.start()
+
+    def _go_to_row(self, row: int) -> None:
+        "Move the cursor to this row of the buffer, at the top of the window."
+        document = self.buffer.document
+        row = max(0, min(row, document.line_count - 1))
+        self.buffer.cursor_position = document.translate_row_col_to_index(row, 0)
+        self.window.vertical_scroll = row
+
+    def go_to_end(self) -> None:
+        """
+        Move the cursor to the last line. We jump straight to the end of the
+        input (or what we have read so far). The content before the last page
+        is only read when the user scrolls up.
+        """
+        content = self.content
+        index = self.get_index()
+        line_number = None
+
+        if index is not None and index.line_count is not None:
+            line_number = index.line_count - 1
+
+        self.go_to_location(
+            (
+                content.get_line_start(content.get_size()),
+                line_number,
+                0,
+                self._get_page_height() - 1,
+            )
+        )
+
+    def get_read_ahead(self, row: int) -> Tuple[int, int]:
+        """
+        For sources that are not seekable: return the number of lines and
+        characters that were read beyond this row of the buffer.
+        """
+        store = cast(LineStore, self.store)
+        row = max(0, min(row, len(self.line_positions) - 1))
+        line_number = self.get_line_number(row) or 0
+
+        return (
+            store.line_count - 1 - line_number,
+            store.size - self.line_positions[row],
+        )
+
+    def get_last_visible_row(self) -> int:
+        "Return the last row of the buffer that is (or would be) visible."
+        return self.window.vertical_scroll + self._get_page_height() - 1
+
+    def add_input(self, fragments: StyleAndTextTuples, final: bool = False) -> None:
+        """
+        Add fragments that were read from a source that is not seekable to the
+        store. When the window contains the end of the input, the new lines
+        are added to the buffer.
+
+        :param final: True when these are the last fragments of the input.
+        """
+        store = cast(LineStore, self.store)
+        size = store.get_size()
+        store.append(fragments)
+        self.complete = final
+
+        if self.filter is not None:
+            self.filter.complete = final
+            self.filter.start()
+        else:
+            self._extend_window(size)
+
+        if self.match_index is not None:
+            self.match_index.complete = final
+            self.match_index.start()
+
+        # Continue a search that was waiting for this.
+        if self.current_search is not None and self._search_waiting:
+            self._search_waiting = False
+            self.current_search.complete = final
+            self.current_search.start()
+
+    def check_for_changes(self) -> bool:
+        """
+        For a :class:`.SeekableSource`: check whether the input was appended
+        to, truncated or replaced, and update the buffer. Return True when the
+        buffer changed.
+        """
+        if self.store is not None:
+            return False
+
+        source = cast(SeekableSource, self.source)
+        size = source.get_size()
+        change = source.update()
+
+        if change == "replaced":
+            self.marks.clear()
+            self.pending_jump = None
+            self.cancel_search()
+            self.update_match_index(None)
+
+            if self.filter is not None:
+                self.filter.stop()
+                self.filter = self._create_filter(self.filter.pattern)
+            self.load_window(0, line_number=0)
+            return True
+        elif change == "grown":
+            if self.match_index is not None:
+                self.match_index.start()
+
+            if self.filter is not None:
+                self.filter.start()
+                return False
+            return self._extend_window(size)
+        else:
+            return False
+
+    def get_filter_pattern(self) -> Optional[Pattern[str]]:
+        "The pattern of the filter, or `None` when all lines are displayed."
+        if self.filter is None:
+            return None
+        return self.filter.pattern
+
+    def set_filter(self, pattern: Optional[Pattern[str]]) -> bool:
+        """
+        Display only the lines that match `pattern`, or all lines again when
+        it's `None`. The cursor stays on the same line of the input (or goes
+        to the closest line of the view before it), without reading the input
+        again. Return False when the content of this source can't be filtered.
+        """
+        if pattern is not None and not isinstance(
+            self.content, (MmapFileSource, LineStore)
+        ):
+            return False
+
+        location = self.get_location()
+        self.cancel_search()
+
+        if self.filter is not None:
+            self.filter.stop()
+            self.filter = None
+
+        if pattern is not None:
+            self.filter = self._create_filter(pattern)
+
+        if self.evicted_location is not None:
+            self.evicted_location = location
+            return True
+
+        self.go_to_location(location, reload=True)
+
+        # Go to the same position again when the filter reached it.
+        if self.filter is not None:
+            self.pending_jump = ("position", location[0])
+            self.resolve_pending_jump()
+        return True
+
+    def _get_view_size(self) -> int:
+        """
+        The size of the view, as far as the window knows. (The filter view
+        grows in another thread. The window is updated in `_filter_updated`.)
+        """
+        if self.filter is not None:
+            return self._filter_size
+        return self.content.get_size()
+
+    def _create_filter(self, pattern: Pattern[str]) -> FilterView:
+        "Create and start the filter view for this pattern."
+        content = self.content
+        assert isinstance(content, (MmapFileSource, LineStore))
+        loop = asyncio.get_event_loop()
+
+        def wakeup() -> None:
+            "(In the filter thread.)"
+            loop.call_soon_threadsafe(self._filter_updated, view)
+
+        view = FilterView(content, pattern, wakeup, complete=self.complete)
+        view.start()
+        self._filter_size = 0
+        return view
+
+    def filter_needs_input(self, info: WindowRenderInfo) -> bool:
+        """
+        True when the window reached the end of the filter view, and the view
+        can only be extended by reading more input.
+        """
+        view = self.filter
+        if view is None or self.complete or view.busy:
+            return False
+
+        lines_below_bottom = len(self.line_positions) - 1 - info.last_visible_line()
+        return (
+            lines_below_bottom < info.window_height * 2
+            and self.window_end > view.get_size()
+        )
+
+    def _filter_updated(self, view: FilterView) -> None:
+        "Called in the event loop when the filter thread found lines."
+        if view is not self.filter:
+            return  # Replaced in the meantime.
+
+        view.acknowledge()
+        size = self._filter_size
+        self._filter_size = view.get_size()
+        self._extend_window(size)
+
+        if self.pager.forward_forever and self is self.pager.current_source_info:
+            self.go_to_end()
+
+        self.pager.application.invalidate()
+
+    def _extend_window(self, size: int) -> bool:
+        """
+        The input grew beyond `size`. When the window reached the end of the
+        input, read the new lines into the buffer.
+        """
+        if self.window_end > size:
+            # The last line of the window could have been extended, so replace
+            # it.
+            content = self.view
+            b = self.buffer
+            text = b.text
+            position = self.line_positions.pop()
+            self.line_tokens.pop()
+            self.generation += 1
+
+            line_range = content.read_lines(position, self._get_page_height() * 2)
+            self.line_positions.extend(line_range.positions)
+            self.line_tokens.extend(line_range.lines)
+            self.window_end = line_range.end
+
+            self._set_text(
+                text[: text.rfind("\n") + 1] + _get_text(line_range.lines),
+                b.cursor_position,
+            )
+            return True
+
+        return False
+
+    def load_window(
+        self, position: int, line_number: Optional[int] = None, lines_before: int = 0
+    ) -> None:
+        """
+        Replace the content of the buffer by the lines around `position`, and
+        put the cursor at `position`.
+        """
+        view = self.view
+        size = view.get_size()
+        position = view.get_line_start(min(position, size))
+
+        if self.filter is not None:
+            self._filter_size = size
+
+        before = view.read_lines_before(position, lines_before)
+        after = view.read_lines(position, self._get_page_height() * 2)
+
+        if line_number is None and self.store is not None:
+            line_number = self.store.get_line_number(position)
+
+        if self.filter is not None:
+            self.first_line_number = None  # (See `get_line_number`.)
+        elif line_number is not None:
+            self.first_line_number = line_number - len(before.positions)
+        elif not before.positions and position == 0:
+            self.first_line_number = 0
+        else:
+            self.first_line_number = None
+
+        self.line_positions = before.positions + after.positions
+        self.line_tokens = before.lines + after.lines
+        self.window_end = after.end
+        self.generation += 1
+
+        if before.positions:
+            cursor_position = len(_get_text(before.lines)) + 1
+        else:
+            cursor_position = 0
+
+        self._set_text(_get_text(self.line_tokens), cursor_position)
+        self.window.vertical_scroll = 0
+
+    def update_window(self, info: WindowRenderInfo) -> bool:
+        """
+        Make sure that the lines around the visible part are in the buffer.
+        Return True when the buffer changed.
+        """
+        view = self.view
+        height = info.window_height
+        changed = False
+
+        # Make sure to preload at least 2x the amount of lines on a page
+        # below and one page above.
+        lines_below_bottom = len(self.line_positions) - 1 - info.last_visible_line()
+
+        if lines_below_bottom < height * 2 and self.window_end <= self._get_view_size():
+            line_range = view.read_lines(
+                self.window_end, height * 2 - lines_below_bottom
+            )
+            self._append_lines(line_range)
+            changed = bool(line_range.positions)
+
+        lines_above_top = info.first_visible_line()
+
+        if lines_above_top < height and self.line_positions[0] > 0:
+            # (For a filter view, there could be no lines before the first.)
+            line_range = view.read_lines_before(
+                self.line_positions[0], height * 2 - lines_above_top
+            )
+            self._prepend_lines(line_range)
+            changed = changed or bool(line_range.positions)
+
+        if len(self.line_positions) > self.max_window_lines:
+            self._trim_window()
+            changed = True
+
+        return changed
+
+    def _get_page_height(self) -> int:
+        info = self.window.render_info
+        if info:
+            return info.window_height
+        return self._page_height
+
+    def _set_text(self, text: str, cursor_position: int) -> None:
+        self.buffer.set_document(
+            Document(text, min(cursor_position, len(text))), bypass_readonly=True
+        )
+
+    def _append_lines(self, line_range: LineRange) -> None:
+        if line_range.positions:
+            b = self.buffer
+            self.line_positions.extend(line_range.positions)
+            self.line_tokens.extend(line_range.lines)
+            self.window_end = line_range.end
+
+            self._set_text(
+                b.text + "\n" + _get_text(line_range.lines), b.cursor_position
+            )
+
+    def _prepend_lines(self, line_range: LineRange) -> None:
+        if line_range.positions:
+            b = self.buffer
+            prefix = _get_text(line_range.lines) + "\n"
+            count = len(line_range.positions)
+
+            self.line_positions[:0] = line_range.positions
+            self.line_tokens[:0] = line_range.lines
+            if self.first_line_number is not None:
+                self.first_line_number -= count
+
+            # Keep the cursor and the visible lines where they are.
+            self._set_text(prefix + b.text, b.cursor_position + len(prefix))
+            self.window.vertical_scroll += count
+
+    def _trim_window(self) -> None:
+        """
+        Remove lines from the buffer that are far away from the cursor.
+        """
+        b = self.buffer
+        document = b.document
+        line_count = len(self.line_positions)
+        row = document.cursor_position_row
+        keep = self.max_window_lines * 3 // 8
+
+        # Keep the lines in [top, bottom).
+        top = max(0, row - keep)
+        bottom = min(line_count, row + keep + 1)
+
+        start_index = document.translate_row_col_to_index(top, 0)
+        if bottom < line_count:
+            end_index = document.translate_row_col_to_index(bottom, 0) - 1
+            self.window_end = self.line_positions[bottom]
+        else:
+            end_index = len(b.text)
+
+        self.line_positions = self.line_positions[top:bottom]
+        self.line_tokens = self.line_tokens[top:bottom]
+        if self.first_line_number is not None:
+            self.first_line_number += top
+
+        self._set_text(b.text[start_index:end_index], b.cursor_position - start_index)
+        self.window.vertical_scroll = max(0, self.window.vertical_scroll - top)
+
+
+def _same_pattern(
+    pattern1: Optional[Pattern[str]], pattern2: Optional[Pattern[str]]
+) -> bool:
+    if pattern1 is None or pattern2 is None:
+        return pattern1 is pattern2
+    return pattern1.pattern == pattern2.pattern and pattern1.flags == pattern2.flags
+
+
+def _get_text(lines: List[StyledLine]) -> str:
+    "Turn a list of lines into text."
+    return "\n".join(line.text for line in lines)
+
 
 class Pager:
     """
@@ -75,6 +1047,25 @@ class Pager:
     :param vi_mode: Enable Vi key bindings.
     :param style: Prompt_toolkit `Style` instance.
     :param search_text: `None` or the search string that is highlighted.
+    :param max_memory: Memory budget (in bytes) for the input of each source
+        that is not seekable, like a pipe. Beyond that, the input is moved to
+        a temporary file. (`None` for no limit.)
+    :param max_fps: Maximum number of times per second that new input from a
+        pipe is added to the buffer. Input that arrives in between is added at
+        once. Lower values give more throughput, higher values less latency.
+        (`None` for no limit. The `pypager` command uses 30.)
+    :param prefetch_policy: :class:`.PrefetchPolicy` that decides how much
+        input is read ahead.
+    :param max_buffer_memory: Memory budget (in bytes) for the buffers of all
+        sources together. When switching sources goes over budget, the buffers
+        of the least recently displayed sources are released. They are read
+        again when the source is displayed. (`None` for no limit. The `pypager`
+        command uses 64 MiB.)
+    :param search_processes: Number of processes that search big files in
+        parallel. (`None` for one per CPU, 1 to search in a thread.)
+    :param follow_interval: In 'forward forever' mode, check the displayed
+        file for changes every this many seconds. (Changes are seen right away
+        when inotify is available.)
     """
 
     def __init__(
@@ -86,6 +1077,12 @@ class Pager:
         titlebar_tokens: Optional[AnyFormattedText] = None,
         input: Optional[Input] = None,
         output: Optional[Output] = None,
+        max_memory: Optional[int] = None,
+        max_fps: Optional[float] = None,
+        prefetch_policy: Optional[PrefetchPolicy] = None,
+        max_buffer_memory: Optional[int] = None,
+        search_processes: Optional[int] = None,
+        follow_interval: float = 1.0,
     ) -> None:
         self.sources: List[Source] = []
         self.current_source_index = 0  # Index in `self.sources`.
@@ -96,13 +1093,43 @@ class Pager:
         self.search_text = search_text
         self.display_titlebar = bool(titlebar_tokens)
         self.titlebar_tokens = titlebar_tokens or []
+        self.max_memory = max_memory
+        self.max_fps = max_fps
+        self.max_buffer_memory = max_buffer_memory
+        self._focus_counter = 0
+
+        # Processes for searching big files. (Started when needed.)
+        self.search_processes = search_processes or os.cpu_count() or 1
+        self._search_executor: Optional[Executor] = None
+
+        # Event loop time of the last time that input was added to a buffer.
+        self._last_input_time = 0.0
+
+        # Reading ahead in the background, when the user is idle.
+        self.prefetch_policy = prefetch_policy or PrefetchPolicy()
+        self.prefetch_budget = self.prefetch_policy.create_budget()
+        self._prefetch_handle: Optional[asyncio.TimerHandle] = None
+        self._last_prefetch_time: Optional[float] = None
+        self._last_activity_time = 0.0
 
         self._dummy_source = DummySource()
 
+        # Sources that were opened by the pager, and should be closed by it.
+        self._opened_sources: List[Source] = []
+
+        # True when a redraw is scheduled to update the progress of a task in
+        # the background (like indexing).
+        self._refresh_scheduled = False
+
         # When this is True, always make sure that the cursor goes to the
         # bottom of the visible content. This is similar to 'tail -f'.
         self.forward_forever = False
 
+        # Watches the displayed file in 'forward forever' mode.
+        self.follow_interval = follow_interval
+        self._file_watcher: Optional[FileWatcher] = None
+        self._followed_source: Optional[Source] = None
+
         # Status information for all sources. Source -> SourceInfo.
         # (Remember this info as long as the Source object exists.)
         self.source_info: weakref.WeakKeyDictionary[
@@ -124,6 +1151,16 @@ class Pager:
             multiline=False,
         )
 
+        def set_filter(buff: Buffer) -> bool:
+            self.set_filter(buff.text)
+            self.application.layout.focus(self.current_source_info.window)
+            return False
+
+        # Buffer for the '&' (filter) input.
+        self.filter_buffer = Buffer(
+            name="FILTER", accept_handler=set_filter, multiline=False
+        )
+
         # Search buffer.
         self.search_buffer = Buffer(multiline=False)
 
@@ -145,29 +1182,53 @@ class Pager:
             key_bindings=bindings,
             style=style or Style.from_dict(ui_style),
             mouse_support=True,
+            before_render=self._before_render,
             after_render=self._after_render,
             full_screen=True,
         )
 
-        # Hide message when a key is pressed.
+        # Hide message and cancel pending jumps when a key is pressed.
         def key_pressed(_: object) -> None:
             self.message = None
 
+            # A key cancels a jump that is waiting for the input.
+            source_info = self.source_info.get(self.current_source)
+            if source_info is not None:
+                source_info.pending_jump = None
+            self._last_activity_time = asyncio.get_event_loop().time()
+
         self.application.key_processor.before_key_press += key_pressed
 
         if vi_mode:
             self.application.editing_mode = EditingMode.VI
 
     @classmethod
-    def from_pipe(cls, lexer: Optional[Lexer] = None) -> "Pager":
+    def from_pipe(
+        cls,
+        lexer: Optional[Lexer] = None,
+        read_size: int = 4096,
+        max_read_size: int = 1024 * 1024,
+        max_memory: Optional[int] = None,
+        **kwargs: Any,
+    ) -> "Pager":
         """
         Create a pager from another process that pipes in our stdin.
+
+        :param read_size: Initial number of bytes per read from stdin.
+        :param max_read_size: Maximum number of bytes per read from stdin.
+        :param max_memory: Memory budget for the input. (See :class:`.Pager`.)
+
+        Other keyword arguments are passed to :class:`.Pager`.
         """
         assert not sys.stdin.isatty()
-        self = cls()
+        self = cls(max_memory=max_memory, **kwargs)
         self.add_source(
             PipeSource(
-                fileno=sys.stdin.fileno(), lexer=lexer, encoding=sys.stdin.encoding
+                fileno=sys.stdin.fileno(),
+                lexer=lexer,
+                encoding=sys.stdin.encoding,
+                read_size=read_size,
+                max_read_size=max_read_size,
             )
         )
         return self
@@ -194,10 +1255,11 @@ class Pager:
         lexer = PygmentsLexer.from_filename(filename, sync_from_start=False)
 
         try:
-            source = FileSource(filename, lexer=lexer)
+            source = create_file_source(filename, lexer=lexer)
         except IOError as e:
             self.message = "{}".format(e)
         else:
+            self._opened_sources.append(source)
             self.add_source(source)
 
     def add_source(self, source: Source) -> SourceInfo:
@@ -211,7 +1273,7 @@ class Pager:
 
         # Focus
         self.current_source_index = len(self.sources) - 1
-        self.application.layout.focus(source_info.window)
+        self._focus_current_source()
 
         return source_info
 
@@ -228,19 +1290,62 @@ class Pager:
 
             # Remove the last source.
             self.sources.remove(current_source_index)
+            self.source_info[current_source_index].close()
+
+            if current_source_index in self._opened_sources:
+                self._opened_sources.remove(current_source_index)
+                current_source_index.close()
         else:
             self.message = "Can't remove the last buffer."
 
     def focus_previous_source(self) -> None:
         self.current_source_index = (self.current_source_index - 1) % len(self.sources)
-        self.application.layout.focus(self.current_source_info.window)
+        self._focus_current_source()
         self.in_colon_mode = False
 
     def focus_next_source(self) -> None:
         self.current_source_index = (self.current_source_index + 1) % len(self.sources)
-        self.application.layout.focus(self.current_source_info.window)
+        self._focus_current_source()
         self.in_colon_mode = False
 
+    def _focus_current_source(self) -> None:
+        """
+        Focus the window of the current source, and read its buffer again if
+        it was evicted.
+        """
+        source_info = self.current_source_info
+        source_info.restore()
+
+        self._focus_counter += 1
+        source_info.last_focused = self._focus_counter
+
+        self.application.layout.focus(source_info.window)
+        self._evict_buffers()
+
+    def _evict_buffers(self) -> None:
+        """
+        Evict the buffers of the least recently displayed sources, until all
+        buffers together fit in `max_buffer_memory`.
+        """
+        if self.max_buffer_memory is None:
+            return
+
+        current_source_info = self.current_source_info
+        source_infos = sorted(
+            (self.source_info[source] for source in self.sources),
+            key=lambda source_info: source_info.last_focused,
+        )
+        memory = {source_info: source_info.get_memory() for source_info in source_infos}
+        total = sum(memory.values())
+
+        for source_info in source_infos:
+            if total <= self.max_buffer_memory:
+                break
+
+            if source_info is not current_source_info:
+                source_info.evict()
+                total -= memory[source_info] - source_info.get_memory()
+
     def display_help(self) -> None:
         """
         Display help text.
@@ -258,6 +1363,15 @@ class Pager:
             self.remove_current_source()
             self.displaying_help = False
 
+    def _before_render(self, app: Application[Any]) -> None:
+        source_info = self.source_info.get(self.current_source)
+        if source_info is not None:
+            source_info.render_budget.start_frame()
+
+            info = source_info.window.render_info
+            if info is not None and not source_info.wrap_lines:
+                source_info.scroll_to_cursor(info.window_width)
+
     def _after_render(self, app: Application[Any]) -> None:
         """
         Each time when the rendering is done, we should see whether we need to
@@ -269,70 +1383,374 @@ class Pager:
         info = self.layout.dynamic_body.get_render_info()
         source = self.current_source
         source_info = self.source_info[source]
-        b = source_info.buffer
-        line_tokens = source_info.line_tokens
+
+        # Retry a jump that is waiting for input or for the index.
+        if source_info.pending_jump is not None:
+            if source_info.resolve_pending_jump():
+                self.message = None
+            else:
+                self.message = source_info.get_pending_jump_message()
+                self._schedule_refresh()
+            self.application.invalidate()
+
+        # Show the progress of a search in the background.
+        if source_info.current_search is not None:
+            self.message = source_info.get_search_message()
+            self._schedule_refresh()
+
+        # Count the matches of the search text. (Redraw now and then to show
+        # the count.)
+        pattern = self.get_search_pattern()
+        if pattern is None:
+            source_info.update_match_index(None)
+        else:
+            source_info.update_match_index(
+                pattern,
+                executor=self._get_search_executor(source),
+                max_pending=2 * self.search_processes,
+            )
+        if source_info.match_index is not None and source_info.match_index.busy:
+            self._schedule_refresh()
+
+        if info and source_info.update_window(info):
+            self.application.invalidate()
+
+        # Highlight the lines that were drawn plain, because it took too long,
+        # in the next frame. Unless that keeps happening.
+        budget = source_info.render_budget
+        if budget.end_frame():
+            if budget.exhausted:
+                source_info.highlighting = False
+                self.message = "Highlighting is turned off: the input is too slow"
+            self.application.invalidate()
+
+        self._schedule_prefetch()
+        self._update_file_watcher(source)
+
+        # Seekable sources are read synchronously, only around the visible
+        # part.
+        if isinstance(source, SeekableSource):
+            # Start indexing the displayed source. Redraw now and then to show
+            # the progress.
+            index = source.get_index()
+            if index is not None and not index.done:
+                self._schedule_refresh()
+
+            if self.forward_forever:
+                source_info.buffer.cursor_position = len(source_info.buffer.text)
+            return
+
+        store = cast(LineStore, source_info.store)
+
+        if not source_info.complete and info:
+            lines = self.prefetch_policy.get_lines_wanted(
+                source_info,
+                info.last_visible_line(),
+                info.window_height,
+                focused=True,
+                idle=False,
+            )
+
+            # Read more when a jump is waiting for it. In 'forward forever'
+            # mode, we want to reach the end of the input as fast as possible.
+            if source_info.pending_jump:
+                kind, value = source_info.pending_jump
+                if kind == "line":
+                    lines += max(1, value - store.line_count)
+                elif kind == "percentage":
+                    lines = sys.maxsize
+
+            # Read more when the filter view has to be extended.
+            if source_info.filter_needs_input(info):
+                lines = max(lines, info.window_height * 10)
+
+            if self.forward_forever or source_info.search_needs_input:
+                lines = sys.maxsize
+
+            if lines > 0:
+                self._read_input(source_info, lines)
+
+    @property
+    def search_state(self) -> SearchState:
+        "The state of the search. (The same for all sources.)"
+        return self.layout.search_toolbar.control.searcher_search_state
+
+    def get_search_pattern(self) -> Optional[Pattern[str]]:
+        "The compiled search text, or `None` when there is no search."
+        search_state = self.search_state
+        if not search_state.text:
+            return None
+        return compile_search_pattern(search_state.text, search_state.ignore_case())
+
+    def search(self, reverse: bool = False) -> None:
+        """
+        Search for the search text in all of the input of the current source,
+        in the direction of the last search. (Or in the other direction, when
+        `reverse` is True.)
+        """
+        search_state = self.search_state
+        pattern = self.get_search_pattern()
+        if pattern is None:
+            self.message = "No previous search"
+            return
+
+        source_info = self.current_source_info
+        source = source_info.source
+        backwards = (search_state.direction == SearchDirection.BACKWARD) != reverse
+        # Search big files in parallel.
+        executor = self._get_search_executor(source)
+        source_info.update_match_index(
+            pattern, executor=executor, max_pending=2 * self.search_processes
+        )
+
+        if not source_info.start_search(
+            pattern,
+            backwards=backwards,
+            executor=executor,
+            max_pending=2 * self.search_processes,
+        ):
+            # Only search what's in the buffer.
+            source_info.buffer.apply_search(
+                ~search_state if reverse else search_state,
+                include_current_position=False,
+            )
+
+    def set_filter(self, text: str) -> None:
+        """
+        Display only the lines of the current source that match this regular
+        expression. (Or all lines, when `text` is empty.)
+        """
+        pattern = None
+        if text:
+            try:
+                pattern = compile_filter_pattern(text, self.search_state.ignore_case())
+            except re.error as e:
+                self.message = "Invalid pattern: %s" % e
+                return
+
+        if not self.current_source_info.set_filter(pattern):
+            self.message = "This input can't be filtered"
+
+    def _get_search_executor(self, source: Source) -> Optional[Executor]:
+        """
+        Return the executor for searching this source in parallel, if it's a
+        big file and we have processes.
+        """
+        if self.search_processes <= 1:
+            return None
+
+        if (
+            not isinstance(source, MmapFileSource)
+            or source.get_size() < Search.parallel_threshold
+        ):
+            return None
+
+        # (Python 3.6 can't create the pool with the "spawn" method, see below.)
+        if sys.version_info < (3, 7):
+            return None
+
+        if self._search_executor is None:
+            # (Spawn, rather than fork: the reader and index threads could hold
+            # locks.)
+            self._search_executor = ProcessPoolExecutor(
+                self.search_processes, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._search_executor
+
+    def _update_file_watcher(self, source: Source) -> None:
+        """
+        In 'forward forever' mode, watch the displayed file for changes.
+        """
+        follow = self.forward_forever and isinstance(source, MmapFileSource)
+
+        if self._file_watcher is not None:
+            if follow and source is self._followed_source:
+                return
+
+            self._file_watcher.stop()
+            self._file_watcher = None
+            self._followed_source = None
+
+        if follow:
+            source_info = self.source_info[source]
+
+            def changed() -> None:
+                self._file_changed(source_info)
+
+            self._file_watcher = FileWatcher(
+                cast(MmapFileSource, source).filename, changed, self.follow_interval
+            )
+            self._file_watcher.start()
+            self._followed_source = source
+
+            # It could have changed before we started watching.
+            changed()
+
+    def _file_changed(self, source_info: SourceInfo) -> None:
+        "Called when the followed file could have been changed."
+        if source_info.check_for_changes():
+            if self.forward_forever:
+                source_info.go_to_end()
+            self.application.invalidate()
+
+    def _schedule_prefetch(self) -> None:
+        """
+        Read ahead in the background, once the user has been idle for a
+        while.
+        """
+        if self._prefetch_handle is None:
+            self._prefetch_handle = asyncio.get_event_loop().call_later(
+                self.prefetch_policy.idle_delay, self._prefetch
+            )
+
+    def _prefetch(self) -> None:
+        """
+        (Called when idle.) Ask the readers of all sources for the lines that
+        the prefetch policy wants.
+        """
+        self._prefetch_handle = None
+        policy = self.prefetch_policy
+        loop = asyncio.get_event_loop()
+
+        # Not idle yet? Try again later.
+        idle_time = loop.time() - self._last_activity_time
+        if idle_time < policy.idle_delay:
+            self._prefetch_handle = loop.call_later(
+                policy.idle_delay - idle_time, self._prefetch
+            )
+            return
+
+        # Start a round of the budget: charge every source for what was read
+        # ahead, and for the time that its reader spent reading.
+        now = loop.time()
+        budget = self.prefetch_budget
+        if self._last_prefetch_time is not None:
+            budget.start_round(now - self._last_prefetch_time)
+        self._last_prefetch_time = now
+
+        for source in self.sources:
+            source_info = self.source_info[source]
+            if source_info.store is None:
+                continue
+
+            _, size = source_info.get_read_ahead(source_info.get_last_visible_row())
+            read_time = 0.0
+            if source_info.reader is not None:
+                read_time = source_info.reader.read_time - source_info.charged_read_time
+                source_info.charged_read_time = source_info.reader.read_time
+
+            budget.charge(source, memory=size, read_time=read_time)
+
+        # Start with the displayed source.
+        current_source = self.current_source
+        requested = False
+        sources = sorted(self.sources, key=lambda source: source is not current_source)
+
+        for source in sources:
+            source_info = self.source_info[source]
+            if source_info.store is None or source_info.complete:
+                continue  # Nothing to read.
+
+            lines = policy.get_lines_wanted(
+                source_info,
+                source_info.get_last_visible_row(),
+                source_info._get_page_height(),
+                focused=source is current_source,
+                idle=True,
+                budget=budget,
+            )
+            if lines > 0:
+                self._read_input(source_info, lines)
+                requested = True
+
+        # Check again after the readers had some time, or when the read time
+        # has been paid back.
+        if requested or not budget.has_read_time:
+            self._schedule_prefetch()
+
+    def _read_input(self, source_info: SourceInfo, lines: int) -> None:
+        """
+        Ask the reader of this source for (at least) this many lines.
+        """
+        if source_info.reader is None:
+            loop = asyncio.get_event_loop()
+
+            def wakeup() -> None:
+                "(Possibly in the reader thread.)"
+                loop.call_soon_threadsafe(self._schedule_receive_input, source_info)
+
+            source_info.reader = create_source_reader(source_info.source, wakeup)
+            source_info.charged_read_time = 0.0
+
+        source_info.reader.request(lines)
+
+    def _schedule_receive_input(self, source_info: SourceInfo) -> None:
+        """
+        Receive the input of this source now, or when the next frame is due.
+        (Everything that arrives in between is added at once.)
+        """
         loop = asyncio.get_event_loop()
+        delay = 0.0
+
+        if self.max_fps:
+            delay = self._last_input_time + 1.0 / self.max_fps - loop.time()
 
-        if not source_info.waiting_for_input_stream and not source.eof() and info:
-            lines_below_bottom = info.ui_content.line_count - info.last_visible_line()
-
-            # Make sure to preload at least 2x the amount of lines on a page.
-            if lines_below_bottom < info.window_height * 2 or self.forward_forever:
-                # Lines to be loaded.
-                lines = [info.window_height * 2 - lines_below_bottom]  # nonlocal
-
-                def handle_content(tokens: StyleAndTextTuples) -> List[str]:
-                    """Handle tokens, update `line_tokens`, decrease
-                    line count and return list of characters."""
-                    data = []
-                    for token_char in tokens:
-                        char = token_char[1]
-                        if char == "\n":
-                            line_tokens.append([])
-
-                            # Decrease line count.
-                            lines[0] -= 1
-                        else:
-                            line_tokens[-1].append(token_char)
-                        data.append(char)
-                    return data
-
-                def insert_text(list_of_fragments: Sequence[str]) -> None:
-                    document = Document(
-                        b.text + "".join(list_of_fragments), b.cursor_position
-                    )
-                    b.set_document(document, bypass_readonly=True)
-
-                    if self.forward_forever:
-                        b.cursor_position = len(b.text)
-
-                    # Schedule redraw.
-                    self.application.invalidate()
-
-                    source_info.waiting_for_input_stream = False
-
-                def receive_content_from_generator() -> None:
-                    "(in executor) Read data from generator."
-                    # Call `read_chunk` as long as we need more lines.
-                    while lines[0] > 0 and not source.eof():
-                        tokens = source.read_chunk()
-                        data = handle_content(tokens)
-                        loop.call_soon(insert_text, data)
-
-                # Set 'waiting_for_input_stream' and render.
-                source_info.waiting_for_input_stream = True
+        if delay > 0:
+            loop.call_later(delay, self._receive_input, source_info)
+        else:
+            self._receive_input(source_info)
+
+    def _receive_input(self, source_info: SourceInfo) -> None:
+        """
+        Add the input that was queued by the reader of this source, as one
+        update of the buffer.
+        """
+        if source_info.reader is None:
+            return  # Closed in the meantime.
+
+        chunks = source_info.reader.receive()
+        if not chunks:
+            return
+
+        tokens: StyleAndTextTuples = []
+        final = False
+
+        for chunk, final in chunks:
+            tokens.extend(chunk)
+
+        source_info.add_input(tokens, final=final)
+        self._last_input_time = asyncio.get_event_loop().time()
+
+        # (Sources in the background are read ahead too.)
+        if source_info is not self.current_source_info:
+            return
+
+        if self.forward_forever:
+            source_info.go_to_end()
+
+        if source_info.pending_jump and source_info.resolve_pending_jump():
+            self.message = None
+
+        # Schedule redraw.
+        self.application.invalidate()
+
+    def _schedule_refresh(self, delay: float = 0.5) -> None:
+        """
+        Redraw after a delay, to show the progress of a background task.
+        """
+        if not self._refresh_scheduled:
+            self._refresh_scheduled = True
+
+            def refresh() -> None:
+                self._refresh_scheduled = False
                 self.application.invalidate()
 
-                # Execute receive_content_from_generator in thread.
-                # (Don't use 'run_in_executor', because we need a daemon.
-                t = threading.Thread(target=receive_content_from_generator)
-                t.daemon = True
-                t.start()
+            asyncio.get_event_loop().call_later(delay, refresh)
 
     def _before_run(self) -> None:
         # Set search highlighting.
         if self.search_text:
-            self.application.current_search_state.text = self.search_text
+            self.search_state.text = self.search_text
 
     def run(self) -> None:
         """
@@ -342,8 +1760,7 @@ class Pager:
             self._before_run()
             return self.application.run()
         finally:
-            # XXX: Close all sources which are opened by the pager itself.
-            pass
+            self._close()
 
     async def run_async(self) -> None:
         """
@@ -353,5 +1770,29 @@ class Pager:
             self._before_run()
             return await self.application.run_async()
         finally:
-            # XXX: Close all sources which are opened by the pager itself.
-            pass
+            self._close()
+
+    def _close(self) -> None:
+        """
+        Stop all reader threads, and close the sources that were opened by the
+        pager itself.
+        """
+        if self._prefetch_handle is not None:
+            self._prefetch_handle.cancel()
+            self._prefetch_handle = None
+
+        if self._file_watcher is not None:
+            self._file_watcher.stop()
+            self._file_watcher = None
+            self._followed_source = None
+
+        for source_info in list(self.source_info.values()):
+            source_info.close()
+
+        if self._search_executor is not None:
+            self._search_executor.shutdown(wait=False)
+            self._search_executor = None
+
+        for source in self._opened_sources:
+            source.close()
+        self._opened_sources = []
@@ -0,0 +1,174 @@
+"""
+Policy that decides how much input is read ahead.
+"""
+from typing import TYPE_CHECKING, Dict, Hashable, Optional, Tuple
+
+if TYPE_CHECKING:
+    from .pager import SourceInfo
+
+__all__ = [
+    "PrefetchPolicy",
+    "PrefetchBudget",
+]
+
+
+class PrefetchBudget:
+    """
+    Budget for reading ahead in the background, shared by all sources.
+
+    There's a memory budget: the number of characters that were read beyond
+    the visible part, for all sources together. And a read time budget: the
+    readers may spend at most a fraction of the time reading. Every source is
+    charged for what it uses. (The totals per source of the current round are
+    in `charges`.)
+
+    The budget is used in rounds. At the start of a round, the memory is
+    counted again, and the read time that was used is paid back, at
+    `max_read_time` seconds per second that passed.
+
+    :param max_memory: Number of characters.
+    :param max_read_time: Fraction of the time, between 0 and 1.
+    """
+
+    def __init__(self, max_memory: int, max_read_time: float) -> None:
+        self.max_memory = max_memory
+        self.max_read_time = max_read_time
+
+        #: Characters that are read ahead, in this round.
+        self.memory = 0
+
+        #: Read time (in seconds) that was used, and not paid back yet.
+        self.read_time = 0.0
+
+        #: (memory, read time) per source, in this round.
+        self.charges: Dict[Hashable, Tuple[int, float]] = {}
+
+    def __repr__(self) -> str:
+        return "PrefetchBudget(memory=%i/%i, read_time=%.3f)" % (
+            self.memory,
+            self.max_memory,
+            self.read_time,
+        )
+
+    @property
+    def memory_left(self) -> int:
+        return max(0, self.max_memory - self.memory)
+
+    @property
+    def has_read_time(self) -> bool:
+        "True when all the read time that was used has been paid back."
+        return self.read_time <= 0
+
+    def start_round(self, elapsed: float) -> None:
+        """
+        Start a new round, `elapsed` seconds after the start of the previous
+        one.
+        """
+        self.memory = 0
+        self.read_time = max(0.0, self.read_time - elapsed * self.max_read_time)
+        self.charges = {}
+
+    def charge(self, key: Hashable, memory: int = 0, read_time: float = 0.0) -> None:
+        "Charge the source with this key for memory and read time."
+        self.memory += memory
+        self.read_time += read_time
+
+        old_memory, old_read_time = self.charges.get(key, (0, 0.0))
+        self.charges[key] = (old_memory + memory, old_read_time + read_time)
+
+
+class PrefetchPolicy:
+    """
+    Decides how many lines the pager reads ahead for sources that are not
+    seekable (pipes, generators).
+
+    While the user is active, only the displayed source is read, up to
+    `pages_ahead` pages below the visible part. When the pager has been idle
+    for `idle_delay` seconds, it reads further ahead in the background, so
+    that scrolling down doesn't have to wait for a slow producer: up to
+    `idle_pages_ahead` more pages for the displayed source, and
+    `background_pages` pages for the other sources, so that switching to
+    them doesn't start cold.
+
+    Reading in the background is limited by a :class:`.PrefetchBudget` for
+    all sources together: `max_read_ahead` characters beyond the visible
+    parts, and `max_read_time` of the time. The displayed source comes first.
+
+    Subclass this and override :meth:`get_lines_wanted` for another policy.
+
+    :param pages_ahead: Pages to read below the visible part.
+    :param idle_pages_ahead: Extra pages to read for the displayed source when
+        idle.
+    :param background_pages: Pages to read for the other sources when idle.
+    :param max_read_ahead: Number of characters that may be read beyond the
+        visible parts in the background, for all sources together.
+    :param max_read_time: Fraction of the time that the readers may spend
+        reading in the background, for all sources together.
+    :param idle_delay: Seconds without activity before reading in the
+        background. (And between two rounds of reading in the background.)
+    """
+
+    #: Number of characters per line that we assume for a source, before
+    #: anything was read.
+    line_size_estimate = 128
+
+    def __init__(
+        self,
+        pages_ahead: int = 2,
+        idle_pages_ahead: int = 10,
+        background_pages: int = 2,
+        max_read_ahead: int = 16 * 1024 * 1024,
+        max_read_time: float = 0.25,
+        idle_delay: float = 0.5,
+    ) -> None:
+        self.pages_ahead = pages_ahead
+        self.idle_pages_ahead = idle_pages_ahead
+        self.background_pages = background_pages
+        self.max_read_ahead = max_read_ahead
+        self.max_read_time = max_read_time
+        self.idle_delay = idle_delay
+
+    def create_budget(self) -> PrefetchBudget:
+        "Create the budget for reading in the background."
+        return PrefetchBudget(self.max_read_ahead, self.max_read_time)
+
+    def get_lines_wanted(
+        self,
+        source_info: "SourceInfo",
+        row: int,
+        page_height: int,
+        focused: bool,
+        idle: bool,
+        budget: Optional[PrefetchBudget] = None,
+    ) -> int:
+        """
+        Return how many more lines should be read for this source.
+
+        :param row: The last visible row of the buffer.
+        :param page_height: Number of lines on a page.
+        :param focused: True for the displayed source.
+        :param idle: True when the user has been idle for `idle_delay`.
+        :param budget: When idle: the budget for reading in the background.
+            The source is charged for the extra lines (as an estimate of
+            their size).
+        """
+        lines, size = source_info.get_read_ahead(row)
+
+        pages = self.pages_ahead if focused else 0
+        wanted = max(0, pages * page_height - lines)
+
+        if idle and budget is not None and budget.has_read_time:
+            if focused:
+                pages += self.idle_pages_ahead
+            else:
+                pages += self.background_pages
+
+            line_size = size / lines if lines > 0 else self.line_size_estimate
+            extra = max(0, pages * page_height - lines) - wanted
+            extra = min(extra, int(budget.memory_left / max(1.0, line_size)))
+
+            if extra > 0:
+                budget.charge(source_info.source, memory=int(extra * line_size))
+                wanted += extra
+
+        return wanted
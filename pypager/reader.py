@@ -0,0 +1,316 @@
+"""
+Reading input that is not seekable (pipes, generators) in the background.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from abc import ABCMeta, abstractmethod
+from collections import deque
+from typing import Callable, Deque, List, Optional, Tuple
+
+from prompt_toolkit.formatted_text import StyleAndTextTuples
+
+from .source import PipeSource, Source
+
+__all__ = [
+    "SourceReader",
+    "ThreadedSourceReader",
+    "AsyncSourceReader",
+    "create_source_reader",
+]
+
+# CPU time of the current thread, when available. (Time spent waiting for
+# input doesn't count.)
+_get_thread_time: Callable[[], float] = getattr(time, "thread_time", time.perf_counter)
+
+
+class SourceReader(metaclass=ABCMeta):
+    """
+    Reads a :class:`.Source` as long as the pager asks for more.
+
+    Demand is signalled with credits: after `request(lines)`, the reader keeps
+    reading until it has read this many lines. The pager takes the chunks
+    with `receive`.
+
+    :param source: The :class:`.Source` to read from.
+    :param wakeup: Called when there are chunks to receive. (Only once, until
+        `receive` is called.) This should schedule a call to `receive` in the
+        event loop. (It can be called from another thread.)
+    """
+
+    def __init__(self, source: Source, wakeup: Callable[[], None]) -> None:
+        self.source = source
+        self.wakeup = wakeup
+
+        self._credits = 0
+        self._wakeup_pending = False
+        self._stopped = False
+
+        #: Seconds that were spent reading and tokenizing. (For the prefetch
+        #: budget, see :class:`.PrefetchBudget`.)
+        self.read_time = 0.0
+
+    @property
+    def busy(self) -> bool:
+        "True while the reader still has to read lines that were requested."
+        return self._credits > 0 and not self.source.eof()
+
+    @abstractmethod
+    def request(self, lines: int) -> None:
+        """
+        Ask for (at least) this many lines. This replaces the previous request,
+        if that one asked for less.
+        """
+
+    @abstractmethod
+    def receive(self) -> List[Tuple[StyleAndTextTuples, bool]]:
+        """
+        Return all chunks that were read as (fragments, final) tuples. `final`
+        is True for the last chunk of the input.
+        """
+
+    @abstractmethod
+    def stop(self) -> None:
+        "Stop reading."
+
+
+class ThreadedSourceReader(SourceReader):
+    """
+    Reads a :class:`.Source` in a thread.
+
+    The chunks are passed to the event loop through a bounded queue. When the
+    event loop doesn't keep up, the reader blocks, which throttles the producer
+    of the input.
+
+    :param max_queue_size: Maximum number of characters in the queue. (The
+        size of the chunks varies a lot, from a line for a generator to
+        megabytes for a pipe, so we don't count chunks.)
+    """
+
+    def __init__(
+        self,
+        source: Source,
+        wakeup: Callable[[], None],
+        max_queue_size: int = 4 * 1024 * 1024,
+    ) -> None:
+        super().__init__(source, wakeup)
+        self.max_queue_size = max_queue_size
+
+        self._queue: Deque[Tuple[StyleAndTextTuples, bool]] = deque()
+        self._queue_size = 0
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def __repr__(self) -> str:
+        return "ThreadedSourceReader(%r, credits=%i, queued=%i)" % (
+            self.source,
+            self._credits,
+            len(self._queue),
+        )
+
+    def request(self, lines: int) -> None:
+        with self._condition:
+            if self._stopped:
+                return
+
+            self._credits = max(self._credits, lines)
+            self._condition.notify()
+
+            if self._thread is None:
+                # (A daemon, because reading can block forever.)
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+
+    def receive(self) -> List[Tuple[StyleAndTextTuples, bool]]:
+        with self._condition:
+            result = list(self._queue)
+            self._queue.clear()
+            self._queue_size = 0
+            self._wakeup_pending = False
+            self._condition.notify()
+
+        return result
+
+    def stop(self) -> None:
+        """
+        Stop reading. (We don't wait for the thread. It could be blocking in
+        a read that never returns.)
+        """
+        with self._condition:
+            self._stopped = True
+            self._queue.clear()
+            self._condition.notify()
+
+    def _run(self) -> None:
+        source = self.source
+
+        while True:
+            with self._condition:
+                while self._credits <= 0 and not self._stopped:
+                    self._condition.wait()
+
+                if self._stopped:
+                    return
+
+                source.set_read_ahead(self._credits)
+
+            start_time = _get_thread_time()
+            tokens = source.read_chunk()
+            final = source.eof()
+            lines = sum(fragment[1].count("\n") for fragment in tokens)
+            size = sum(len(fragment[1]) for fragment in tokens)
+            self.read_time += _get_thread_time() - start_time
+
+            with self._condition:
+                self._credits = 0 if final else max(0, self._credits - lines)
+
+                # Wait for space in the queue.
+                while self._queue_size >= self.max_queue_size and not self._stopped:
+                    self._condition.wait()
+
+                if self._stopped:
+                    return
+
+                self._queue.append((tokens, final))
+                self._queue_size += size
+
+                wakeup = not self._wakeup_pending
+                self._wakeup_pending = True
+
+            if wakeup:
+                self.wakeup()
+
+            if final:
+                return
+
+
+class AsyncSourceReader(SourceReader):
+    """
+    Reads a :class:`.PipeSource` in the event loop. The file descriptor is
+    made non-blocking, and each time that it becomes readable, we read what is
+    available (up to the read size of the source, which adapts to the number
+    of requested lines, but never more than `max_read_size`). No threads are
+    involved.
+
+    While no lines are requested, we stop watching the file descriptor, so
+    that the pipe fills up and the producer blocks.
+
+    Raises `NotImplementedError` or `OSError` when the event loop can't watch
+    this file descriptor. (Like regular files with epoll, or pipes on
+    Windows.)
+
+    :param max_read_size: Maximum number of bytes that are read (and
+        tokenized) at once. This happens in the event loop, so key presses
+        wait for it. (When there is more, we're called again right away.)
+    """
+
+    def __init__(
+        self,
+        source: PipeSource,
+        wakeup: Callable[[], None],
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+        max_read_size: int = 64 * 1024,
+    ) -> None:
+        super().__init__(source, wakeup)
+        self.pipe_source = source
+        self.loop = loop or asyncio.get_event_loop()
+        self.max_read_size = max_read_size
+
+        self._chunks: List[Tuple[StyleAndTextTuples, bool]] = []
+        self._watching = False
+        self._was_blocking = True
+
+        if sys.platform == "win32":
+            raise NotImplementedError("Non-blocking pipes are not supported.")
+
+        fileno = source.fileno
+        self._was_blocking = os.get_blocking(fileno)
+        os.set_blocking(fileno, False)
+
+        try:
+            self.loop.add_reader(fileno, self._read)
+        except BaseException:
+            os.set_blocking(fileno, self._was_blocking)
+            raise
+
+        self._watching = True
+
+    def __repr__(self) -> str:
+        return "AsyncSourceReader(%r, credits=%i, queued=%i)" % (
+            self.source,
+            self._credits,
+            len(self._chunks),
+        )
+
+    def request(self, lines: int) -> None:
+        if self._stopped:
+            return
+
+        self._credits = max(self._credits, lines)
+
+        if self._credits > 0 and not self._watching and not self.source.eof():
+            self.loop.add_reader(self.pipe_source.fileno, self._read)
+            self._watching = True
+
+    def receive(self) -> List[Tuple[StyleAndTextTuples, bool]]:
+        self._wakeup_pending = False
+        result, self._chunks = self._chunks, []
+        return result
+
+    def stop(self) -> None:
+        self._stopped = True
+        self._unwatch()
+
+        if sys.platform != "win32":
+            try:
+                os.set_blocking(self.pipe_source.fileno, self._was_blocking)
+            except OSError:
+                pass  # Closed already.
+
+    def _unwatch(self) -> None:
+        if self._watching:
+            self.loop.remove_reader(self.pipe_source.fileno)
+            self._watching = False
+
+    def _read(self) -> None:
+        "Called by the event loop when the file descriptor is readable."
+        if self._credits <= 0 or self._stopped:
+            self._unwatch()
+            return
+
+        start_time = time.perf_counter()
+        source = self.pipe_source
+        source.set_read_ahead(self._credits)
+        source.read_size = min(source.read_size, self.max_read_size)
+        tokens = source.read_chunk()
+        final = self.source.eof()
+        lines = sum(fragment[1].count("\n") for fragment in tokens)
+        self.read_time += time.perf_counter() - start_time
+        self._credits = 0 if final else max(0, self._credits - lines)
+
+        if tokens or final:
+            self._chunks.append((tokens, final))
+
+            if not self._wakeup_pending:
+                self._wakeup_pending = True
+                self.wakeup()
+
+        if self._credits <= 0:
+            self._unwatch()
+
+
+def create_source_reader(source: Source, wakeup: Callable[[], None]) -> SourceReader:
+    """
+    Create a reader for this source: a :class:`.AsyncSourceReader` for pipes
+    when the event loop supports it, otherwise a :class:`.ThreadedSourceReader`.
+    """
+    if isinstance(source, PipeSource):
+        try:
+            return AsyncSourceReader(source, wakeup)
+        except (NotImplementedError, OSError, ValueError):
+            pass
+
+    return ThreadedSourceReader(source, wakeup)
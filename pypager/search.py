@@ -0,0 +1,878 @@
+"""
+Searching through all of the input in the background, not only through the
+lines that are in the buffer.
+"""
+import os
+import re
+import threading
+from abc import ABCMeta, abstractmethod
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from concurrent.futures import Executor, Future, wait
+from itertools import islice
+from typing import (
+    Callable,
+    Deque,
+    Iterable,
+    Iterator,
+    List,
+    Match,
+    Optional,
+    Pattern,
+    Tuple,
+    Union,
+)
+
+from .ansi import StyledLine, get_plain_text
+from .source import FileData, LineRange, MmapFileSource
+from .store import LineStore
+
+__all__ = [
+    "Search",
+    "MatchIndex",
+    "FilterView",
+    "compile_search_pattern",
+    "compile_filter_pattern",
+]
+
+
+def compile_search_pattern(text: str, ignore_case: bool = False) -> Pattern[str]:
+    """
+    Compile the search text into a regular expression. (The search text is
+    literal text, like in the prompt_toolkit search that highlights the
+    matches.)
+    """
+    return re.compile(re.escape(text), re.IGNORECASE if ignore_case else 0)
+
+
+def compile_filter_pattern(text: str, ignore_case: bool = False) -> Pattern[str]:
+    """
+    Compile the pattern of a filter. (Unlike the search text, this is a
+    regular expression, like in 'less'. Raises `re.error` when it's invalid.)
+    """
+    # (Multiline, so that '^' and '$' match at the start and end of each line.)
+    return re.compile(text, re.MULTILINE | (re.IGNORECASE if ignore_case else 0))
+
+
+def _filter_matches(
+    matches: Iterable[Match[str]],
+    text: str,
+    filter_pattern: Optional[Pattern[str]],
+) -> Iterator[Match[str]]:
+    """
+    Leave out the matches in `text` that are on a line without a match of
+    `filter_pattern`. (Those lines are hidden by the filter.)
+    """
+    if filter_pattern is None:
+        yield from matches
+        return
+
+    line_end = -1
+    keep = False
+
+    for m in matches:
+        position = m.start()
+
+        if position > line_end:
+            line_start = text.rfind("\n", 0, position) + 1
+            line_end = text.find("\n", position)
+            if line_end == -1:
+                line_end = len(text)
+            keep = filter_pattern.search(text, line_start, line_end) is not None
+
+        if keep:
+            yield m
+
+
+def _find_lines(
+    pattern: Pattern[str], text: str, pos: int, endpos: int
+) -> Iterator[int]:
+    """
+    Yield the start of each line in `text[pos:endpos]` that contains a match.
+    (`pos` has to be the start of a line.)
+    """
+    while pos < endpos:
+        m = pattern.search(text, pos, endpos)
+        if m is None:
+            return
+
+        line_start = text.rfind("\n", pos, m.start()) + 1
+        yield max(pos, line_start)
+
+        # Continue on the next line.
+        line_end = text.find("\n", max(m.start(), m.end() - 1))
+        if line_end == -1:
+            return
+        pos = line_end + 1
+
+
+def _get_ranges(
+    data: Union[bytes, FileData],
+    size: int,
+    position: int,
+    range_size: int,
+    backwards: bool = False,
+) -> Iterator[Tuple[int, int]]:
+    """
+    Split `data` in ranges of about `range_size` bytes, that end at a line
+    boundary: from `position` to the end, or from `position` back to the start.
+    (In that order.)
+    """
+    if backwards:
+        end = position
+        while end > 0:
+            begin = data.rfind(b"\n", 0, max(0, end - range_size)) + 1
+            yield begin, end
+            end = begin
+    else:
+        begin = position
+        while begin < size:
+            newline = data.find(b"\n", min(size, begin + range_size))
+            end = size if newline == -1 else newline + 1
+            yield begin, end
+            begin = end
+
+
+class _TextBlock:
+    """
+    The text of a block of lines of a file, as it is displayed: decoded, and
+    without escape sequences. (In the raw bytes, a pattern could match in an
+    escape sequence, or not match text that is split by one.) Indexes in the
+    text are translated back to positions in the file.
+
+    :param data: The bytes of the block. (Ending at a line boundary.)
+    :param position: Position of the block in the file.
+    """
+
+    def __init__(self, data: bytes, position: int, encoding: str) -> None:
+        self.data = data
+        self.position = position
+        self.text = get_plain_text(data.decode(encoding, "replace"))
+
+        # When each character is one byte, the indexes are the positions.
+        self._same = len(self.text) == len(data)
+
+        # Index and offset in `data` of the last line that was looked up.
+        self._line = (0, 0)
+
+    def get_position(self, index: int) -> int:
+        """
+        Return the position in the file of the character at this index. (Or a
+        position after it, on the same line. Enough for finding the line and
+        for keeping the order.)
+        """
+        if self._same:
+            return self.position + index
+
+        text = self.text
+        line_index, line_offset = self._line
+        if index < line_index:
+            line_index = line_offset = 0
+
+        # Skip to the line of `index`.
+        newline = text.rfind("\n", line_index, index)
+        if newline != -1:
+            for _ in range(text.count("\n", line_index, newline + 1)):
+                line_offset = self.data.index(b"\n", line_offset) + 1
+            line_index = newline + 1
+            self._line = (line_index, line_offset)
+
+        # (A character takes at least one byte, so this is on the same line.)
+        line_end = self.data.find(b"\n", line_offset)
+        if line_end == -1:
+            line_end = len(self.data)
+        return self.position + min(line_offset + index - line_index, line_end)
+
+
+def _find(
+    pattern: Pattern[str],
+    block: _TextBlock,
+    backwards: bool,
+    filter_pattern: Optional[Pattern[str]] = None,
+) -> Optional[int]:
+    """
+    Return the position of the first match in this block, or the last match
+    when searching backwards. (Only on lines that match the filter, if there
+    is one.)
+    """
+    text = block.text
+    matches = _filter_matches(pattern.finditer(text), text, filter_pattern)
+    if backwards:
+        m = None
+        for m in matches:
+            pass
+    else:
+        m = next(matches, None)
+
+    return None if m is None else block.get_position(m.start())
+
+
+def _search_file_range(
+    filename: str,
+    file_id: Tuple[int, int],
+    encoding: str,
+    begin: int,
+    end: int,
+    pattern: str,
+    flags: int,
+    filter_pattern: Optional[str] = None,
+    filter_flags: int = 0,
+) -> List[int]:
+    """
+    Return the positions of all matches in the lines from `begin` to `end` in
+    this file, in order. (This runs in another process, so it reads the file
+    itself. Not through a memory map, which would crash the process if the
+    file is truncated in the meantime.)
+    """
+    if begin >= end:
+        return []
+
+    with open(filename, "rb") as f:
+        stat_result = os.fstat(f.fileno())
+        if (stat_result.st_dev, stat_result.st_ino) != file_id:
+            raise ValueError("The file was replaced.")
+
+        f.seek(begin)
+        block = _TextBlock(f.read(end - begin), begin, encoding)
+
+    compiled_filter = None
+    if filter_pattern is not None:
+        compiled_filter = re.compile(filter_pattern, filter_flags)
+
+    text = block.text
+    matches = re.compile(pattern, flags).finditer(text)
+    return [
+        block.get_position(m.start())
+        for m in _filter_matches(matches, text, compiled_filter)
+    ]
+
+
+def _search_file_in_parallel(
+    executor: Executor,
+    source: MmapFileSource,
+    ranges: Iterator[Tuple[int, int]],
+    pattern: Pattern[str],
+    filter_pattern: Optional[Pattern[str]],
+    max_pending: int,
+    cancelled: Callable[[], bool],
+) -> Iterator[Tuple[int, int, List[int]]]:
+    """
+    Search these ranges of the file in the executor, and yield (begin, end,
+    positions) for every range, in the order of `ranges`. At most
+    `max_pending` ranges are submitted at once. The ranges that were not
+    taken yet are cancelled when the generator is closed.
+    """
+    pending: Deque[Tuple[int, int, "Future[List[int]]"]] = deque()
+
+    try:
+        while not cancelled():
+            for begin, end in islice(ranges, max_pending - len(pending)):
+                future = executor.submit(
+                    _search_file_range,
+                    source.filename,
+                    source.file_id,
+                    source.encoding,
+                    begin,
+                    end,
+                    pattern.pattern,
+                    pattern.flags,
+                    None if filter_pattern is None else filter_pattern.pattern,
+                    0 if filter_pattern is None else filter_pattern.flags,
+                )
+                pending.append((begin, end, future))
+
+            if not pending:
+                return
+
+            # Wait for the first range. (With a timeout, to see whether we're
+            # cancelled.)
+            begin, end, future = pending[0]
+            if wait([future], timeout=0.1).done:
+                pending.popleft()
+                yield begin, end, future.result()
+    finally:
+        for _, _, future in pending:
+            future.cancel()
+
+
+class Search:
+    """
+    Search for the next (or previous) match of a pattern in the input of a
+    source, in a background thread.
+
+    For a :class:`.MmapFileSource`, the file is searched in blocks that end at
+    a line boundary, in the text as it is displayed. (See :class:`._TextBlock`.)
+    For a :class:`.LineStore`, the text of the stored chunks. Nothing is added
+    to the buffer: only the position of the match is reported.
+
+    :param content: The :class:`.MmapFileSource` or :class:`.LineStore`.
+    :param start: Position where the search starts. (A forward search finds
+        matches at or after `start`, a backward search before `start`.)
+    :param done: Called (in the search thread) when the search is finished,
+        unless it was cancelled.
+    :param complete: For a :class:`.LineStore`: True when it contains all of
+        the input. (Otherwise, the last line is not searched yet, because it
+        can still grow.)
+    :param executor: When given (normally a `ProcessPoolExecutor`), a file is
+        split into ranges of `range_size` bytes, that are searched in parallel
+        in the executor. Every range returns all of its matches. The results
+        are taken in order, so the first match is known as soon as the ranges
+        before it are done.
+    :param max_pending: Maximum number of ranges that are submitted to the
+        executor at once.
+    :param filter_pattern: Only find matches on lines that match this pattern.
+        (The lines of a :class:`.FilterView`.)
+    :param match_index: :class:`.MatchIndex` for the same pattern and filter.
+        The matches of the ranges that were searched in parallel are added to
+        it, when they follow the part that it has scanned. (So that they don't
+        have to be searched again for `n` and `N`.)
+    """
+
+    #: Number of bytes that are searched at once, in the search thread.
+    block_size = 1024 * 1024
+
+    #: Number of bytes that are searched at once, in the executor.
+    range_size = 16 * 1024 * 1024
+
+    #: Files that are smaller than this are not worth searching in parallel.
+    parallel_threshold = 64 * 1024 * 1024
+
+    def __init__(
+        self,
+        content: Union[MmapFileSource, LineStore],
+        pattern: Pattern[str],
+        start: int,
+        done: Callable[["Search"], None],
+        backwards: bool = False,
+        complete: bool = True,
+        executor: Optional[Executor] = None,
+        max_pending: int = 8,
+        filter_pattern: Optional[Pattern[str]] = None,
+        match_index: Optional["MatchIndex"] = None,
+    ) -> None:
+        self.content = content
+        self.pattern = pattern
+        self.filter_pattern = filter_pattern
+        self.match_index = match_index
+        self.start_position = start
+        self.done = done
+        self.backwards = backwards
+        self.complete = complete
+        self.executor = executor
+        self.max_pending = max_pending
+
+        #: How far the search got.
+        self.position = start
+
+        #: Position of the match that was found.
+        self.match: Optional[int] = None
+
+        self._cancelled = False
+        self._thread: Optional[threading.Thread] = None
+
+    def __repr__(self) -> str:
+        return "Search(%r, position=%i, match=%r)" % (
+            self.pattern.pattern,
+            self.position,
+            self.match,
+        )
+
+    @property
+    def progress(self) -> float:
+        "The part of the input that was searched, between 0 and 1."
+        if self.backwards:
+            total = self.start_position
+            searched = self.start_position - self.position
+        else:
+            total = self.content.get_size() - self.start_position
+            searched = self.position - self.start_position
+
+        if total <= 0:
+            return 1.0
+        return min(1.0, searched / total)
+
+    def start(self) -> None:
+        """
+        Start searching in a background thread. (When a forward search in a
+        :class:`.LineStore` didn't find a match, this can be called again when
+        more input was stored. It continues where it stopped.)
+        """
+        if not self._cancelled:
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def cancel(self) -> None:
+        "Stop searching. (`done` won't be called.)"
+        self._cancelled = True
+
+    def _run(self) -> None:
+        content = self.content
+
+        while True:
+            data = content.data if isinstance(content, MmapFileSource) else None
+            try:
+                if isinstance(content, MmapFileSource):
+                    if self.executor is not None:
+                        self._search_file_in_parallel(content)
+                    else:
+                        self._search_file(content)
+                else:
+                    if self.backwards:
+                        self._search_store_backwards(content)
+                    else:
+                        self._search_store(content)
+            except (ValueError, OSError, RuntimeError):
+                # The file was closed or replaced, or the executor was shut
+                # down. When the file was mapped again (because it grew),
+                # continue with the new data. Otherwise, there's no match.
+                if isinstance(content, MmapFileSource) and content.data is not data:
+                    continue
+            break
+
+        if not self._cancelled:
+            self.done(self)
+
+    def _get_ranges(
+        self, source: MmapFileSource, range_size: int
+    ) -> Iterator[Tuple[int, int]]:
+        "Split the part of the file that is not searched yet in ranges."
+        return _get_ranges(
+            source.data, source.get_size(), self.position, range_size, self.backwards
+        )
+
+    def _search_file(self, source: MmapFileSource) -> None:
+        for begin, end in self._get_ranges(source, self.block_size):
+            if self._cancelled:
+                return
+
+            # (Slicing copies the block, so that the file can be remapped in
+            # the meantime.)
+            block = _TextBlock(source.data[begin:end], begin, source.encoding)
+            position = _find(self.pattern, block, self.backwards, self.filter_pattern)
+            if position is not None:
+                self.match = position
+                return
+
+            self.position = begin if self.backwards else end
+
+    def _search_file_in_parallel(self, source: MmapFileSource) -> None:
+        assert self.executor is not None
+        results = _search_file_in_parallel(
+            self.executor,
+            source,
+            self._get_ranges(source, self.range_size),
+            self.pattern,
+            self.filter_pattern,
+            self.max_pending,
+            lambda: self._cancelled,
+        )
+
+        for begin, end, positions in results:
+            if self.match_index is not None and not self.backwards:
+                self.match_index.add_range(begin, end, positions)
+
+            if positions:
+                self.match = positions[-1] if self.backwards else positions[0]
+                return
+
+            self.position = begin if self.backwards else end
+
+    def _search_store(self, store: LineStore) -> None:
+        position = self.position
+
+        while not self._cancelled:
+            chunk_position, text = store.get_text(position)
+            end = len(text)
+
+            if not self.complete and not text.endswith("\n"):
+                # Don't search the last line. It is not complete yet.
+                end = text.rfind("\n") + 1
+
+            matches = self.pattern.finditer(text, position - chunk_position, end)
+            m = next(_filter_matches(matches, text, self.filter_pattern), None)
+            if m:
+                self.match = chunk_position + m.start()
+                return
+
+            if chunk_position + end <= position:
+                return  # Nothing more to search (yet).
+
+            position = self.position = chunk_position + end
+
+    def _search_store_backwards(self, store: LineStore) -> None:
+        end = self.position
+
+        while end > 0 and not self._cancelled:
+            chunk_position, text = store.get_text(end - 1)
+
+            m = None
+            matches = self.pattern.finditer(text, 0, end - chunk_position)
+            for m in _filter_matches(matches, text, self.filter_pattern):
+                pass
+
+            if m:
+                self.match = chunk_position + m.start()
+                return
+
+            end = self.position = chunk_position
+
+
+class _Scanner(metaclass=ABCMeta):
+    """
+    Base class for scanning all of the input of a source in a background
+    thread, from the start, and collecting positions in a sorted array. (Like
+    :class:`.Search`, over the displayed text of a file, or the text in a
+    :class:`.LineStore`.) Everything before `position` was scanned.
+
+    :param complete: For a :class:`.LineStore`: True when it contains all of
+        the input.
+    :param max_count: Stop scanning when this many positions were found, to
+        bound the memory usage.
+    :param wakeup: Called (in the scanning thread) when positions were found,
+        and when the thread is done. Not again, until :meth:`acknowledge` is
+        called.
+    """
+
+    def __init__(
+        self,
+        content: Union[MmapFileSource, LineStore],
+        pattern: Pattern[str],
+        complete: bool,
+        max_count: int,
+        wakeup: Optional[Callable[[], None]] = None,
+    ) -> None:
+        self.content = content
+        self.pattern = pattern
+        self.complete = complete
+        self.max_count = max_count
+
+        #: The positions that were found.
+        self.positions = array("Q")
+
+        #: How far the scanning got.
+        self.position = 0
+
+        self._wakeup = wakeup
+        self._wakeup_pending = False
+        self._stopped = False
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._more = False  # More input, since the thread started scanning.
+
+    @property
+    def count(self) -> int:
+        return len(self.positions)
+
+    @property
+    def full(self) -> bool:
+        "True when `max_count` positions were found."
+        return len(self.positions) >= self.max_count
+
+    @property
+    def busy(self) -> bool:
+        "True while the scanning thread is running."
+        return self._thread is not None
+
+    def start(self) -> None:
+        """
+        Start scanning in a background thread. This is called again when the
+        input grows, to continue where the scanning stopped.
+        """
+        with self._lock:
+            self._more = True
+
+            if self._thread is None and not self._stopped:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped = True
+
+    def acknowledge(self) -> None:
+        "Allow the next call of `wakeup`."
+        self._wakeup_pending = False
+
+    @abstractmethod
+    def _find_all(
+        self, pattern: Pattern[str], text: str, pos: int, endpos: int
+    ) -> Iterator[int]:
+        "Yield the positions to collect in `text[pos:endpos]`."
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                if not self._more or self._stopped:
+                    self._thread = None
+                    break
+                self._more = False
+
+            try:
+                if isinstance(self.content, MmapFileSource):
+                    self._scan_file(self.content)
+                else:
+                    self._scan_store(self.content)
+            except (ValueError, OSError, RuntimeError):
+                pass  # The file was closed or replaced, or no more executor.
+
+        self._notify()
+
+    def _notify(self) -> None:
+        if self._wakeup is not None and not self._wakeup_pending:
+            self._wakeup_pending = True
+            self._wakeup()
+
+    def _add(self, found: Iterable[int], begin: int, end: int) -> bool:
+        """
+        Add the positions that were found in the input from `begin` to `end`.
+        Return False when the scanning should stop: when we have enough, or
+        when this part was added already by another thread. (Then `start` is
+        called again, to continue where that one stopped.)
+        """
+        positions = list(islice(found, self.max_count - self.count))
+
+        # (Under the lock, so that the positions and `position` agree.)
+        with self._lock:
+            if begin != self.position:
+                self._more = True
+                return False
+
+            self.positions.extend(positions)
+            if not self.full:
+                self.position = end
+
+        if positions:
+            self._notify()
+
+        return not self.full
+
+    def _scan_file(self, source: MmapFileSource) -> None:
+        data = source.data
+        size = source.get_size()
+
+        for begin, end in _get_ranges(data, size, self.position, Search.block_size):
+            if self._stopped or self.full:
+                return
+
+            block = _TextBlock(data[begin:end], begin, source.encoding)
+            found = self._find_all(self.pattern, block.text, 0, len(block.text))
+            if not self._add(map(block.get_position, found), begin, end):
+                return
+
+    def _scan_store(self, store: LineStore) -> None:
+        position = self.position
+
+        while not self._stopped and not self.full:
+            chunk_position, text = store.get_text(position)
+            end = len(text)
+
+            if not self.complete and not text.endswith("\n"):
+                end = text.rfind("\n") + 1  # The last line is not complete.
+
+            if chunk_position + end <= position:
+                return  # Nothing more to scan (yet).
+
+            found = self._find_all(self.pattern, text, position - chunk_position, end)
+            positions = (chunk_position + p for p in found)
+            if not self._add(positions, position, chunk_position + end):
+                return
+
+            position = chunk_position + end
+
+
+class MatchIndex(_Scanner):
+    """
+    The positions of all matches of a pattern in the input of a source, found
+    in a background thread.
+
+    The positions are kept in a sorted array, so finding the next or previous
+    match, or the number of a match, takes O(log n) time.
+
+    :param complete: For a :class:`.LineStore`: True when it contains all of
+        the input.
+    :param max_matches: Stop searching after this many matches, to bound the
+        memory usage.
+    :param filter_pattern: Only count matches on lines that match this pattern.
+    :param executor: When given, a file is searched in parallel in this
+        executor, like in :class:`.Search`. The matches of the ranges are
+        added in order.
+    :param max_pending: Maximum number of ranges that are submitted to the
+        executor at once.
+    """
+
+    #: Number of bytes that are searched at once, in the executor.
+    range_size = Search.range_size
+
+    def __init__(
+        self,
+        content: Union[MmapFileSource, LineStore],
+        pattern: Pattern[str],
+        complete: bool = True,
+        max_matches: int = 4 * 1024 * 1024,
+        filter_pattern: Optional[Pattern[str]] = None,
+        executor: Optional[Executor] = None,
+        max_pending: int = 8,
+    ) -> None:
+        super().__init__(content, pattern, complete, max_matches)
+        self.filter_pattern = filter_pattern
+        self.executor = executor
+        self.max_pending = max_pending
+
+    def __repr__(self) -> str:
+        return "MatchIndex(%r, count=%i, position=%i)" % (
+            self.pattern.pattern,
+            self.count,
+            self.position,
+        )
+
+    @property
+    def done(self) -> bool:
+        "True when all matches were found. (The count is final.)"
+        return (
+            self.complete and self.position >= self.content.get_size() and not self.full
+        )
+
+    def find_next(self, position: int) -> Optional[int]:
+        "Return the first match at or after `position`, if it was found yet."
+        i = bisect_left(self.positions, position)
+        if i < len(self.positions):
+            return self.positions[i]
+        return None
+
+    def find_previous(self, position: int) -> Optional[int]:
+        "Return the last match before `position`."
+        i = bisect_left(self.positions, position)
+        if i > 0:
+            return self.positions[i - 1]
+        return None
+
+    def get_match_number(self, start: int, end: int) -> Optional[int]:
+        """
+        Return the (1-based) number of the first match between `start` and
+        `end` (the start and end of a line), or `None` if there is no match.
+        """
+        i = bisect_left(self.positions, start)
+        if i < len(self.positions) and self.positions[i] < end:
+            return i + 1
+        return None
+
+    def add_range(self, begin: int, end: int, positions: List[int]) -> None:
+        """
+        Add the matches from `begin` to `end` of the input, that were found by
+        a :class:`.Search`. (Only when this follows the part that was scanned.
+        Otherwise, it's ignored.)
+        """
+        self._add(positions, begin, end)
+
+    def _find_all(
+        self, pattern: Pattern[str], text: str, pos: int, endpos: int
+    ) -> Iterator[int]:
+        matches = pattern.finditer(text, pos, endpos)
+        return (m.start() for m in _filter_matches(matches, text, self.filter_pattern))
+
+    def _scan_file(self, source: MmapFileSource) -> None:
+        if self.executor is None:
+            super()._scan_file(source)
+            return
+
+        ranges = _get_ranges(
+            source.data, source.get_size(), self.position, self.range_size
+        )
+        results = _search_file_in_parallel(
+            self.executor,
+            source,
+            ranges,
+            self.pattern,
+            self.filter_pattern,
+            self.max_pending,
+            lambda: self._stopped or self.full,
+        )
+
+        for begin, end, positions in results:
+            if not self._add(positions, begin, end):
+                return
+
+
+class FilterView(_Scanner):
+    """
+    The lines of a source that match a pattern, like the '&pattern' command of
+    'less'. This is used in place of the source by the pager: it has the same
+    methods for reading lines as a :class:`.SeekableSource`.
+
+    The matching lines are found in a background thread, which collects their
+    positions in the source. So the view is extended lazily, while the input is
+    scanned (or read, for a :class:`.LineStore`), and the lines themselves are
+    read from the source only when they are displayed. The size of the view is
+    the part of the input that was scanned.
+
+    :param max_lines: Stop scanning after this many matching lines.
+    """
+
+    def __init__(
+        self,
+        content: Union[MmapFileSource, LineStore],
+        pattern: Pattern[str],
+        wakeup: Optional[Callable[[], None]] = None,
+        complete: bool = True,
+        max_lines: int = 16 * 1024 * 1024,
+    ) -> None:
+        super().__init__(content, pattern, complete, max_lines, wakeup)
+
+    def __repr__(self) -> str:
+        return "FilterView(%r, lines=%i, position=%i)" % (
+            self.pattern.pattern,
+            self.count,
+            self.position,
+        )
+
+    @property
+    def done(self) -> bool:
+        "True when all input was scanned. (Or when the view is full.)"
+        return self.complete and self.position >= self.content.get_size() or self.full
+
+    def _find_all(
+        self, pattern: Pattern[str], text: str, pos: int, endpos: int
+    ) -> Iterator[int]:
+        return _find_lines(pattern, text, pos, endpos)
+
+    def _get_state(self) -> Tuple[int, int]:
+        "Return the number of lines and the size of the view, as they agree."
+        with self._lock:
+            return len(self.positions), self.position
+
+    def _read(self, positions: List[int], end: int) -> LineRange:
+        "Read the lines at these positions from the source."
+        lines = [self.content.read_lines(p, 1).lines[0] for p in positions]
+        return LineRange(positions, lines, end)
+
+    def get_size(self) -> int:
+        return self._get_state()[1]
+
+    def get_line_start(self, position: int) -> int:
+        """
+        Return the position of the last line of the view at or before
+        `position`. (Or of the first line, when there is none.)
+        """
+        count, _ = self._get_state()
+        i = max(0, bisect_right(self.positions, position, 0, count) - 1)
+        return self.positions[i] if count else 0
+
+    def read_lines(self, position: int, count: int) -> LineRange:
+        total, size = self._get_state()
+
+        if total == 0:
+            # No matching lines (yet). Show an empty line, which is replaced
+            # when lines are found, like the end of a growing input.
+            return LineRange([0], [StyledLine.from_fragments([])], size + 1)
+
+        i = bisect_left(self.positions, position, 0, total)
+        j = min(total, i + max(0, count))
+        end = self.positions[j] if j < total else size + 1
+        return self._read(list(self.positions[i:j]), end)
+
+    def read_lines_before(self, position: int, count: int) -> LineRange:
+        total, _ = self._get_state()
+        i = bisect_left(self.positions, position, 0, total)
+        return self._read(list(self.positions[max(0, i - count) : i]), position)
@@ -1,11 +1,15 @@
 """
 Input source for a pager.
-(pipe or generator.)
+(pipe, file or generator.)
 """
+import io
+import mmap
 import os
+import stat
+import threading
 from abc import ABCMeta, abstractmethod
 from codecs import getincrementaldecoder
-from typing import Dict, Generator, Optional, Sequence, Union
+from typing import Dict, Generator, List, NamedTuple, Optional
 
 from prompt_toolkit.formatted_text import (
     AnyFormattedText,
@@ -14,17 +18,24 @@ from prompt_toolkit.formatted_text import (
 )
 from prompt_toolkit.layout.utils import explode_text_fragments
 from prompt_toolkit.lexers import Lexer
-from prompt_toolkit.output.vt100 import BG_ANSI_COLORS, FG_ANSI_COLORS
-from prompt_toolkit.output.vt100 import _256_colors as _256_colors_table
-from prompt_toolkit.styles import Attrs
+from prompt_toolkit.styles import DEFAULT_ATTRS, Attrs
+
+from .ansi import AnsiTokenizer, StyledLine
+from .index import LineIndex
 
 __all__ = [
     "Source",
+    "SeekableSource",
+    "LineRange",
+    "FileData",
     "DummySource",
     "PipeSource",
+    "FileSource",
+    "MmapFileSource",
     "GeneratorSource",
     "StringSource",
     "FormattedTextSource",
+    "create_file_source",
 ]
 
 
@@ -48,10 +59,204 @@ class Source(metaclass=ABCMeta):
         This can be blocking and will be called in another thread.
         """
 
+    def set_read_ahead(self, lines: int) -> None:
+        """
+        Hint from the pager about how many more lines it wants to have.
+        Sources can use this to decide how much to read at once.
+        """
+
     def close(self) -> None:
         pass
 
 
+class LineRange(NamedTuple):
+    """
+    Consecutive lines, read from a :class:`.SeekableSource`.
+    """
+
+    #: Position of each line.
+    positions: List[int]
+
+    #: The text and styles of each line. (Without the newline.)
+    lines: List[StyledLine]
+
+    #: Position of the line following the last line. (This is larger than the
+    #: size of the input if the last line is included.)
+    end: int
+
+
+class FileData:
+    """
+    The content of a regular file, for random access. (It supports the part of
+    the `bytes` interface that we need: slicing, `find` and `rfind`.)
+
+    The file is memory mapped. But accessing a memory map beyond the end of a
+    file that was truncated kills the process with SIGBUS, which can't be
+    caught. So, the size of the file is checked before each access, and once
+    the file became smaller than the map, it is read with `os.read` instead.
+    (This is common for log files, which are truncated when they are rotated.)
+
+    :param fileno: File descriptor of the file. (It's not closed by
+        :meth:`close`.)
+    :param size: Size of the file. Nothing after this is read.
+    """
+
+    #: Maximum number of bytes that `find` and `rfind` scan per access.
+    block_size = 1024 * 1024
+
+    def __init__(self, fileno: int, size: int) -> None:
+        self.fileno = fileno
+        self.size = size
+
+        self._map: Optional[mmap.mmap] = None
+        if size:  # (Empty files can't be mapped.)
+            self._map = mmap.mmap(fileno, size, access=mmap.ACCESS_READ)
+
+        self._closed = False
+        self._lock = threading.Lock()  # For `os.lseek` + `os.read`.
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, key: slice) -> bytes:
+        start, stop, _ = key.indices(self.size)
+        if start >= stop:
+            return b""
+
+        data = self._get_map()
+        if data is not None:
+            return data[start:stop]
+        return self._read(start, stop)
+
+    def _get_map(self) -> Optional[mmap.mmap]:
+        "Return the memory map, if it can still be used."
+        if self._closed:
+            raise ValueError("I/O operation on closed file.")
+
+        data = self._map
+        if data is not None:
+            try:
+                size = os.fstat(self.fileno).st_size
+            except OSError as e:
+                raise ValueError(e) from e
+
+            if size < self.size:
+                # The file shrank. (Don't close the map, another thread could
+                # be using it.)
+                data = self._map = None
+        return data
+
+    def _read(self, start: int, stop: int) -> bytes:
+        "Read from the file. (Fewer bytes at the end of a truncated file.)"
+        result = []
+        try:
+            with self._lock:
+                os.lseek(self.fileno, start, os.SEEK_SET)
+                while start < stop:
+                    data = os.read(self.fileno, stop - start)
+                    if not data:
+                        break
+                    result.append(data)
+                    start += len(data)
+        except OSError as e:
+            raise ValueError(e) from e
+        return b"".join(result)
+
+    def find(self, sub: bytes, start: int = 0, end: Optional[int] = None) -> int:
+        "Like `bytes.find`. (Without negative indexes.)"
+        end = self.size if end is None else min(end, self.size)
+
+        while start < end:
+            # (Successive blocks overlap, for when `sub` is split by them.)
+            block_end = min(end, start + self.block_size)
+            data = self._get_map()
+            if data is not None:
+                index = data.find(sub, start, block_end)
+            else:
+                index = self._read(start, block_end).find(sub)
+                if index != -1:
+                    index += start
+
+            if index != -1 or block_end == end:
+                return index
+            start = block_end - len(sub) + 1
+        return -1
+
+    def rfind(self, sub: bytes, start: int = 0, end: Optional[int] = None) -> int:
+        "Like `bytes.rfind`. (Without negative indexes.)"
+        end = self.size if end is None else min(end, self.size)
+
+        while start < end:
+            block_start = max(start, end - self.block_size)
+            data = self._get_map()
+            if data is not None:
+                index = data.rfind(sub, block_start, end)
+            else:
+                index = self._read(block_start, end).rfind(sub)
+                if index != -1:
+                    index += block_start
+
+            if index != -1 or block_start == start:
+                return index
+            end = block_start + len(sub) - 1
+        return -1
+
+    def close(self) -> None:
+        self._closed = True
+        if self._map is not None:
+            self._map.close()
+
+
+class SeekableSource(Source):
+    """
+    Source that supports random access, so that the pager doesn't have to read
+    everything before the part that is displayed.
+
+    Lines are addressed by their position: the offset of the first byte of the
+    line. Every position that is zero or directly follows a newline is the
+    start of a line, including the size of the input if the input ends with a
+    newline.
+    """
+
+    @abstractmethod
+    def get_size(self) -> int:
+        "Return the size of the input."
+
+    @abstractmethod
+    def get_line_start(self, position: int) -> int:
+        "Return the position of the line that contains `position`."
+
+    @abstractmethod
+    def read_lines(self, position: int, count: int) -> LineRange:
+        """
+        Read `count` lines, starting at the line at `position`. (Fewer lines
+        are returned at the end of the input.)
+        """
+
+    @abstractmethod
+    def read_lines_before(self, position: int, count: int) -> LineRange:
+        """
+        Read `count` lines that precede the line at `position`. (Fewer lines
+        are returned at the start of the input.)
+        """
+
+    def get_index(self) -> Optional[LineIndex]:
+        """
+        Return the :class:`.LineIndex` for this input, if there is one.
+        (Indexing starts in the background on the first call.)
+        """
+        return None
+
+    def update(self) -> Optional[str]:
+        """
+        Check whether the input was changed, and if so, continue with the new
+        content. Return "grown" when data was appended, "replaced" when the
+        input was truncated or replaced (like a rotated log file), or `None`
+        when nothing changed.
+        """
+        return None
+
+
 class DummySource(Source):
     """
     Empty source.
@@ -71,6 +276,13 @@ class PipeSource(Source):
     """
     When input is read from another process that is chained to use through a
     unix pipe.
+
+    The amount of data read at once adapts to the demand of the pager: we
+    start with `read_size` bytes, so that the first page appears quickly, and
+    grow up to `max_read_size` bytes when many lines are requested at once.
+
+    :param read_size: Initial (and minimal) number of bytes per read.
+    :param max_read_size: Maximum number of bytes per read.
     """
 
     def __init__(
@@ -79,30 +291,30 @@ class PipeSource(Source):
         lexer: Optional[Lexer] = None,
         name: str = "<stdin>",
         encoding: str = "utf-8",
+        read_size: int = 4096,
+        max_read_size: int = 1024 * 1024,
     ) -> None:
         self.fileno = fileno
         self.lexer = lexer
         self.name = name
 
-        self._line_tokens: StyleAndTextTuples = []
+        self.min_read_size = read_size
+        self.max_read_size = max(read_size, max_read_size)
+        self.read_size = read_size
+
         self._eof = False
 
-        # Default style attributes.
-        self._attrs = Attrs(
-            color=None,
-            bgcolor=None,
-            bold=False,
-            underline=False,
-            strike=False,
-            italic=False,
-            blink=False,
-            reverse=False,
-            hidden=False,
-        )
+        # Statistics for estimating the number of bytes per line.
+        self._bytes_read = 0
+        self._lines_read = 0
 
-        # Start input parser.
-        self._parser = self._parse_corot()
-        next(self._parser)
+        # Reuse the same buffer for all reads. (It's only reallocated when the
+        # read size grows.)
+        self._file = io.FileIO(fileno, "rb", closefd=False)
+        self._read_buffer = memoryview(bytearray(read_size))
+
+        # Tokenizer for escape sequences in the input.
+        self._tokenizer = AnsiTokenizer()
 
         # Create incremental decoder for decoding stdin.
         # We can not just do `os.read(stdin.fileno(), 1024).decode('utf-8')`,
@@ -117,236 +329,252 @@ class PipeSource(Source):
     def eof(self) -> bool:
         return self._eof
 
+    def set_read_ahead(self, lines: int) -> None:
+        # Estimate how many bytes we need for this amount of lines and round
+        # up to the next power of two.
+        if self._lines_read:
+            bytes_per_line = self._bytes_read / self._lines_read
+        else:
+            bytes_per_line = 128
+
+        wanted = lines * bytes_per_line
+        size = self.min_read_size
+
+        while size < wanted and size < self.max_read_size:
+            size *= 2
+
+        self.read_size = min(size, self.max_read_size)
+
     def _get_data(self) -> str:
-        data = os.read(self.fileno, 1024)
+        if len(self._read_buffer) < self.read_size:
+            self._read_buffer = memoryview(bytearray(self.read_size))
+
+        count = self._file.readinto(self._read_buffer[: self.read_size])
 
         # Nothing more to read, stream is closed.
-        if data == b"":
+        if count == 0:
             self._eof = True
             return ""
 
-        return self._stdin_decoder.decode(data)
+        # Non-blocking file descriptor without data.
+        if count is None:
+            return ""
+
+        self._bytes_read += count
+        return self._stdin_decoder.decode(self._read_buffer[:count])
 
     def read_chunk(self) -> StyleAndTextTuples:
         # Content is ready for reading on stdin.
         data = self._get_data()
+        self._lines_read += data.count("\n")
 
-        # Send input data to the parser.
-        for c in data:
-            self._parser.send(c)
+        # Send input data to the tokenizer. (At the end of the input, also
+        # flush the last character which is held back for a possible \b.)
+        return self._tokenizer.feed(data, final=self._eof)
 
-        # Return the tokens from the parser.
-        # (Don't return the last token yet, because the parser should
-        # be able to pop if the input starts with \b).
-        if self._eof:
-            tokens = self._line_tokens[:]
-            del self._line_tokens[:]
-        else:
-            tokens = self._line_tokens[:-1]
-            del self._line_tokens[:-1]
 
-        return tokens
+class FileSource(PipeSource):
+    def __init__(
+        self,
+        filename: str,
+        lexer: Optional[Lexer] = None,
+        read_size: int = 4096,
+        max_read_size: int = 1024 * 1024,
+    ) -> None:
+        self.fp = open(filename, "rb")
 
-    def _parse_corot(self) -> Generator[None, str, None]:
-        """
-        Coroutine that parses the pager input.
-        A \b with any character before should make the next character standout.
-        A \b with an underscore before should make the next character emphasized.
-        """
-        backspace_style = ""  # Style created by backspace characters.
-        line_tokens = self._line_tokens
-        replace_one_token = False
+        super().__init__(
+            self.fp.fileno(),
+            lexer=lexer,
+            name=filename,
+            read_size=read_size,
+            max_read_size=max_read_size,
+        )
+
+    def close(self) -> None:
+        self.fp.close()
+
+
+class MmapFileSource(SeekableSource):
+    """
+    Regular file that is memory mapped. (See :class:`.FileData`.) Only the
+    lines that are requested are decoded and tokenized, so opening a huge file
+    takes constant time and memory.
+    """
+
+    def __init__(
+        self, filename: str, lexer: Optional[Lexer] = None, encoding: str = "utf-8"
+    ) -> None:
+        self.filename = filename
+        self.lexer = lexer
+        self.encoding = encoding
+        self._open()
+
+    def _open(self) -> None:
+        self.fp = open(self.filename, "rb")
+        stat_result = os.fstat(self.fp.fileno())
+        self._size = stat_result.st_size
+        self.file_id = (stat_result.st_dev, stat_result.st_ino)  # (device, inode)
+        self.data = FileData(self.fp.fileno(), self._size)
+
+        # The `Attrs` at positions where a previous read stopped, so that we can
+        # continue tokenizing with the right attributes.
+        self._attrs_at: Dict[int, Attrs] = {}
+        self._index: Optional[LineIndex] = None
+
+        # State for sequential reading through `read_chunk`.
+        self._position = 0
+        self._tokenizer = AnsiTokenizer()
+        self._decoder = getincrementaldecoder(self.encoding)(errors="replace")
+
+    def get_name(self) -> str:
+        return self.filename
+
+    def get_size(self) -> int:
+        return self._size
+
+    def eof(self) -> bool:
+        return self._position >= self._size
+
+    def read_chunk(self) -> StyleAndTextTuples:
+        start = self._position
+        self._position = min(self._size, start + 64 * 1024)
 
+        data = self._decoder.decode(self.data[start : self._position], final=self.eof())
+        return self._tokenizer.feed(data, final=self.eof())
+
+    def get_index(self) -> LineIndex:
+        if self._index is None:
+            self._index = LineIndex(self.data, self._size)
+            self._index.start()
+        return self._index
+
+    def _get_attrs(self, position: int) -> Attrs:
+        "Return the `Attrs` that are active at the start of this line."
+        try:
+            return self._attrs_at[position]
+        except KeyError:
+            pass
+
+        if self._index is not None:
+            attrs = self._index.get_attrs(position)
+            if attrs is not None:
+                return attrs
+
+        return DEFAULT_ATTRS
+
+    def get_line_start(self, position: int) -> int:
+        return self.data.rfind(b"\n", 0, max(0, position)) + 1
+
+    def read_lines(self, position: int, count: int) -> LineRange:
+        if position > self._size:
+            return LineRange([], [], position)
+
+        # Read the bytes of these lines at once. (Not with a `find` per line,
+        # because every access of the data checks the size of the file.)
+        length = 128 * count
         while True:
-            csi = False
-            c = yield
-
-            if c == "\b":
-                # Handle \b escape codes from man pages.
-                if line_tokens:
-                    last_char = line_tokens[-1][1]
-                    line_tokens.pop()
-                    replace_one_token = True
-                    if last_char == "_":
-                        backspace_style = "class:standout2"
-                    else:
-                        backspace_style = "class:standout"
-                continue
-
-            elif c == "\x1b":
-                # Start of color escape sequence.
-                square_bracket = yield
-                if square_bracket == "[":
-                    csi = True
-                else:
-                    continue
-            elif c == "\x9b":
-                csi = True
-
-            if csi:
-                # Got a CSI sequence. Color codes are following.
-                current = ""
-                params = []
-                while True:
-                    char = yield
-                    if char.isdigit():
-                        current += char
-                    else:
-                        params.append(min(int(current or 0), 9999))
-                        if char == ";":
-                            current = ""
-                        elif char == "m":
-                            # Set attributes and token.
-                            self._select_graphic_rendition(
-                                params
-                            )  ### TODO: use inline style.
-                            #### token = ('C', ) + self._attrs
-                            break
-                        else:
-                            # Ignore unsupported sequence.
-                            break
+            data = self.data[position : position + length]
+            if len(data) < length or data.count(b"\n") >= count:
+                break
+            length *= 4
+
+        # Find the start of each line. (`stop` is the end of the input, unless
+        # enough lines were found before it.)
+        stop = position + len(data)
+        positions: List[int] = []
+        end = position
+
+        while len(positions) < count and end <= stop:
+            positions.append(end)
+            newline = data.find(b"\n", end - position)
+            if newline == -1:
+                end = stop + 1
             else:
-                line_tokens.append((self._get_attrs_style() + " " + backspace_style, c))
-                if replace_one_token:
-                    backspace_style = ""
+                end = position + newline + 1
 
-    def _select_graphic_rendition(self, attrs: Sequence[int]) -> None:
-        """
-        Taken a list of graphics attributes and apply changes to Attrs.
-        """
-        # NOTE: This function is almost literally taken from Pymux.
-        #       if something is wrong, please report there as well!
-        #       https://github.com/jonathanslenders/pymux
-        replace: Dict[str, Union[bool, str, None]] = {}
+        if not positions:
+            return LineRange([], [], end)
 
-        if not attrs:
-            attrs = [0]
-        else:
-            attrs = list(attrs[::-1])
-
-        while attrs:
-            attr = attrs.pop()
-
-            if attr in _fg_colors:
-                replace["color"] = _fg_colors[attr]
-            elif attr in _bg_colors:
-                replace["bgcolor"] = _bg_colors[attr]
-            elif attr == 1:
-                replace["bold"] = True
-            elif attr == 3:
-                replace["italic"] = True
-            elif attr == 4:
-                replace["underline"] = True
-            elif attr == 5:
-                replace["blink"] = True
-            elif attr == 6:
-                replace["blink"] = True  # Fast blink.
-            elif attr == 7:
-                replace["reverse"] = True
-            elif attr == 22:
-                replace["bold"] = False
-            elif attr == 23:
-                replace["italic"] = False
-            elif attr == 24:
-                replace["underline"] = False
-            elif attr == 25:
-                replace["blink"] = False
-            elif attr == 27:
-                replace["reverse"] = False
-            elif not attr:
-                replace = {}
-                self._attrs = Attrs(
-                    color=None,
-                    bgcolor=None,
-                    bold=False,
-                    underline=False,
-                    strike=False,
-                    italic=False,
-                    blink=False,
-                    reverse=False,
-                    hidden=False,
-                )
-
-            elif attr in (38, 48):
-                n = attrs.pop()
-
-                # 256 colors.
-                if n == 5:
-                    if attr == 38:
-                        m = attrs.pop()
-                        replace["color"] = _256_colors.get(1024 + m)
-                    elif attr == 48:
-                        m = attrs.pop()
-                        replace["bgcolor"] = _256_colors.get(1024 + m)
-
-                # True colors.
-                if n == 2:
-                    try:
-                        color_str = "%02x%02x%02x" % (
-                            attrs.pop(),
-                            attrs.pop(),
-                            attrs.pop(),
-                        )
-                    except IndexError:
-                        pass
-                    else:
-                        if attr == 38:
-                            replace["color"] = color_str
-                        elif attr == 48:
-                            replace["bgcolor"] = color_str
-
-        self._attrs = self._attrs._replace(**replace)  # type: ignore
-
-    def _get_attrs_style(self) -> str:
-        result = []
-        attrs = self._attrs
-
-        if attrs.color:
-            result.append(" fg:{} ".format(attrs.color))
-        if attrs.bgcolor:
-            result.append(" bg:{} ".format(attrs.bgcolor))
-        if attrs.bold:
-            result.append(" bold ")
-        if attrs.italic:
-            result.append(" italic ")
-        if attrs.underline:
-            result.append(" underline ")
-        if attrs.blink:
-            result.append(" blink ")
-        if attrs.reverse:
-            result.append(" reverse ")
-
-        # Recent versions of Groff (used for man pages) use bold and underline
-        # escape sequences rather then backslash-style escape sequences. Apply
-        # the standout/standout2 styles anyway so that we get colored output.
-        # This way, people don't have to set GROFF_NO_SGR=1.
-        if attrs.bold and not attrs.color:
-            result.append(" class:standout ")
-        if attrs.underline and not attrs.color:
-            result.append(" class:standout2 ")
-
-        return "".join(result)
+        # Decode and tokenize. (Line by line, so that an escape sequence can
+        # never swallow a newline.)
+        text = data[: min(end - 1, stop) - position].decode(self.encoding, "replace")
+        tokenizer = AnsiTokenizer(attrs=self._get_attrs(position))
+        lines = [
+            StyledLine.from_fragments(tokenizer.feed(line, final=True))
+            for line in text.split("\n")
+        ]
 
+        # Remember where we stopped.
+        if len(self._attrs_at) > 64:
+            self._attrs_at.clear()
+        self._attrs_at[end] = tokenizer.attrs
 
-class FileSource(PipeSource):
-    def __init__(self, filename: str, lexer: Optional[Lexer] = None) -> None:
-        self.fp = open(filename, "rb")
+        return LineRange(positions, lines, end)
 
-        super().__init__(self.fp.fileno(), lexer=lexer, name=filename)
+    def read_lines_before(self, position: int, count: int) -> LineRange:
+        start = position
+        found = 0
 
-    def close(self) -> None:
-        self.fp.close()
+        while found < count and start > 0:
+            start = self.data.rfind(b"\n", 0, start - 1) + 1
+            found += 1
+
+        return self.read_lines(start, found)
+
+    def update(self) -> Optional[str]:
+        try:
+            stat_result = os.stat(self.filename)
+        except OSError:
+            return None  # Removed. (A new file could appear later.)
+
+        file_id = (stat_result.st_dev, stat_result.st_ino)
+        size = stat_result.st_size
+
+        if file_id != self.file_id or size < self._size:
+            # Replaced or truncated: start again.
+            self.close()
+            self._open()
+            return "replaced"
+
+        if size > self._size:
+            old_data = self.data
+            self._size = size
+            self.data = FileData(self.fp.fileno(), size)
 
+            if self._index is not None:
+                self._index.grow(self.data, size)
+            old_data.close()
 
-# Mapping of the ANSI color codes to their names.
-_fg_colors = {v: k for k, v in FG_ANSI_COLORS.items()}
-_bg_colors = {v: k for k, v in BG_ANSI_COLORS.items()}
+            # (What was the end of the input is not anymore.)
+            self._attrs_at.clear()
+            return "grown"
 
-# Mapping of the escape codes for 256colors to their 'ffffff' value.
-_256_colors = {}
+        return None
 
-for i, (r, g, b) in enumerate(_256_colors_table.colors):
-    _256_colors[1024 + i] = "%02x%02x%02x" % (r, g, b)
+    def close(self) -> None:
+        if self._index is not None:
+            self._index.stop()
+        self.data.close()
+        self.fp.close()
+
+
+def create_file_source(
+    filename: str,
+    lexer: Optional[Lexer] = None,
+    read_size: int = 4096,
+    max_read_size: int = 1024 * 1024,
+) -> Source:
+    """
+    Open a file. Regular files are memory mapped, for anything else (like named
+    pipes and character devices), we read the input sequentially.
+    """
+    if stat.S_ISREG(os.stat(filename).st_mode):
+        return MmapFileSource(filename, lexer=lexer)
+    else:
+        return FileSource(
+            filename, lexer=lexer, read_size=read_size, max_read_size=max_read_size
+        )
 
 
 class GeneratorSource(Source):
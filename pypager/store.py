@@ -0,0 +1,371 @@
+"""
+Storage for input that can't be read again, like pipes and generators.
+"""
+import os
+import tempfile
+import threading
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import IO, List, Optional, Tuple
+
+from prompt_toolkit.formatted_text import StyleAndTextTuples
+
+from .ansi import StyledLine, StyleTable, default_style_table
+from .source import LineRange
+
+__all__ = [
+    "LineStore",
+]
+
+
+class _Chunk:
+    """
+    Consecutive lines in a :class:`.LineStore`.
+
+    The text of all lines is kept in one string, the styles as runs in arrays.
+    (Only the last chunk grows. Its text is kept as a list of parts, which is
+    joined when needed.)
+
+    A full chunk can be unloaded: the text and the runs are written to a file
+    and loaded again when needed. The line offsets stay in memory.
+    """
+
+    def __init__(self, position: int, line_number: int) -> None:
+        self.position = position
+        self.line_number = line_number
+
+        # Offset of each line, relative to `position`. (Offsets and run ends
+        # are 64-bit: a chunk can hold a line of more than 4 GiB.)
+        self.offsets = array("Q", [0])
+
+        # For each line, the index of its first run.
+        self.line_runs = array("I", [0])
+
+        # End offset (relative to `position`) and style ID of each run.
+        self.run_ends = array("Q")
+        self.run_styles = array("I")
+
+        self._parts: List[str] = []
+        self.size = 0
+
+        # (file offset, size of the text in bytes, number of runs) after the
+        # chunk was written to a file.
+        self._saved: Optional[Tuple[int, int, int]] = None
+        self.loaded = True
+
+    @property
+    def text(self) -> str:
+        self.join()
+        return self._parts[0] if self._parts else ""
+
+    def join(self) -> None:
+        "Join the parts of the text into one string."
+        if len(self._parts) > 1:
+            self._parts[:] = ["".join(self._parts)]
+
+    def add_text(self, text: str, style_id: int) -> None:
+        "Add text (without newlines) to the last line."
+        self._parts.append(text)
+        self.size += len(text)
+
+        # Extend the last run if it has the same style and is on this line.
+        run_count = len(self.run_ends)
+        if run_count > self.line_runs[-1] and self.run_styles[-1] == style_id:
+            self.run_ends[-1] = self.size
+        else:
+            self.run_ends.append(self.size)
+            self.run_styles.append(style_id)
+
+    def add_newline(self) -> None:
+        self._parts.append("\n")
+        self.size += 1
+
+    def add_line(self) -> None:
+        "Start a new line. (After `add_newline`.)"
+        self.offsets.append(self.size)
+        self.line_runs.append(len(self.run_ends))
+
+    def get_memory(self) -> int:
+        "Rough estimate of the memory that the text and runs take."
+        run_size = self.run_ends.itemsize + self.run_styles.itemsize
+        return self.size + run_size * len(self.run_ends)
+
+    def unload(self, file: IO[bytes]) -> None:
+        "Release the text and runs. (Write them to `file` the first time.)"
+        if self._saved is None:
+            data = self.text.encode("utf-8", "surrogatepass")
+            file.seek(0, os.SEEK_END)
+            self._saved = (file.tell(), len(data), len(self.run_ends))
+
+            file.write(data)
+            file.write(self.run_ends.tobytes())
+            file.write(self.run_styles.tobytes())
+
+        self._parts = []
+        self.run_ends = array("Q")
+        self.run_styles = array("I")
+        self.loaded = False
+
+    def load(self, file: IO[bytes]) -> None:
+        "Read the text and runs from `file` again."
+        assert self._saved is not None
+        offset, length, run_count = self._saved
+
+        file.seek(offset)
+        self._parts = [file.read(length).decode("utf-8", "surrogatepass")]
+        self.run_ends.frombytes(file.read(self.run_ends.itemsize * run_count))
+        self.run_styles.frombytes(file.read(self.run_styles.itemsize * run_count))
+        self.loaded = True
+
+    def get_line(self, index: int) -> StyledLine:
+        "Return the line with this index in the chunk."
+        text = self.text
+        start = self.offsets[index]
+
+        if index + 1 < len(self.offsets):
+            end = self.offsets[index + 1] - 1
+            runs_end = self.line_runs[index + 1]
+        else:
+            # (The last line of a full chunk ends with a newline.)
+            end = len(text)
+            if end > start and text[-1] == "\n":
+                end -= 1
+            runs_end = len(self.run_ends)
+
+        runs_start = self.line_runs[index]
+        return StyledLine(
+            text[start:end],
+            array("Q", [e - start for e in self.run_ends[runs_start:runs_end]]),
+            self.run_styles[runs_start:runs_end],
+        )
+
+
+class LineStore:
+    """
+    Append-only storage for lines of styled text. Lines are stored in chunks,
+    so appending takes (amortized) time proportional to the appended data, and
+    looking up a line takes O(log n) time.
+
+    Positions are offsets in the text, like byte offsets in a file: a position
+    that is zero or follows a newline is the start of a line. This way, the
+    store can be used everywhere where a :class:`.SeekableSource` is used.
+
+    The text is stored compactly (see :class:`.StyledLine`): roughly the size
+    of the text itself, plus a few bytes per line and per styled run.
+
+    :param lines_per_chunk: Maximum number of lines in a chunk.
+    :param chunk_size: A new chunk is started after a chunk grows beyond this
+        number of characters.
+    :param style_table: :class:`.StyleTable` for interning the style strings.
+    :param max_memory: When given, the text of the least recently used chunks
+        is moved to an (anonymous) temporary file when the chunks take more
+        than this number of bytes. Only the line offsets stay in memory.
+
+    The text can be read from another thread with `get_text` and `read_lines`.
+    (Everything else should happen in one thread.)
+    """
+
+    def __init__(
+        self,
+        lines_per_chunk: int = 1024,
+        chunk_size: int = 64 * 1024,
+        style_table: Optional[StyleTable] = None,
+        max_memory: Optional[int] = None,
+    ) -> None:
+        self.lines_per_chunk = lines_per_chunk
+        self.chunk_size = chunk_size
+        self.style_table = default_style_table if style_table is None else style_table
+        self.max_memory = max_memory
+
+        # When there is a memory budget: the indexes of the full chunks that
+        # are in memory, least recently used first, with their memory usage.
+        self._loaded: "OrderedDict[int, int]" = OrderedDict()
+        self._loaded_memory = 0
+        self._file: Optional[IO[bytes]] = None
+        self._lock = threading.RLock()
+
+        self._chunks: List[_Chunk] = [_Chunk(0, 0)]
+        self._chunk_positions = array("Q", [0])
+        self._chunk_line_numbers = array("Q", [0])
+
+        #: The size of the text.
+        self.size = 0
+
+        #: The number of lines. (The last one can be incomplete.)
+        self.line_count = 1
+
+    def __repr__(self) -> str:
+        return "LineStore(size=%i, line_count=%i, chunks=%i)" % (
+            self.size,
+            self.line_count,
+            len(self._chunks),
+        )
+
+    def append(self, fragments: StyleAndTextTuples) -> None:
+        "Append text fragments."
+        with self._lock:
+            chunk = self._chunks[-1]
+            get_style_id = self.style_table.get_style_id
+
+            for fragment in fragments:
+                text = fragment[1]
+                style_id = get_style_id(fragment[0])
+
+                if "\n" in text:
+                    for i, part in enumerate(text.split("\n")):
+                        if i > 0:
+                            chunk.add_newline()
+                            self.size += 1
+                            chunk = self._new_line(chunk)
+
+                        if part:
+                            chunk.add_text(part, style_id)
+                            self.size += len(part)
+
+                elif text:
+                    chunk.add_text(text, style_id)
+                    self.size += len(text)
+
+    def _new_line(self, chunk: _Chunk) -> _Chunk:
+        if len(chunk.offsets) >= self.lines_per_chunk or chunk.size >= self.chunk_size:
+            # Join the text of the full chunk, and start a new one.
+            chunk.join()
+            self._add_loaded(len(self._chunks) - 1, chunk)
+
+            chunk = _Chunk(self.size, self.line_count)
+            self._chunks.append(chunk)
+            self._chunk_positions.append(self.size)
+            self._chunk_line_numbers.append(self.line_count)
+        else:
+            chunk.add_line()
+
+        self.line_count += 1
+        return chunk
+
+    def _get_chunk(self, chunk_index: int) -> _Chunk:
+        "Return this chunk, loaded into memory."
+        chunk = self._chunks[chunk_index]
+
+        if chunk_index in self._loaded:
+            self._loaded.move_to_end(chunk_index)
+        elif not chunk.loaded:
+            assert self._file is not None
+            chunk.load(self._file)
+            self._add_loaded(chunk_index, chunk)
+
+        return chunk
+
+    def _add_loaded(self, chunk_index: int, chunk: _Chunk) -> None:
+        """
+        Register a full chunk that is in memory, and unload the least recently
+        used chunks when we're over budget. (Never the one that was added.)
+        """
+        if self.max_memory is None:
+            return
+
+        memory = chunk.get_memory()
+        self._loaded[chunk_index] = memory
+        self._loaded_memory += memory
+
+        while self._loaded_memory > self.max_memory and len(self._loaded) > 1:
+            index, memory = self._loaded.popitem(last=False)
+
+            if self._file is None:
+                self._file = tempfile.TemporaryFile()
+
+            self._chunks[index].unload(self._file)
+            self._loaded_memory -= memory
+
+    def close(self) -> None:
+        "Remove the temporary file."
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def get_text(self, position: int) -> Tuple[int, str]:
+        """
+        Return the position and the text of the chunk that contains `position`.
+        (This can be called from another thread.)
+        """
+        with self._lock:
+            chunk_index, _ = self._find(position)
+            chunk = self._get_chunk(chunk_index)
+            return chunk.position, chunk.text
+
+    def _find(self, position: int) -> Tuple[int, int]:
+        """
+        Return (chunk index, line index in the chunk) for the line that
+        contains `position`.
+        """
+        position = max(0, min(position, self.size))
+        chunk_index = bisect_right(self._chunk_positions, position) - 1
+        chunk = self._chunks[chunk_index]
+        return chunk_index, bisect_right(chunk.offsets, position - chunk.position) - 1
+
+    def get_size(self) -> int:
+        return self.size
+
+    def get_line_start(self, position: int) -> int:
+        chunk_index, line_index = self._find(position)
+        chunk = self._chunks[chunk_index]
+        return chunk.position + chunk.offsets[line_index]
+
+    def get_line_number(self, position: int) -> int:
+        "Return the line number of the line that contains `position`."
+        chunk_index, line_index = self._find(position)
+        return self._chunks[chunk_index].line_number + line_index
+
+    def get_position(self, line_number: int) -> int:
+        """
+        Return the position of the line with this line number. (The last line
+        if the line number is too big.)
+        """
+        line_number = max(0, min(line_number, self.line_count - 1))
+        chunk_index = bisect_right(self._chunk_line_numbers, line_number) - 1
+        chunk = self._chunks[chunk_index]
+        return chunk.position + chunk.offsets[line_number - chunk.line_number]
+
+    def read_lines(self, position: int, count: int) -> LineRange:
+        """
+        Read `count` lines, starting at the line at `position`. (This can be
+        called from another thread, like the syntax highlighter's.)
+        """
+        positions: List[int] = []
+        lines: List[StyledLine] = []
+
+        with self._lock:
+            if position > self.size or count <= 0:
+                return LineRange(positions, lines, position)
+
+            chunk_index, line_index = self._find(position)
+
+            while len(positions) < count and chunk_index < len(self._chunks):
+                chunk = self._get_chunk(chunk_index)
+                end = min(len(chunk.offsets), line_index + count - len(positions))
+
+                for i in range(line_index, end):
+                    positions.append(chunk.position + chunk.offsets[i])
+                    lines.append(chunk.get_line(i))
+
+                chunk_index += 1
+                line_index = 0
+
+            # Position of the next line.
+            line_number = self.get_line_number(positions[0]) + len(positions)
+            if line_number < self.line_count:
+                end_position = self.get_position(line_number)
+            else:
+                end_position = self.size + 1
+
+        return LineRange(positions, lines, end_position)
+
+    def read_lines_before(self, position: int, count: int) -> LineRange:
+        line_number = self.get_line_number(position)
+        start = max(0, line_number - count)
+
+        if start == line_number:
+            return LineRange([], [], position)
+
+        return self.read_lines(self.get_position(start), line_number - start)
@@ -14,6 +14,7 @@ ui_style = {
     "statusbar": "reverse",
     "statusbar cursor-position": "noreverse #ffffff bg:#884400",
     "statusbar key": "bold",
+    "statusbar indexing": "#888888",
     "arg": "reverse #ccaa00",
     "search-toolbar": "bg:#333333 #ffffff",
     "search-toolbar text": "#ffffff",
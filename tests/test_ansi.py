@@ -0,0 +1,112 @@
+from pypager.ansi import AnsiTokenizer, StyledLine, StyleTable, get_plain_text
+
+
+def _tokenize(*blocks):
+    "Feed these blocks to a new tokenizer, and return all the fragments."
+    tokenizer = AnsiTokenizer(StyleTable())
+    result = []
+    for i, block in enumerate(blocks):
+        result.extend(tokenizer.feed(block, final=i == len(blocks) - 1))
+    return result
+
+
+def _get_text(fragments):
+    return "".join(fragment[1] for fragment in fragments)
+
+
+def test_sgr():
+    fragments = _tokenize("a \x1b[1;31mred\x1b[0m b")
+    assert [text for _, text in fragments] == ["a ", "red", " b"]
+
+    style = fragments[1][0]
+    assert "ansired" in style and "bold" in style
+    assert fragments[0][0] == fragments[2][0]
+
+
+def test_other_sequences_are_dropped():
+    # Only SGR sequences are interpreted.
+    fragments = _tokenize("a\x1b[Kb\x1b=c\x9b2Jd\x1b")
+    assert _get_text(fragments) == "abcd"
+    assert len(fragments) == 1
+
+
+def test_sequence_split_over_blocks():
+    fragments = _tokenize("x\x1b[3", "2mgreen\x1b", "[0m!")
+    assert _get_text(fragments) == "xgreen!"
+    green = "".join(text for style, text in fragments if "ansigreen" in style)
+    assert green == "green"
+
+
+def test_plain_blocks():
+    # Blocks without escape sequences, in the style of the sequence before.
+    tokenizer = AnsiTokenizer(StyleTable())
+    assert tokenizer.feed("\x1b[31mred ") == [(tokenizer._style, "red")]
+    assert tokenizer.feed("plain text") == [(tokenizer._style, " plain tex")]
+    assert tokenizer.feed("", final=True) == [(tokenizer._style, "t")]
+    assert "ansired" in tokenizer._style
+
+    # A backspace at the end of the previous block.
+    fragments = _tokenize("a_\b", "bold text\n")
+    assert _get_text(fragments) == "abold text\n"
+    assert [text for _, text in fragments][1:] == ["b", "old text\n"]
+
+
+def test_backspaces():
+    fragments = _tokenize("b\bbo\bol\bld\bd _\bu")
+    assert fragments == [
+        (" class:standout", "bold"),
+        (" ", " "),
+        (" class:standout2", "u"),
+    ]
+
+    # A backspace at the start of the next block applies to the last
+    # character of the previous one.
+    fragments = _tokenize("b\bbo", "\bo")
+    assert _get_text(fragments) == "bo"
+    assert all(style == " class:standout" for style, _ in fragments)
+
+
+def test_style_table():
+    table = StyleTable()
+    tokenizer = AnsiTokenizer(table)
+    first = tokenizer.feed("\x1b[31ma\x1b[0mb" * 100, final=True)
+
+    # Two distinct styles, and the strings are shared.
+    assert len(table) == 2
+    assert first[0][0] is first[2][0]
+
+
+def test_get_plain_text():
+    for data in [
+        "plain text\n",
+        "a \x1b[1;31mred\x1b[0m b\n\x1b[Kc\x9b1md\n",
+        "b\bbo\bol\bld\n_\bu\x1b[4mx\n",
+        "stray \x1b\nescape \x1b[\n",
+    ]:
+        expected = "\n".join(_get_text(_tokenize(line)) for line in data.split("\n"))
+        assert get_plain_text(data) == expected
+
+
+def test_styled_line():
+    table = StyleTable()
+    line = StyledLine.from_fragments([("a", "ab"), ("a", "cd"), ("b", "中文x")], table)
+
+    # Adjacent fragments with the same style are merged.
+    assert line.text == "abcd中文x"
+    assert list(line.run_ends) == [4, 7]
+    assert line.get_fragments(table) == [("a", "abcd"), ("b", "中文x")]
+    assert line.get_fragments(table, 1, 5) == [("a", "bcd"), ("b", "中")]
+    assert line.get_fragments(table, 7) == []
+
+
+def test_styled_line_columns():
+    line = StyledLine.from_fragments([("", "ab中文x")])
+    assert line.width == 7
+    assert not line.simple
+    assert [line.get_column(i) for i in range(6)] == [0, 1, 2, 4, 6, 7]
+    assert [line.get_index(c) for c in range(8)] == [0, 1, 2, 2, 3, 3, 4, 5]
+
+    line = StyledLine.from_fragments([("", "abc")])
+    assert line.simple
+    assert line.get_column(2) == 2
+    assert line.get_index(10) == 3
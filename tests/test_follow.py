@@ -0,0 +1,120 @@
+import asyncio
+import os
+
+import pytest
+from prompt_toolkit.input import create_pipe_input
+from prompt_toolkit.output import DummyOutput
+
+from pypager.follow import FileWatcher, _inotify_watch
+from pypager.pager import Pager
+from pypager.source import MmapFileSource
+
+
+def _has_inotify(path):
+    fd = _inotify_watch(str(path))
+    if fd is None:
+        return False
+    os.close(fd)
+    return True
+
+
+async def _wait_for(calls, count, timeout=5.0):
+    "Wait until the callback has been called `count` times."
+    loop = asyncio.get_event_loop()
+    deadline = loop.time() + timeout
+    while len(calls) < count and loop.time() < deadline:
+        await asyncio.sleep(0.01)
+    return len(calls) >= count
+
+
+def _append(path, data):
+    with open(path, "ab") as f:
+        f.write(data)
+
+
+def test_watch_rotated_file(tmp_path):
+    path = tmp_path / "file.log"
+    path.write_bytes(b"one\n")
+    if not _has_inotify(path):
+        pytest.skip("inotify is not available.")
+
+    async def run():
+        calls = []
+        # (Without polling: changes are seen with inotify.)
+        watcher = FileWatcher(str(path), lambda: calls.append(1), interval=60)
+        watcher.start()
+        try:
+            _append(path, b"two\n")
+            assert await _wait_for(calls, 1)
+
+            # Rotation: the new file is watched.
+            path.rename(tmp_path / "file.log.1")
+            path.write_bytes(b"new\n")
+            assert await _wait_for(calls, 2)
+            await asyncio.sleep(0.1)
+
+            count = len(calls)
+            _append(path, b"more\n")
+            assert await _wait_for(calls, count + 1)
+        finally:
+            watcher.stop()
+
+    asyncio.run(run())
+
+
+def test_watch_without_inotify(tmp_path, monkeypatch):
+    monkeypatch.setattr("pypager.follow._inotify_watch", lambda filename: None)
+    path = tmp_path / "file.log"
+    path.write_bytes(b"one\n")
+
+    async def run():
+        calls = []
+        watcher = FileWatcher(str(path), lambda: calls.append(1), interval=0.05)
+        watcher.start()
+        try:
+            assert await _wait_for(calls, 3)
+        finally:
+            watcher.stop()
+
+        count = len(calls)
+        await asyncio.sleep(0.2)
+        assert len(calls) == count
+
+    asyncio.run(run())
+
+
+def test_follow_truncated_file(tmp_path):
+    # A followed file that is truncated is read and indexed again.
+    path = tmp_path / "file.log"
+    path.write_bytes(b"".join(b"line %i\n" % i for i in range(1000)))
+
+    async def run(pager):
+        task = asyncio.ensure_future(pager.run_async())
+        await asyncio.sleep(0.3)
+        assert "line 999" in pager.current_source_info.buffer.text
+
+        path.write_bytes(b"".join(b"new %i\n" % i for i in range(10)))
+        index = None
+        for _ in range(100):
+            await asyncio.sleep(0.05)
+            index = source.get_index()
+            if index.done and index.line_count == 11:
+                break
+
+        await asyncio.sleep(0.3)
+        pager.application.exit()
+        await task
+        return index
+
+    with create_pipe_input() as input:
+        pager = Pager(input=input, output=DummyOutput(), follow_interval=0.1)
+        source = MmapFileSource(str(path))
+        pager.add_source(source)
+        pager.forward_forever = True
+        index = asyncio.run(run(pager))
+
+        source_info = pager.current_source_info
+        assert index.line_count == 11
+        assert source_info.buffer.text.startswith("new 0\n")
+        assert "new 9" in source_info.buffer.text
+        assert "line" not in source_info.buffer.text
@@ -0,0 +1,233 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+from prompt_toolkit.input import create_pipe_input
+from prompt_toolkit.lexers import PygmentsLexer
+from prompt_toolkit.output import DummyOutput
+from pygments.lexers import DiffLexer, JsonLexer, PythonLexer
+
+from pypager.highlight import (
+    BackgroundLexer,
+    LexerCheckpoints,
+    RenderBudget,
+    _get_tokens_unprocessed,
+    _Job,
+)
+from pypager.pager import Pager
+from pypager.source import MmapFileSource
+from pypager.store import LineStore
+
+PYTHON = '''\
+import os
+
+def f(x: int) -> str:
+    """
+    Docstring.
+    """
+    return "%i" % (x + 1)  # Comment.
+
+class A(object):
+    @property
+    def b(self):
+        return [i ** 2 for i in range(10) if i != 3]
+\t$ ?
+'''
+
+JSON = """\
+{
+  "a": [1, 2.5, -3e10, true, false, null],
+  "b": {"c": "string \\\\ with \\\\"escapes\\\\""},
+  "d": broken
+}
+"""
+
+DIFF = """\
+diff --git a/file.py b/file.py
+index 1234567..89abcde 100644
+--- a/file.py
++++ b/file.py
+@@ -1,3 +1,4 @@
+ unchanged
+-removed
++added
++also added
+\\ No newline at end of file
+"""
+
+
+@pytest.mark.parametrize(
+    "lexer, text",
+    [(PythonLexer(), PYTHON), (JsonLexer(), JSON), (DiffLexer(), DIFF)],
+)
+def test_tokens_like_lexer(lexer, text):
+    positions = []
+    tokens = list(
+        _get_tokens_unprocessed(
+            lexer, text, line_start=lambda pos, stack: positions.append(pos)
+        )
+    )
+    assert tokens == list(lexer.get_tokens_unprocessed(text))
+    assert all(text[pos - 1] == "\n" for pos in positions)
+
+
+class _ClosedContent:
+    def read_lines(self, position, count):
+        raise ValueError("The file was closed.")
+
+
+def test_background_lexer_read_error():
+    # When the lines can't be read, they're not pending anymore.
+    source_info = SimpleNamespace(content=_ClosedContent())
+    lexer = BackgroundLexer(source_info, PygmentsLexer(PythonLexer))
+    lexer._pending = {0, 10}
+    lexer._next_job = _Job(0, 20, ("root",), None, [0, 10])
+
+    loop = asyncio.new_event_loop()
+    try:
+        lexer._run(loop)
+        loop.run_until_complete(asyncio.sleep(0))
+    finally:
+        loop.close()
+
+    assert lexer._pending == set()
+    assert lexer._cache == {}
+
+
+PYTHON_BLOCK = '''\
+def f(x):
+    """
+    A docstring
+    over lines.
+    """
+    return x  # Comment.
+
+'''
+
+
+def _checkpoints(content, lexer, interval=10):
+    "Take checkpoints, many of them, and wait until it's done."
+    checkpoints = LexerCheckpoints(content, lexer)
+    checkpoints.interval = interval
+    checkpoints.chunk_lines = 5 * interval
+    checkpoints.start()
+    while checkpoints.busy:
+        time.sleep(0.01)
+    return checkpoints
+
+
+def test_lexer_checkpoints(tmp_path):
+    text = PYTHON_BLOCK * 100
+    path = tmp_path / "file.py"
+    path.write_text(text)
+    source = MmapFileSource(str(path))
+    lexer = PythonLexer()
+
+    checkpoints = _checkpoints(source, lexer)
+    assert checkpoints.done
+    assert len(checkpoints.positions) > 50
+
+    # Lexing from a checkpoint gives the same tokens as lexing from the start.
+    tokens = list(lexer.get_tokens_unprocessed(text))
+    for position, state in zip(checkpoints.positions, checkpoints.states):
+        assert text[position - 1 : position] in ("", "\n")
+        resumed = [
+            (pos + position, token, value)
+            for pos, token, value in _get_tokens_unprocessed(
+                lexer, text[position:], state
+            )
+        ]
+        assert resumed == [t for t in tokens if t[0] >= position]
+
+    # The checkpoint before a position, and the one after it.
+    position = text.index("over lines", len(text) // 2)
+    checkpoint = checkpoints.get_checkpoint(position)
+    assert checkpoint.position <= position < checkpoint.next_position
+    source.close()
+
+
+def test_lexer_checkpoints_grow():
+    # Checkpoints of a store that grows continue from the last one.
+    store = LineStore()
+    store.append([("", PYTHON_BLOCK * 50)])
+    checkpoints = LexerCheckpoints(store, PythonLexer(), complete=False)
+    checkpoints.interval = 10
+    checkpoints.start()
+    while checkpoints.busy:
+        time.sleep(0.01)
+
+    assert not checkpoints.done
+    size = store.get_size()
+    last = checkpoints.positions[-1]
+    assert 0 < last < size
+
+    store.append([("", PYTHON_BLOCK * 50)])
+    checkpoints.complete = True
+    checkpoints.start()
+    while checkpoints.busy:
+        time.sleep(0.01)
+
+    assert checkpoints.done
+    assert checkpoints.positions[-1] > size
+    assert checkpoints.get_checkpoint(last).position == last
+
+
+def test_background_lexer(tmp_path):
+    # After a jump into a long docstring, its lines are highlighted as a string.
+    # (Lexed from a checkpoint, not from a sync point.)
+    path = tmp_path / "file.py"
+    lines = ["x = 1"] * 1000 + ['"""'] + ["text %i" % i for i in range(3000)]
+    path.write_text("\n".join(lines + ['"""', "y = 2", ""]))
+
+    async def run(pager):
+        task = asyncio.ensure_future(pager.run_async())
+        await asyncio.sleep(0.2)
+        pager.application.input.send_text("3000G")
+
+        source_info = pager.current_source_info
+        lexer = source_info.window.content.lexer.lexer
+        for _ in range(200):
+            await asyncio.sleep(0.05)
+            row = source_info.buffer.document.cursor_position_row
+            cached = lexer._cache.get(source_info.line_positions[row])
+            if cached is not None and cached[2]:
+                break
+
+        pager.application.exit()
+        await task
+        return cached
+
+    with create_pipe_input() as input:
+        pager = Pager(input=input, output=DummyOutput())
+        pager.add_source(MmapFileSource(str(path), lexer=PygmentsLexer(PythonLexer)))
+        text, fragments, exact = asyncio.run(run(pager))
+
+    assert text == "text 1998"
+    assert exact
+    assert all("string" in style for style, _ in fragments)
+
+
+def test_render_budget():
+    budget = RenderBudget()
+    budget.frame_time = 0.05
+    budget.max_overruns = 3
+
+    budget.start_frame()
+    budget.spent += 0.04
+    assert not budget.exceeded
+    assert not budget.end_frame()
+
+    # Frames that go over budget, in a row.
+    for i in range(3):
+        budget.start_frame()
+        budget.spent += 0.06
+        assert budget.exceeded
+        budget.deferred = True
+        assert budget.end_frame()
+        assert budget.exhausted == (i == 2)
+
+    # A frame within budget starts counting again.
+    budget.start_frame()
+    assert not budget.exceeded and not budget.end_frame()
+    assert budget.overruns == 0 and not budget.exhausted
@@ -0,0 +1,77 @@
+import time
+
+from prompt_toolkit.styles import DEFAULT_ATTRS
+
+from pypager.index import LineIndex
+
+LINES = b"".join(b"line %i\n" % i for i in range(1000))
+
+
+def _index(data, interval=100):
+    "Index this data, with many checkpoints, and wait until it's done."
+    index = LineIndex(data, len(data), interval=interval)
+    index.start()
+    while not index.done:
+        time.sleep(0.01)
+    return index
+
+
+def test_not_indexed_yet():
+    index = LineIndex(LINES, len(LINES))
+    assert not index.done
+    assert index.line_count is None
+    assert index.get_position(5) is None
+    assert index.get_line_number(len(LINES)) is None
+
+
+def test_lines():
+    index = _index(LINES)
+    assert index.progress == 1.0
+    assert index.line_count == 1001  # (The last, empty line counts too.)
+
+    for line_number in [0, 1, 5, 99, 500, 999]:
+        position = index.get_position(line_number)
+        assert position == LINES.index(b"line %i\n" % line_number)
+        assert index.get_line_number(position) == line_number
+
+    # Beyond the end: the last line.
+    assert index.get_position(5000) == len(LINES)
+
+
+def test_empty():
+    index = LineIndex(b"", 0)
+    assert index.done
+    assert index.line_count == 0
+    assert index.get_position(3) == 0
+
+
+def test_attrs():
+    data = b"a\n\x1b[31mred\nstill red\x1b[0m\nplain\n" * 50
+    index = _index(data, interval=16)
+
+    red = index.get_attrs(data.index(b"still", 500))
+    assert red is not None and red.color == "ansired"
+    assert index.get_attrs(data.index(b"plain", 500)) == DEFAULT_ATTRS
+    assert index.get_attrs(0) == DEFAULT_ATTRS
+
+
+def test_grow():
+    index = _index(LINES)
+    more = LINES + b"one more\n"
+    index.grow(more, len(more))
+    while not index.done:
+        time.sleep(0.01)
+
+    assert index.line_count == 1002
+    assert index.get_position(1000) == len(LINES)
+
+
+def test_long_lines():
+    # Lines that are longer than the interval between checkpoints.
+    lines = [b"%i " % i * 50 for i in range(100)] + [b"no newline"]
+    data = b"\n".join(lines)
+    index = _index(data, interval=64)
+
+    for line_number in [0, 1, 50, 99, 100, 1000]:
+        position = index.get_position(line_number)
+        assert position == len(b"\n".join(lines[: min(line_number, 100)] + [b""]))
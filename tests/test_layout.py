@@ -0,0 +1,184 @@
+import time
+from types import SimpleNamespace
+
+from prompt_toolkit.document import Document
+from prompt_toolkit.layout.processors import TransformationInput
+from prompt_toolkit.lexers import Lexer
+
+from pypager.ansi import StyledLine
+from pypager.highlight import RenderBudget
+from pypager.layout import (
+    _EscapeProcessor,
+    _LimitedLexer,
+    _LimitedProcessor,
+    _ScrollProcessor,
+    _SliceProcessor,
+)
+
+LONG_LINE = "".join(chr(ord("a") + i % 26) for i in range(100000))
+
+
+def _source_info(lines, horizontal_scroll=0):
+    "Stands in for a `SourceInfo` with these lines in the buffer."
+    positions = []
+    position = 0
+    for line in lines:
+        positions.append(position)
+        position += len(line) + 1
+
+    return SimpleNamespace(
+        line_tokens=[StyledLine.from_fragments([("", line)]) for line in lines],
+        line_positions=positions,
+        generation=0,
+        wrap_lines=False,
+        horizontal_scroll=horizontal_scroll,
+    )
+
+
+def _transform(processor, source_info, lineno, fragments=None, width=80):
+    lines = source_info.line_tokens
+    if fragments is None:
+        fragments = lines[lineno].get_fragments()
+
+    document = Document("\n".join(line.text for line in lines))
+    return processor.apply_transformation(
+        TransformationInput(None, document, lineno, lambda i: i, fragments, width, 24)
+    )
+
+
+def _get_text(transformation):
+    return "".join(fragment[1] for fragment in transformation.fragments)
+
+
+def test_escape_processor_cache():
+    source_info = _source_info(["a\tb", "plain", LONG_LINE])
+    processor = _EscapeProcessor(source_info)
+
+    tabs = _transform(processor, source_info, 0)
+    assert _get_text(tabs) == "a|┈┈b"
+    assert tabs.display_to_source(4) == 2
+    assert _transform(processor, source_info, 0) is tabs
+
+    # Lines are cached by position: inserting lines in the buffer before them
+    # doesn't change that.
+    plain = _transform(processor, source_info, 1)
+    source_info.line_tokens.insert(0, StyledLine.from_fragments([("", "new")]))
+    source_info.line_positions.insert(0, 0)
+    assert _transform(processor, source_info, 2) is plain
+
+    # The visible part of a long line is part of the key.
+    long_line = _transform(processor, source_info, 3)
+    source_info.horizontal_scroll = 1000
+    scrolled = _transform(processor, source_info, 3)
+    assert scrolled is not long_line
+    assert _get_text(scrolled) == LONG_LINE[1000 - 64 : 1000 + 80 + 64]
+    source_info.horizontal_scroll = 0
+    assert _transform(processor, source_info, 3) is long_line
+
+    # The cache is cleared when the lines are read again.
+    source_info.generation += 1
+    assert _transform(processor, source_info, 2) is not plain
+
+
+def test_escape_processor_cache_size():
+    source_info = _source_info(["line %i" % i for i in range(10)])
+    processor = _EscapeProcessor(source_info)
+    processor.max_cache_lines = 5
+
+    first = _transform(processor, source_info, 0)
+    for lineno in range(1, 10):
+        _transform(processor, source_info, lineno)
+
+    assert len(processor._cache) == 5
+    assert _transform(processor, source_info, 0) is not first
+
+
+def test_long_line():
+    # Only the visible part of a long line (and a margin) is processed.
+    source_info = _source_info([LONG_LINE], horizontal_scroll=50000)
+
+    sliced = _transform(_SliceProcessor(source_info), source_info, 0)
+    assert _get_text(sliced) == LONG_LINE[50000 - 64 : 50000 + 80 + 64]
+    assert sliced.display_to_source(0) == 50000 - 64
+    assert sliced.source_to_display(50000) == 64
+
+    # And the columns before the horizontal scroll offset are removed.
+    scrolled = _transform(
+        _ScrollProcessor(source_info), source_info, 0, sliced.fragments
+    )
+    assert _get_text(scrolled) == LONG_LINE[50000 : 50000 + 80 + 64]
+    assert sliced.display_to_source(scrolled.display_to_source(0)) == 50000
+    assert scrolled.source_to_display(1000000) == 79  # (The cursor stays visible.)
+
+
+def test_scroll_wide_characters():
+    # Lines with double width characters are not sliced. When the scroll
+    # offset is halfway a character, the other half is a space.
+    source_info = _source_info(["中文" * 100], horizontal_scroll=5)
+
+    sliced = _transform(_SliceProcessor(source_info), source_info, 0)
+    assert _get_text(sliced) == "中文" * 100
+
+    scrolled = _transform(
+        _ScrollProcessor(source_info), source_info, 0, sliced.fragments
+    )
+    assert _get_text(scrolled) == " " + ("中文" * 100)[3:]
+    assert scrolled.display_to_source(0) == 2
+
+
+class _SlowLexer(Lexer):
+    "Takes `delay` seconds per line."
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def lex_document(self, document):
+        def get_line(lineno):
+            time.sleep(self.delay)
+            return [("class:slow", document.lines[lineno])]
+
+        return get_line
+
+
+def test_limited_lexer():
+    # Over budget, the lines are drawn plain, until the next frame.
+    source_info = _source_info([])
+    source_info.highlighting = True
+    source_info.render_budget = budget = RenderBudget()
+    budget.frame_time = 0.05
+
+    document = Document("\n".join("line %i" % i for i in range(20)))
+    lexer = _LimitedLexer(source_info, _SlowLexer(0.02))
+
+    budget.start_frame()
+    get_line = lexer.lex_document(document)
+    styles = [get_line(i)[0][0] for i in range(20)]
+    assert styles[0] == "class:slow"
+    assert "" in styles and styles[-1] == ""
+    assert budget.deferred and budget.end_frame()
+
+    budget.start_frame()
+    assert lexer.lex_document(document)(19) == [("class:slow", "line 19")]
+
+    # Highlighting turned off.
+    source_info.highlighting = False
+    assert lexer.lex_document(document)(19) == [("", "line 19")]
+
+
+def test_limited_processor():
+    source_info = _source_info(["a\tb"])
+    source_info.render_budget = budget = RenderBudget()
+    processor = _LimitedProcessor(
+        source_info,
+        _EscapeProcessor(source_info),
+        fallback=_SliceProcessor(source_info),
+    )
+
+    budget.start_frame()
+    assert _get_text(_transform(processor, source_info, 0)) == "a|┈┈b"
+    assert not budget.deferred
+
+    # Over budget: the fallback. (No tabs expanded.)
+    budget.spent = budget.frame_time
+    assert _get_text(_transform(processor, source_info, 0)) == "a\tb"
+    assert budget.deferred
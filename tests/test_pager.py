@@ -0,0 +1,263 @@
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+from prompt_toolkit.input import create_pipe_input
+from prompt_toolkit.lexers import Lexer
+from prompt_toolkit.output import DummyOutput
+
+from pypager.pager import Pager
+from pypager.search import MatchIndex
+from pypager.source import MmapFileSource, PipeSource, StringSource
+
+LINES = ["line %i\n" % i for i in range(10000)]
+
+
+def _run(pager, steps, delay=0.3):
+    """
+    Run the pager, and go through the steps: text is typed, functions are
+    called with the pager. (Wait a bit after every step, and until jumps and
+    searches are done, so that the pager catches up.)
+    """
+
+    async def run() -> None:
+        task = asyncio.ensure_future(pager.run_async())
+        await asyncio.sleep(delay)
+
+        for step in steps:
+            if callable(step):
+                step(pager)
+            else:
+                pager.application.input.send_text(step)
+
+            await asyncio.sleep(delay)
+            for _ in range(100):
+                source_info = pager.current_source_info
+                if source_info.pending_jump is None and not source_info.current_search:
+                    break
+                await asyncio.sleep(0.1)
+
+        pager.application.exit()
+        await task
+
+    asyncio.run(run())
+
+
+@pytest.fixture
+def pager():
+    with create_pipe_input() as input:
+        yield Pager(input=input, output=DummyOutput())
+
+
+def _get_top_line(pager):
+    "The text of the line at the cursor."
+    return pager.current_source_info.buffer.document.current_line
+
+
+def _write_lines(path, count):
+    with open(path, "wb") as f:
+        f.write(b"".join(b"line %i\n" % i for i in range(count)))
+
+
+def test_go_to_line(pager, tmp_path):
+    path = tmp_path / "file.txt"
+    _write_lines(path, 2000000)
+    pager.add_source(MmapFileSource(str(path)))
+
+    lines = []
+    _run(
+        pager,
+        [
+            "100G",
+            lambda p: lines.append(_get_top_line(p)),
+            "1500000G",
+            lambda p: lines.append(_get_top_line(p)),
+            "12j",  # (Not part of the next number.)
+            "2000000G",
+            lambda p: lines.append(_get_top_line(p)),
+            "5000000G",  # Past the end: the last line.
+            lambda p: lines.append(_get_top_line(p)),
+            "g",
+            lambda p: lines.append(_get_top_line(p)),
+        ],
+    )
+    assert lines == ["line 99", "line 1499999", "line 1999999", "", "line 0"]
+
+
+def test_search_backwards_with_match_index(pager, tmp_path):
+    # When the match index didn't get to the cursor, a backward search doesn't
+    # stop at the last match in the index.
+    path = tmp_path / "file.txt"
+    with open(path, "wb") as f:
+        f.write(
+            b"".join(b"x %i\n" % i if i in (10, 1500) else b"-\n" for i in range(2000))
+        )
+    pager.add_source(MmapFileSource(str(path)))
+
+    def set_match_index(pager):
+        # (An index that stopped after the first match.)
+        source_info = pager.current_source_info
+        match_index = MatchIndex(
+            source_info.content, pager.get_search_pattern(), max_matches=1
+        )
+        match_index.start()
+        while match_index.busy:
+            time.sleep(0.01)
+        source_info.match_index = match_index
+
+    lines = []
+    _run(
+        pager,
+        [
+            "/x\r",
+            lambda p: lines.append(_get_top_line(p)),
+            set_match_index,
+            "G",
+            "N",
+            lambda p: lines.append(_get_top_line(p)),
+        ],
+    )
+    assert lines == ["x 10", "x 1500"]
+
+
+def test_key_press_cancels_jump(pager, tmp_path, monkeypatch):
+    async def press_key() -> None:
+        pager.application.key_processor.before_key_press.fire()
+
+    # Without sources: no `SourceInfo` is created for the dummy source.
+    with monkeypatch.context() as m:
+        m.setattr("pypager.pager.SourceInfo", None)
+        asyncio.run(press_key())
+    assert pager.source_info == {}
+
+    path = tmp_path / "file.txt"
+    _write_lines(path, 10)
+    pager.add_source(MmapFileSource(str(path)))
+    pager.current_source_info.pending_jump = ("line", 5)
+    asyncio.run(press_key())
+    assert pager.current_source_info.pending_jump is None
+
+
+def _jump(source_info, line_number):
+    "Go to this line, and wait until the index gets there."
+    source_info.go_to_line(line_number)
+    deadline = time.monotonic() + 10
+    while not source_info.resolve_pending_jump() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_window_is_trimmed(pager, tmp_path):
+    path = tmp_path / "file.txt"
+    _write_lines(path, 100000)
+    source_info = pager.add_source(MmapFileSource(str(path)))
+    source_info.max_window_lines = 300
+
+    # (Less than a page at once: the buffer is extended after rendering.)
+    lines = []
+
+    def get_line_number(pager):
+        row = source_info.buffer.document.cursor_position_row
+        lines.append(source_info.get_line_number(row))
+
+    steps = ["50000G"] + ["j" * 30] * 20 + [get_line_number] + ["k" * 30] * 40
+    _run(pager, steps + [get_line_number], delay=0.05)
+
+    # Only a window around the cursor is in the buffer, and the line numbers
+    # of its rows are still right.
+    assert len(source_info.line_positions) <= 300
+    assert lines[0] > 50500 and lines[1] < 49500
+
+    document = source_info.buffer.document
+    for row in [0, document.cursor_position_row, document.line_count - 1]:
+        line_number = source_info.get_line_number(row)
+        assert document.lines[row] == "line %i" % line_number
+
+
+def test_pending_jump_on_pipe(pager):
+    read_fd, write_fd = os.pipe()
+    more_input = threading.Event()
+
+    def write():
+        with open(write_fd, "wb") as f:
+            f.write(b"".join(b"line %i\n" % i for i in range(1000)))
+            f.flush()
+            more_input.wait(10)
+            f.write(b"".join(b"line %i\n" % i for i in range(1000, 10000)))
+
+    thread = threading.Thread(target=write)
+    thread.start()
+    try:
+        with open(read_fd, "rb") as f:
+            pager.add_source(PipeSource(f.fileno()))
+            jumps = []
+
+            def go_to_line(pager):
+                source_info = pager.current_source_info
+                source_info.go_to_line(5000)
+                jumps.append(source_info.pending_jump)
+                more_input.set()
+                pager.application.invalidate()
+
+            lines = []
+            _run(pager, [go_to_line, lambda p: lines.append(_get_top_line(p))])
+    finally:
+        more_input.set()
+        thread.join()
+
+    # The jump waited for the input.
+    assert jumps == [("line", 5000)]
+    assert lines == ["line 5000"]
+
+
+def test_evict_and_restore(tmp_path):
+    path = tmp_path / "file.txt"
+    _write_lines(path, 10000)
+
+    with create_pipe_input() as input:
+        pager = Pager(input=input, output=DummyOutput(), max_buffer_memory=1)
+        file_info = pager.add_source(MmapFileSource(str(path)))
+        _jump(file_info, 1234)
+        file_location = file_info.get_location()
+
+        store_info = pager.add_source(StringSource("".join(LINES)))
+        store_info.add_input([("", "".join(LINES))], final=True)
+        _jump(store_info, 567)
+        store_location = store_info.get_location()
+        assert file_info.evicted_location == file_location
+        assert file_info.buffer.text == ""
+
+        # Switching back reads the lines again, at the same location.
+        pager.focus_previous_source()
+        assert store_info.evicted_location == store_location
+        assert file_info.evicted_location is None
+        assert file_info.get_location() == file_location
+        assert _get_top_line(pager) == "line 1234"
+
+        pager.focus_next_source()
+        assert store_info.get_location() == store_location
+        assert _get_top_line(pager) == "line 567"
+        pager._close()
+
+
+class _SlowLexer(Lexer):
+    def lex_document(self, document):
+        def get_line(lineno):
+            time.sleep(0.02)
+            return [("", document.lines[lineno])]
+
+        return get_line
+
+
+def test_highlighting_turned_off(pager):
+    # When the lexer keeps going over the frame budget, highlighting is turned
+    # off for that source.
+    source_info = pager.add_source(StringSource("".join(LINES), lexer=_SlowLexer()))
+    source_info.render_budget.max_overruns = 3
+
+    # (Every frame that was drawn partly plain is followed by another one.)
+    messages = []
+    _run(pager, [lambda p: messages.append(p.message)], delay=1.0)
+    assert not source_info.highlighting
+    assert messages == ["Highlighting is turned off: the input is too slow"]
@@ -0,0 +1,105 @@
+from pypager.prefetch import PrefetchBudget, PrefetchPolicy
+
+
+class _SourceInfo:
+    "Stands in for a `SourceInfo`: `lines` lines of `line_size` are read ahead."
+
+    def __init__(self, name, lines=0, line_size=100):
+        self.source = name
+        self.lines = lines
+        self.line_size = line_size
+
+    def get_read_ahead(self, row):
+        return self.lines, self.lines * self.line_size
+
+
+def test_pages_ahead():
+    policy = PrefetchPolicy(pages_ahead=2)
+
+    # The displayed source is read up to two pages ahead.
+    assert policy.get_lines_wanted(_SourceInfo("a"), 0, 50, True, False) == 100
+    assert policy.get_lines_wanted(_SourceInfo("a", 30), 0, 50, True, False) == 70
+    assert policy.get_lines_wanted(_SourceInfo("a", 300), 0, 50, True, False) == 0
+
+    # Other sources aren't read while the user is active.
+    assert policy.get_lines_wanted(_SourceInfo("b"), 0, 50, False, False) == 0
+
+    # Idle, but without a budget: nothing extra.
+    assert policy.get_lines_wanted(_SourceInfo("a"), 0, 50, True, True) == 100
+
+
+def test_idle_read_ahead():
+    policy = PrefetchPolicy(pages_ahead=2, idle_pages_ahead=10, background_pages=3)
+    budget = policy.create_budget()
+
+    assert policy.get_lines_wanted(_SourceInfo("a"), 0, 50, True, True, budget) == 600
+    assert policy.get_lines_wanted(_SourceInfo("b"), 0, 50, False, True, budget) == 150
+
+    # Charged for the extra lines, at their estimated size.
+    size = policy.line_size_estimate
+    assert budget.charges == {"a": (500 * size, 0.0), "b": (150 * size, 0.0)}
+    assert budget.memory == 650 * size
+
+
+def test_memory_budget():
+    # The budget is shared: what the first source uses, the second can't.
+    policy = PrefetchPolicy(pages_ahead=1, idle_pages_ahead=10, max_read_ahead=30000)
+    budget = policy.create_budget()
+    a = _SourceInfo("a", lines=10, line_size=100)
+    b = _SourceInfo("b", lines=10, line_size=100)
+
+    assert policy.get_lines_wanted(a, 0, 10, True, True, budget) == 100
+    assert budget.memory_left == 30000 - 100 * 100
+    assert policy.get_lines_wanted(b, 0, 10, False, True, budget) == 10
+    assert budget.memory_left == 19000
+
+    # What was read ahead before is charged at the start of the next round.
+    budget.start_round(1.0)
+    budget.charge("a", memory=25000)
+    assert policy.get_lines_wanted(b, 0, 10, False, True, budget) == 10
+    assert budget.charges["b"] == (1000, 0.0)
+    assert budget.memory_left == 4000
+
+    budget.charge("a", memory=10000)
+    assert budget.memory_left == 0
+    assert policy.get_lines_wanted(b, 0, 10, False, True, budget) == 0
+
+    # Still the pages ahead for the displayed source.
+    assert policy.get_lines_wanted(_SourceInfo("c"), 0, 10, True, True, budget) == 10
+
+
+def test_read_time_budget():
+    policy = PrefetchPolicy(pages_ahead=1, idle_pages_ahead=10, max_read_time=0.25)
+    budget = policy.create_budget()
+    budget.charge("a", read_time=0.5)
+    assert not budget.has_read_time
+
+    # No extra lines until the read time is paid back.
+    assert policy.get_lines_wanted(_SourceInfo("a"), 0, 10, True, True, budget) == 10
+
+    budget.start_round(1.0)
+    assert budget.read_time == 0.25
+    assert policy.get_lines_wanted(_SourceInfo("a"), 0, 10, True, True, budget) == 10
+
+    budget.start_round(1.0)
+    assert budget.has_read_time
+    assert policy.get_lines_wanted(_SourceInfo("a"), 0, 10, True, True, budget) == 110
+
+
+def test_budget_round():
+    budget = PrefetchBudget(max_memory=1000, max_read_time=0.5)
+    budget.charge("a", memory=600, read_time=0.1)
+    budget.charge("a", memory=100)
+    budget.charge("b", memory=500, read_time=0.2)
+
+    assert budget.charges == {"a": (700, 0.1), "b": (500, 0.2)}
+    assert budget.memory_left == 0
+    assert abs(budget.read_time - 0.3) < 1e-9
+
+    budget.start_round(0.2)
+    assert budget.charges == {}
+    assert budget.memory_left == 1000
+    assert abs(budget.read_time - 0.2) < 1e-9
+
+    budget.start_round(10.0)
+    assert budget.read_time == 0.0
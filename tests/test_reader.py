@@ -0,0 +1,152 @@
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+from pypager.reader import AsyncSourceReader, ThreadedSourceReader
+from pypager.source import GeneratorSource, PipeSource
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture
+def pipe():
+    "A pipe: (read end, write end)."
+    read_fd, write_fd = os.pipe()
+    yield read_fd, write_fd
+    for fd in (read_fd, write_fd):
+        try:
+            os.close(fd)
+        except OSError:
+            pass
+
+
+LINE = b"\x1b[31mline\x1b[0m\n"
+
+
+def _fill(write_fd):
+    "Write lines to the pipe until it's full. Return the number of bytes."
+    os.set_blocking(write_fd, False)
+    written = 0
+    try:
+        while True:
+            written += os.write(write_fd, LINE * 1024)
+    except BlockingIOError:
+        return written
+
+
+def test_async_read_limit(loop, pipe):
+    # One callback never reads more than `max_read_size` bytes, however many
+    # lines are requested.
+    read_fd, write_fd = pipe
+    written = _fill(write_fd)
+
+    source = PipeSource(read_fd, read_size=4096, max_read_size=1024 * 1024)
+    reader = AsyncSourceReader(source, lambda: None, loop=loop, max_read_size=8192)
+    reader.request(1000000)
+
+    sizes = []
+    while source._bytes_read < written:
+        before = source._bytes_read
+        reader._read()
+        sizes.append(source._bytes_read - before)
+
+    assert max(sizes) == 8192
+    assert len(reader.receive()) == len(sizes)
+    reader.stop()
+
+
+def _wait(condition, timeout=5.0):
+    "Wait until `condition()` is true."
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def _count_lines(chunks):
+    return sum(text.count("\n") for tokens, _ in chunks for _, text in tokens)
+
+
+def test_async_credits(loop, pipe):
+    # With a small request, we read one small block, and stop watching the pipe.
+    read_fd, write_fd = pipe
+    written = _fill(write_fd)
+    wakeups = []
+
+    source = PipeSource(read_fd, read_size=1024)
+    reader = AsyncSourceReader(source, lambda: wakeups.append(1), loop=loop)
+    reader.request(10)
+    loop.run_until_complete(asyncio.sleep(0.1))
+
+    assert source._bytes_read <= 2048
+    assert not reader.busy and not reader._watching
+    assert wakeups == [1]
+
+    lines = _count_lines(reader.receive())
+    assert 10 <= lines <= 2048 // len(LINE)
+
+    # More lines: read until we have them. (Not the whole pipe.)
+    reader.request(500)
+    loop.run_until_complete(asyncio.sleep(0.1))
+    lines += _count_lines(reader.receive())
+    assert 500 <= lines < written // len(LINE)
+    assert wakeups == [1, 1]
+
+    # All of it, until the end of the input.
+    os.close(write_fd)
+    reader.request(1000000)
+    loop.run_until_complete(asyncio.sleep(0.1))
+    chunks = reader.receive()
+    assert chunks[-1][1]  # (Final.)
+    assert lines + _count_lines(chunks) == written // len(LINE)
+    reader.stop()
+    assert os.get_blocking(read_fd)
+
+
+def test_threaded_backpressure():
+    produced = []
+
+    def generate():
+        for i in range(10000):
+            produced.append(i)
+            yield [("", "line %i\n" % i)]
+
+    wakeup = threading.Event()
+    reader = ThreadedSourceReader(
+        GeneratorSource(generate()), wakeup.set, max_queue_size=100
+    )
+
+    # Only the requested lines are read.
+    reader.request(5)
+    _wait(lambda: not reader.busy)
+    time.sleep(0.1)
+    assert len(produced) == 5
+    assert wakeup.is_set()
+
+    wakeup.clear()
+    assert _count_lines(reader.receive()) == 5
+
+    # When the queue is full, the reader waits until we receive.
+    reader.request(300)
+    _wait(lambda: reader._queue_size >= 100)
+    count = len(produced)
+    time.sleep(0.2)
+    assert len(produced) == count < 30
+    assert reader.busy
+
+    lines = 0
+    while lines < 300:
+        _wait(wakeup.is_set)
+        wakeup.clear()
+        lines += _count_lines(reader.receive())
+
+    assert lines == 300
+    assert len(produced) == 305
+    reader.stop()
@@ -0,0 +1,300 @@
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+
+import pytest
+
+from pypager.ansi import AnsiTokenizer
+from pypager.search import (
+    FilterView,
+    MatchIndex,
+    Search,
+    compile_filter_pattern,
+    compile_search_pattern,
+)
+from pypager.source import MmapFileSource
+from pypager.store import LineStore
+
+TEXT = (
+    "first line\n"
+    "foo \x1b[31mERROR\x1b[0m here\n"
+    "caf\xe9 au lait\n"
+    "man page: b\bbo\bol\bld\n"
+    "last line\n"
+)
+
+
+@pytest.fixture(params=["file", "store"])
+def content(request, tmp_path):
+    "The same input, as a file and as a line store."
+    if request.param == "file":
+        path = tmp_path / "input.txt"
+        path.write_bytes(TEXT.encode("utf-8"))
+        source = MmapFileSource(str(path))
+        yield source
+        source.close()
+    else:
+        store = LineStore(lines_per_chunk=2)
+        store.append(AnsiTokenizer().feed(TEXT, final=True))
+        yield store
+
+
+def _search(content, pattern, start=0, **kwargs):
+    "Search, and return the text of the line with the match."
+    search = Search(content, pattern, start, lambda search: None, **kwargs)
+    search.start()
+    search._thread.join()
+
+    if search.match is None:
+        return None
+    line_start = content.get_line_start(search.match)
+    return content.read_lines(line_start, 1).lines[0].text
+
+
+def _scan(scanner):
+    "Run the scanning thread of a filter view or match index until it's done."
+    scanner.start()
+    while scanner.busy:
+        time.sleep(0.01)
+    return scanner
+
+
+def _get_lines(view):
+    return [line.text for line in view.read_lines(0, 100).lines]
+
+
+def test_search_displayed_text(content):
+    # Text that is split by escape sequences is found, text in the escape
+    # sequences is not.
+    assert _search(content, compile_search_pattern("foo ERROR")) == "foo ERROR here"
+    assert _search(content, compile_search_pattern("31m")) is None
+    assert _search(content, compile_search_pattern("bold")) == "man page: bold"
+
+
+def test_search_non_ascii(content):
+    assert _search(content, compile_search_pattern("CAFÉ", True)) == "café au lait"
+    assert _search(content, compile_filter_pattern("f. au")) == "café au lait"
+    assert _search(content, compile_filter_pattern("[é]")) == "café au lait"
+
+
+def test_search_direction(content):
+    pattern = compile_search_pattern("line")
+    end = content.get_size()
+    assert _search(content, pattern) == "first line"
+    assert _search(content, pattern, start=len("first line\n")) == "last line"
+    assert _search(content, pattern, start=end, backwards=True) == "last line"
+
+    start = content.get_line_start(end - 1)
+    assert _search(content, pattern, start=start, backwards=True) == "first line"
+
+
+def test_search_with_filter(content):
+    pattern = compile_search_pattern("a")
+    filter_pattern = compile_filter_pattern("^[lm]")
+    found = _search(content, pattern, filter_pattern=filter_pattern)
+    assert found == "man page: bold"
+
+
+def _search_all(source, pattern, backwards=False, executor=None):
+    "Search again and again, from match to match. Return all matches."
+    matches = []
+    position = source.get_size() if backwards else 0
+
+    while True:
+        search = Search(
+            source,
+            pattern,
+            position,
+            lambda search: None,
+            backwards=backwards,
+            executor=executor,
+        )
+        search.range_size = 1000
+        search.start()
+        search._thread.join()
+
+        if search.match is None:
+            return matches
+        matches.append(search.match)
+
+        position = source.get_line_start(search.match)
+        if not backwards:
+            position = source.read_lines(position, 1).end
+
+
+@pytest.fixture
+def big_file(tmp_path):
+    "A file of several ranges, with matches in most of them."
+    path = tmp_path / "input.txt"
+    path.write_bytes(
+        b"".join(
+            b"line %i%s\n" % (i, b" \x1b[1mthe END\x1b[0m" if i % 97 == 0 else b"")
+            for i in range(2000)
+        )
+    )
+    source = MmapFileSource(str(path))
+    yield source
+    source.close()
+
+
+def test_search_file_in_parallel(big_file):
+    # The same matches as in one thread, in both directions.
+    pattern = compile_search_pattern("the end", True)
+    expected = _search_all(big_file, pattern)
+    assert len(expected) == 21
+
+    with ProcessPoolExecutor(2, mp_context=get_context("spawn")) as executor:
+        assert _search_all(big_file, pattern, executor=executor) == expected
+
+    with ThreadPoolExecutor(3) as executor:
+        assert _search_all(big_file, pattern, executor=executor) == expected
+        assert _search_all(big_file, pattern, True, executor) == expected[::-1]
+
+
+def test_match_index_in_parallel(big_file):
+    pattern = compile_search_pattern("the end", True)
+    expected = _search_all(big_file, pattern)
+
+    with ThreadPoolExecutor(3) as executor:
+        match_index = MatchIndex(big_file, pattern, executor=executor)
+        match_index.range_size = 1000
+        assert list(_scan(match_index).positions) == expected
+        assert match_index.done
+
+
+def test_search_fills_match_index(big_file):
+    # The ranges that a parallel search went through are added to the match
+    # index, when they follow the part that it has scanned. Like the pager, we
+    # look in the index first, and search from where it stopped.
+    pattern = compile_search_pattern("the end", True)
+    expected = _search_all(big_file, pattern)
+    match_index = MatchIndex(big_file, pattern)
+    found = []
+    searches = 0
+
+    with ThreadPoolExecutor(3) as executor:
+        while len(found) < 10:
+            position = found[-1] + 1 if found else 0
+            match = match_index.find_next(position)
+
+            if match is None:
+                search = Search(
+                    big_file,
+                    pattern,
+                    match_index.position,
+                    lambda search: None,
+                    executor=executor,
+                    match_index=match_index,
+                )
+                search.range_size = 1000
+                search.start()
+                search._thread.join()
+                match = search.match
+                searches += 1
+
+            found.append(match)
+            assert list(match_index.positions) == expected[: match_index.count]
+
+    assert found == expected[:10]
+    assert searches < 10
+    assert list(_scan(match_index).positions) == expected
+
+
+def test_search_growing_file(tmp_path):
+    # The file is mapped again while it's searched. The search continues with
+    # the new data.
+    path = tmp_path / "input.txt"
+    path.write_bytes(b"line\n" * 100000 + b"match\n")
+    source = MmapFileSource(str(path))
+    finished = threading.Event()
+
+    search = Search(
+        source, compile_search_pattern("match"), 0, lambda s: finished.set()
+    )
+    search.block_size = 64
+    search.start()
+
+    with open(path, "ab") as f:
+        f.write(b"more\n")
+    assert source.update() == "grown"
+
+    assert finished.wait(10)
+    assert search.match == 500000
+    source.close()
+
+
+def test_search_closed_file(tmp_path):
+    # When the file is closed, the search finishes without a match.
+    path = tmp_path / "input.txt"
+    path.write_bytes(b"line\n" * 100000 + b"match\n")
+    source = MmapFileSource(str(path))
+    finished = threading.Event()
+
+    search = Search(
+        source, compile_search_pattern("match"), 0, lambda s: finished.set()
+    )
+    search.block_size = 64
+    search.start()
+    source.close()
+
+    assert finished.wait(10)
+    assert search.match in (None, 500000)
+
+
+def test_filter_view(content):
+    view = _scan(FilterView(content, compile_filter_pattern("^[fm]")))
+    assert view.done
+    assert _get_lines(view) == ["first line", "foo ERROR here", "man page: bold"]
+
+    view = _scan(FilterView(content, compile_filter_pattern("o E|bold|31m")))
+    assert _get_lines(view) == ["foo ERROR here", "man page: bold"]
+
+
+def test_filter_view_non_ascii(content):
+    # (These patterns can't be compiled as bytes.)
+    view = _scan(FilterView(content, compile_filter_pattern("[\xe9-\xff] ")))
+    assert _get_lines(view) == ["caf\xe9 au lait"]
+
+    view = _scan(FilterView(content, compile_filter_pattern("\\N{BULLET}")))
+    assert view.count == 0
+
+    view = _scan(FilterView(content, compile_filter_pattern("^caf. ")))
+    assert _get_lines(view) == ["caf\xe9 au lait"]
+
+
+def test_match_index(content):
+    match_index = _scan(MatchIndex(content, compile_search_pattern("o")))
+    assert match_index.done
+    assert match_index.count == 3
+
+    # Matches that are split by escape sequences are counted, matches in the
+    # escape sequences are not.
+    match_index = _scan(MatchIndex(content, compile_search_pattern("o ERROR")))
+    assert match_index.count == 1
+    match_index = _scan(MatchIndex(content, compile_search_pattern("[31m")))
+    assert match_index.count == 0
+
+
+def test_match_index_lookup(content):
+    match_index = _scan(MatchIndex(content, compile_search_pattern("l")))
+    second_line = len("first line\n")
+    last_line = content.get_line_start(content.get_size() - 1)
+
+    assert match_index.find_next(0) == 6
+    assert match_index.find_previous(6) is None
+    assert match_index.get_match_number(0, second_line) == 1
+    assert match_index.get_match_number(second_line, second_line + 5) is None
+    assert match_index.find_next(second_line) < last_line
+    assert match_index.find_previous(content.get_size()) >= last_line
+
+
+def test_match_index_with_filter(content):
+    match_index = _scan(
+        MatchIndex(
+            content,
+            compile_search_pattern("a"),
+            filter_pattern=compile_filter_pattern("^[lm]"),
+        )
+    )
+    assert match_index.count == 3
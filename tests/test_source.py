@@ -0,0 +1,75 @@
+import os
+import time
+
+from pypager.search import Search, _search_file_range, compile_search_pattern
+from pypager.source import MmapFileSource
+
+
+def _write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def test_read_truncated_file(tmp_path):
+    # Reading a memory map beyond the end of a truncated file raises SIGBUS.
+    # The source should read the remaining part of the file instead.
+    path = tmp_path / "file.txt"
+    _write(path, b"".join(b"line %i\n" % i for i in range(100000)))
+
+    source = MmapFileSource(str(path))
+    index = source.get_index()
+    while not index.done:
+        time.sleep(0.01)
+    assert source.read_lines(0, 2).lines[1].text == "line 1"
+
+    with open(path, "r+b") as f:
+        f.truncate(100)
+
+    line_range = source.read_lines(500000, 3)
+    assert len(line_range.lines) == len(line_range.positions)
+    assert source.read_lines(0, 2).lines[1].text == "line 1"
+    assert source.get_line_start(600000) <= 100
+    index.get_position(50000)
+
+    search = Search(source, compile_search_pattern("line 99999"), 0, lambda s: None)
+    search.start()
+    search._thread.join()
+    assert search.match is None
+    assert (
+        _search_file_range(str(path), source.file_id, "utf-8", 0, 600000, "line 99", 0)
+        == []
+    )
+
+    assert source.update() == "replaced"
+    assert source.get_size() == 100
+    source.close()
+
+
+def test_update(tmp_path):
+    path = tmp_path / "file.txt"
+    _write(path, b"one\ntwo\n")
+
+    source = MmapFileSource(str(path))
+    index = source.get_index()
+    assert source.update() is None
+
+    with open(path, "ab") as f:
+        f.write(b"three\n")
+    assert source.update() == "grown"
+    assert source.get_size() == 14
+    assert source.read_lines(8, 1).lines[0].text == "three"
+    while not index.done:
+        time.sleep(0.01)
+    assert source.get_index() is index
+    assert index.get_position(2) == 8
+
+    # Log rotation: the file is moved away, and a new one appears.
+    path.rename(tmp_path / "file.txt.1")
+    _write(path, b"new\n")
+    assert source.update() == "replaced"
+    assert source.get_size() == 4
+    assert source.read_lines(0, 1).lines[0].text == "new"
+
+    os.remove(path)
+    assert source.update() is None
+    source.close()
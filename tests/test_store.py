@@ -0,0 +1,119 @@
+from pypager.ansi import AnsiTokenizer, StyleTable
+from pypager.store import LineStore, _Chunk
+
+LINES = ["line %i" % i for i in range(100)]
+
+
+def _fill(store, text, block_size=7):
+    "Append this text in small blocks, so that lines are split over blocks."
+    tokenizer = AnsiTokenizer(store.style_table)
+    for i in range(0, len(text), block_size):
+        block = text[i : i + block_size]
+        store.append(tokenizer.feed(block, final=i + block_size >= len(text)))
+
+
+def _get_text(line_range):
+    return [line.text for line in line_range.lines]
+
+
+def test_read_lines():
+    store = LineStore(lines_per_chunk=8)
+    text = "".join(line + "\n" for line in LINES)
+    _fill(store, text)
+
+    assert store.get_size() == len(text)
+    assert store.line_count == 101
+
+    line_range = store.read_lines(0, 200)
+    assert _get_text(line_range) == LINES + [""]
+    assert line_range.positions[5] == text.index("line 5\n")
+    assert line_range.end == len(text) + 1
+
+    position = text.index("line 50\n")
+    line_range = store.read_lines(position + 3, 3)
+    assert _get_text(line_range) == ["line 50", "line 51", "line 52"]
+    assert line_range.end == text.index("line 53\n")
+
+    line_range = store.read_lines_before(position, 2)
+    assert _get_text(line_range) == ["line 48", "line 49"]
+    assert line_range.end == position
+
+    assert store.get_line_start(position + 3) == position
+    assert store.get_line_number(position) == 50
+    assert store.get_position(50) == position
+    assert store.get_position(1000) == len(text)
+
+
+def test_incomplete_last_line():
+    store = LineStore()
+    store.append([("", "one\ntw")])
+    assert _get_text(store.read_lines(0, 10)) == ["one", "tw"]
+
+    store.append([("", "o\nthree")])
+    assert _get_text(store.read_lines(0, 10)) == ["one", "two", "three"]
+
+
+def test_styles():
+    style_table = StyleTable()
+    store = LineStore(lines_per_chunk=2, style_table=style_table)
+    _fill(store, "a \x1b[31mred\nstill red\x1b[0m b\n" * 3)
+
+    lines = store.read_lines(0, 10).lines
+    assert [line.text for line in lines[:2]] == ["a red", "still red b"]
+
+    fragments = lines[2].get_fragments(style_table)
+    assert [text for _, text in fragments] == ["a ", "red"]
+    assert "ansired" in fragments[1][0]
+
+    fragments = lines[3].get_fragments(style_table)
+    assert [text for _, text in fragments] == ["still red", " b"]
+    assert "ansired" in fragments[0][0]
+    assert "ansired" not in fragments[1][0]
+
+
+def test_get_text():
+    store = LineStore(lines_per_chunk=8)
+    text = "".join(line + "\n" for line in LINES)
+    _fill(store, text)
+
+    position, chunk_text = store.get_text(text.index("line 50\n"))
+    assert text[position : position + len(chunk_text)] == chunk_text
+    assert "line 50\n" in chunk_text
+
+
+def test_spill_to_file():
+    # With a memory budget, older chunks are moved to a temporary file and
+    # loaded again when they're read.
+    store = LineStore(lines_per_chunk=8, max_memory=200)
+    text = "".join(line + " \x1b[1mbold\x1b[0m\n" for line in LINES)
+    _fill(store, text)
+
+    assert store._file is not None
+    assert not store._chunks[0].loaded
+    assert store._loaded_memory <= 200 or len(store._loaded) == 1
+
+    expected = [line + " bold" for line in LINES] + [""]
+    assert _get_text(store.read_lines(0, 200)) == expected
+    assert _get_text(store.read_lines(0, 200)) == expected
+
+    line = store.read_lines(store.get_position(3), 1).lines[0]
+    fragments = line.get_fragments(store.style_table)
+    assert [text for _, text in fragments] == ["line 3 ", "bold"]
+    assert "bold" in fragments[1][0]
+
+    position, chunk_text = store.get_text(0)
+    assert chunk_text.startswith("line 0 bold\n")
+
+    store.close()
+    assert store._file is None
+
+
+def test_chunk_past_4_gib():
+    chunk = _Chunk(0, 0)
+    chunk.size = 2**32  # (As if a line of 4 GiB was added.)
+    chunk.add_newline()
+    chunk.add_line()
+    chunk.add_text("x", 1)
+
+    assert chunk.offsets[-1] == 2**32 + 1
+    assert chunk.run_ends[-1] == 2**32 + 2